@@ -12,21 +12,74 @@
 #    under the License.
 #
 
+import collections
+
 import netaddr
 
 from neutron_lib import constants as const
 from oslo_config import cfg
+from oslo_log import log
 
+from neutron.db import securitygroups_db as sg_db
 
+from networking_ovn._i18n import _, _LW
 from networking_ovn.common import config
 from networking_ovn.common import constants as ovn_const
 from networking_ovn.common import utils
 
+LOG = log.getLogger(__name__)
+
+# ACL columns set by the driver, used to build the canonical form of an ACL.
+ACL_KEY_COLUMNS = ('action', 'direction', 'log', 'match', 'priority')
+
+# The columns of a security group rule its ACL match is built from.
+SG_RULE_MATCH_COLUMNS = ('direction', 'ethertype', 'remote_ip_prefix',
+                         'remote_group_id', 'protocol', 'port_range_min',
+                         'port_range_max')
+
+# Number of ports whose ACLs are updated in a single transaction when a
+# security group rule is added or deleted.
+SG_RULE_FANOUT_CHUNK_SIZE = 500
+
+# Number of times the chunks of ports whose ACLs failed to be updated are
+# retried.
+SG_RULE_FANOUT_RETRIES = 2
+
+# TCP and UDP ports matched by the rules whose port range only has a lower
+# or an upper bound.
+MIN_PORT = 0
+MAX_PORT = 65535
+
+# OVN names of the protocols whose rules may have their port ranges merged.
+PORT_RANGE_PROTOCOLS = {'tcp': 'tcp',
+                        'udp': 'udp',
+                        str(const.PROTO_NUM_TCP): 'tcp',
+                        str(const.PROTO_NUM_UDP): 'udp'}
+
+# Maximum number of security group rules whose match is cached.
+SG_RULE_MATCH_CACHE_SIZE = 10000
+
+# The cached matched columns and match of the security group rules, by rule
+# id, see _get_sg_rule_match.
+_sg_rule_matches = {}
+
 
 def is_sg_enabled():
     return cfg.CONF.SECURITYGROUP.enable_security_group
 
 
+def acl_key(acl):
+    """Return the canonical, hashable form of an ACL dictionary.
+
+    Only the ACL columns set by the driver and the external_ids are part of
+    the key, so ACL values built by this module and ACLs read back from the
+    OVN NB database compare equal.
+    """
+    external_ids = acl.get('external_ids') or {}
+    return (tuple(acl.get(column) for column in ACL_KEY_COLUMNS) +
+            (tuple(sorted(external_ids.items())),))
+
+
 def acl_direction(r, port):
     if r['direction'] == 'ingress':
         portdir = 'outport'
@@ -35,6 +88,14 @@ def acl_direction(r, port):
     return '%s == "%s"' % (portdir, port['id'])
 
 
+def acl_port_group_direction(r, port_group):
+    if r['direction'] == 'ingress':
+        portdir = 'outport'
+    else:
+        portdir = 'inport'
+    return '%s == @%s' % (portdir, port_group)
+
+
 def acl_ethertype(r):
     match = ''
     ip_version = None
@@ -119,6 +180,21 @@ def drop_all_ip_traffic_for_port(port):
     return acl_list
 
 
+def drop_all_ip_traffic_for_port_group():
+    acl_list = []
+    for direction, p in (('from-lport', 'inport'),
+                         ('to-lport', 'outport')):
+        acl = {"priority": ovn_const.ACL_PRIORITY_DROP,
+               "action": ovn_const.ACL_ACTION_DROP,
+               "log": False,
+               "direction": direction,
+               "match": '%s == @%s && ip' % (
+                   p, ovn_const.OVN_DROP_PORT_GROUP_NAME),
+               "external_ids": {}}
+        acl_list.append(acl)
+    return acl_list
+
+
 def add_sg_rule_acl_for_port(port, r, match):
     dir_map = {
         'ingress': 'to-lport',
@@ -178,16 +254,33 @@ def _get_subnet_from_cache(plugin, admin_context, subnet_cache, subnet_id):
         return subnet
 
 
-def _get_sg_ports_from_cache(plugin, admin_context, sg_ports_cache, sg_id):
+def _get_sg_port_id_chunks(admin_context, sg_ports_cache, sg_id):
+    """Yield the sorted ids of the ports of a security group by chunks
+
+    The port ids missing from the cache are read from the security group
+    bindings one chunk at a time.
+    """
     if sg_id in sg_ports_cache:
-        return sg_ports_cache[sg_id]
-    else:
-        filters = {'security_group_id': [sg_id]}
-        sg_ports = plugin._get_port_security_group_bindings(
-            admin_context, filters)
-        if sg_ports:
-            sg_ports_cache[sg_id] = sg_ports
-        return sg_ports
+        port_ids = sorted(set(binding['port_id']
+                              for binding in sg_ports_cache[sg_id]))
+        for i in range(0, len(port_ids), SG_RULE_FANOUT_CHUNK_SIZE):
+            yield port_ids[i:i + SG_RULE_FANOUT_CHUNK_SIZE]
+        return
+
+    binding = sg_db.SecurityGroupPortBinding
+    last_port_id = None
+    while True:
+        query = admin_context.session.query(binding.port_id).filter(
+            binding.security_group_id == sg_id)
+        if last_port_id is not None:
+            query = query.filter(binding.port_id > last_port_id)
+        port_ids = [port_id for port_id, in query.order_by(
+            binding.port_id).limit(SG_RULE_FANOUT_CHUNK_SIZE)]
+        if port_ids:
+            yield port_ids
+        if len(port_ids) < SG_RULE_FANOUT_CHUNK_SIZE:
+            return
+        last_port_id = port_ids[-1]
 
 
 def _get_sg_from_cache(plugin, admin_context, sg_cache, sg_id):
@@ -210,14 +303,25 @@ def acl_remote_group_id(r, ip_version):
     return ' && %s.%s == $%s' % (ip_version, src_or_dst, addrset_name)
 
 
-def _add_sg_rule_acl_for_port(port, r):
-    # Update the match based on which direction this rule is for (ingress
-    # or egress).
-    match = acl_direction(r, port)
+def _get_sg_rule_match(r):
+    """Return the match of a rule following its port or port group part
+
+    The match only depends on the rule, so it is built once per rule and
+    cached by rule id. It is rebuilt when the matched columns of the rule
+    differ from the cached ones, and dropped by invalidate_sg_rule_match.
+    """
+    if 'rule_ids' in r:
+        # The match of merged rules is built by aggregate_sg_rules.
+        return r['match']
+
+    rule_id = r.get('id')
+    columns = tuple(r.get(column) for column in SG_RULE_MATCH_COLUMNS)
+    cached = _sg_rule_matches.get(rule_id) if rule_id else None
+    if cached is not None and cached[0] == columns:
+        return cached[1]
 
     # Update the match for IPv4 vs IPv6.
-    ip_match, ip_version, icmp = acl_ethertype(r)
-    match += ip_match
+    match, ip_version, icmp = acl_ethertype(r)
 
     # Update the match if an IPv4 or IPv6 prefix was specified.
     match += acl_remote_ip_prefix(r, ip_version)
@@ -229,8 +333,195 @@ def _add_sg_rule_acl_for_port(port, r):
     # range if specified.
     match += acl_protocol_and_ports(r, icmp)
 
+    if rule_id:
+        if len(_sg_rule_matches) >= SG_RULE_MATCH_CACHE_SIZE:
+            _sg_rule_matches.clear()
+        _sg_rule_matches[rule_id] = (columns, match)
+    return match
+
+
+def invalidate_sg_rule_match(rule_id):
+    """Drop the cached match of a security group rule"""
+    _sg_rule_matches.pop(rule_id, None)
+
+
+def _sg_rule_port_range(r):
+    """Return the (min, max) port range of a rule, None for all the ports"""
+    min_port = -1 if r['port_range_min'] is None else r['port_range_min']
+    max_port = -1 if r['port_range_max'] is None else r['port_range_max']
+    if min_port < 0 and max_port < 0:
+        return None
+    return (min_port if min_port >= 0 else MIN_PORT,
+            max_port if max_port >= 0 else MAX_PORT)
+
+
+def acl_remote_ip_prefixes(r, ip_version, prefixes):
+    src_or_dst = 'src' if r['direction'] == 'ingress' else 'dst'
+    if len(prefixes) == 1:
+        value = str(prefixes[0])
+    else:
+        value = '{%s}' % ', '.join(str(prefix) for prefix in prefixes)
+    return ' && %s.%s == %s' % (ip_version, src_or_dst, value)
+
+
+def acl_port_ranges(protocol, port_ranges):
+    # A rule matching all the ports makes the ranges of the others moot.
+    if None in port_ranges:
+        return ''
+    merged = []
+    for min_port, max_port in sorted(port_ranges):
+        if merged and min_port <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], max_port))
+        else:
+            merged.append((min_port, max_port))
+
+    port_match = '%s.dst' % protocol
+    ports = ['%d' % min_port for min_port, max_port in merged
+             if min_port == max_port]
+    terms = []
+    if len(ports) == 1:
+        terms.append('%s == %s' % (port_match, ports[0]))
+    elif ports:
+        terms.append('%s == {%s}' % (port_match, ', '.join(ports)))
+    terms += ['%s >= %d && %s <= %d' % (port_match, min_port,
+                                        port_match, max_port)
+              for min_port, max_port in merged if min_port != max_port]
+    if len(terms) == 1:
+        return ' && %s' % terms[0]
+    return ' && (%s)' % ' || '.join('(%s)' % term for term in terms)
+
+
+def aggregate_sg_rules(rules):
+    """Merge the security group rules which can share a single ACL
+
+    The rules with a remote IP prefix which have the same direction,
+    ethertype, protocol and ports are merged first, their prefixes merged
+    with netaddr.cidr_merge. The TCP and UDP rules which have the same
+    direction, ethertype, protocol and remote are then merged, their port
+    ranges combined. All the rules allow the related traffic, so they have
+    the same action.
+
+    A merged rule has the ids of the rules it merges in 'rule_ids' and its
+    match following the port or port group part in 'match'. The rules which
+    are not merged are returned as is, so their ACLs are unchanged.
+    """
+    # Merge the remote IP prefixes of the rules.
+    groups = collections.OrderedDict()
+    for i, r in enumerate(rules):
+        key = i
+        if r['remote_ip_prefix'] and not r['remote_group_id']:
+            match, ip_version, icmp = acl_ethertype(r)
+            key = (r['direction'], match, acl_protocol_and_ports(r, icmp))
+        groups.setdefault(key, []).append(r)
+    prefix_groups = []
+    for group in groups.values():
+        prefixes = None
+        if group[0]['remote_ip_prefix'] and not group[0]['remote_group_id']:
+            prefixes = netaddr.cidr_merge(
+                [r['remote_ip_prefix'] for r in group])
+        prefix_groups.append((group, prefixes))
+
+    # Merge the port ranges of the TCP and UDP rules.
+    groups = collections.OrderedDict()
+    for i, (group, prefixes) in enumerate(prefix_groups):
+        key = i
+        r = group[0]
+        protocol = PORT_RANGE_PROTOCOLS.get(r['protocol'])
+        if protocol:
+            key = (r['direction'], r['ethertype'], protocol,
+                   r['remote_group_id'],
+                   tuple(str(prefix) for prefix in prefixes or ()))
+        groups.setdefault(key, []).append((group, prefixes))
+
+    aggregated_rules = []
+    for port_groups in groups.values():
+        merged = [r for group, prefixes in port_groups for r in group]
+        if len(merged) == 1:
+            aggregated_rules.append(merged[0])
+            continue
+        r = merged[0]
+        prefixes = port_groups[0][1]
+        match, ip_version, icmp = acl_ethertype(r)
+        if prefixes:
+            match += acl_remote_ip_prefixes(r, ip_version, prefixes)
+        match += acl_remote_group_id(r, ip_version)
+        if len(port_groups) == 1:
+            match += acl_protocol_and_ports(r, icmp)
+        else:
+            protocol = PORT_RANGE_PROTOCOLS[r['protocol']]
+            match += ' && %s' % protocol
+            match += acl_port_ranges(
+                protocol, [_sg_rule_port_range(group[0])
+                           for group, prefixes in port_groups])
+        aggregated_rules.append({
+            'id': None,
+            'security_group_id': r['security_group_id'],
+            'direction': r['direction'],
+            'rule_ids': sorted(merged_rule['id'] for merged_rule in merged),
+            'match': match})
+    return aggregated_rules
+
+
+def _get_sg_rules(sg):
+    """Return the rules of a security group, merged if configured to"""
+    if config.is_ovn_acl_aggregation():
+        return aggregate_sg_rules(sg['security_group_rules'])
+    return sg['security_group_rules']
+
+
+def _add_sg_rule_acl_for_port(port, r):
+    # Update the match based on which direction this rule is for (ingress
+    # or egress), the rest of the match doesn't depend on the port.
+    match = acl_direction(r, port) + _get_sg_rule_match(r)
+
     # Finally, create the ACL entry for the direction specified.
-    return add_sg_rule_acl_for_port(port, r, match)
+    acl = add_sg_rule_acl_for_port(port, r, match)
+    if 'rule_ids' in r:
+        acl['external_ids'][ovn_const.OVN_SG_RULE_IDS_EXT_ID_KEY] = (
+            ','.join(r['rule_ids']))
+    return acl
+
+
+def sg_rule_acl_for_port_group(r):
+    """Return the ACL of a security group rule for its port group
+
+    The ACL matches the ports of the security group by their port group,
+    so a single ACL implements the rule for all of them.
+    """
+    dir_map = {
+        'ingress': 'to-lport',
+        'egress': 'from-lport',
+    }
+    port_group = utils.ovn_port_group_name(r['security_group_id'])
+    if 'rule_ids' in r:
+        external_ids = {
+            ovn_const.OVN_SG_RULE_IDS_EXT_ID_KEY: ','.join(r['rule_ids'])}
+    else:
+        external_ids = {ovn_const.OVN_SG_RULE_EXT_ID_KEY: r['id']}
+    return {"priority": ovn_const.ACL_PRIORITY_ALLOW,
+            "action": ovn_const.ACL_ACTION_ALLOW_RELATED,
+            "log": False,
+            "direction": dir_map[r['direction']],
+            "match": (acl_port_group_direction(r, port_group) +
+                      _get_sg_rule_match(r)),
+            "external_ids": external_ids}
+
+
+def port_group_acls_for_security_group(sg):
+    return [sg_rule_acl_for_port_group(r) for r in _get_sg_rules(sg)]
+
+
+def acl_port_groups(port):
+    """Return the names of the port groups a port is a member of"""
+    # Skip ACLs if security groups aren't enabled
+    if not is_sg_enabled():
+        return []
+
+    sec_groups = port.get('security_groups', [])
+    if not sec_groups:
+        return []
+    return ([ovn_const.OVN_DROP_PORT_GROUP_NAME] +
+            [utils.ovn_port_group_name(sg_id) for sg_id in sec_groups])
 
 
 def update_acls_for_security_group(plugin,
@@ -244,21 +535,122 @@ def update_acls_for_security_group(plugin,
     if not is_sg_enabled():
         return
 
-    # Get the security group ports.
-    sg_ports_cache = sg_ports_cache or {}
-    sg_ports = _get_sg_ports_from_cache(plugin,
-                                        admin_context,
-                                        sg_ports_cache,
-                                        security_group_id)
+    # With aggregation, the rule may share its ACL with other rules of the
+    # security group, so the ACLs are recomputed from the security group
+    # with and without the rule.
+    sg_cache = None
+    if config.is_ovn_acl_aggregation():
+        old_sg, new_sg = _get_sg_for_rule_update(
+            plugin, admin_context, security_group_id, security_group_rule,
+            is_add_acl)
+        sg_cache = {security_group_id: new_sg}
+
+    # With port groups, the rule is a single ACL of the port group of the
+    # security group.
+    if config.is_ovn_port_groups():
+        port_group = utils.ovn_port_group_name(security_group_id)
+        if sg_cache is not None:
+            _update_port_group_acls(
+                ovn, port_group, port_group_acls_for_security_group(old_sg),
+                port_group_acls_for_security_group(new_sg))
+            return
+        acls = [sg_rule_acl_for_port_group(security_group_rule)]
+        if is_add_acl:
+            ovn.add_port_group_acls(port_group, acls).execute(
+                check_error=True)
+        else:
+            ovn.delete_port_group_acls(port_group, acls).execute(
+                check_error=True)
+        return
 
-    # ACLs associated with a security group may span logical switches
-    sg_port_ids = [binding['port_id'] for binding in sg_ports]
-    sg_port_ids = list(set(sg_port_ids))
+    # The port ids of the security group are loaded, and the ports fetched
+    # and their ACLs updated, chunk by chunk, so that the database queries
+    # and the OVSDB transactions stay bounded whatever the number of ports
+    # of the security group. Only the chunks which failed are retried.
+    chunks = _get_sg_port_id_chunks(admin_context, sg_ports_cache or {},
+                                    security_group_id)
+    updated = 0
+    for attempt in range(SG_RULE_FANOUT_RETRIES + 1):
+        chunk_sg_cache = sg_cache
+        if attempt and is_add_acl and sg_cache is None:
+            # A failed transaction may have been committed anyway, so the
+            # ACLs of the retried ports are compared with their ACLs built
+            # from the database rather than added again.
+            chunk_sg_cache = {}
+        failed_chunks = []
+        for chunk in chunks:
+            try:
+                _update_acls_for_ports(plugin, admin_context, ovn, chunk,
+                                       security_group_rule, is_add_acl,
+                                       chunk_sg_cache)
+            except Exception as e:
+                LOG.warning(_LW("Failed to update the ACLs of %(count)d "
+                                "ports of security group %(sg)s: %(error)s"),
+                            {'count': len(chunk), 'sg': security_group_id,
+                             'error': e})
+                failed_chunks.append(chunk)
+                continue
+            updated += len(chunk)
+            LOG.debug("Updated the ACLs of %(updated)d ports of security "
+                      "group %(sg)s",
+                      {'updated': updated, 'sg': security_group_id})
+        if not failed_chunks:
+            return
+        chunks = failed_chunks
+
+    msg = _("Failed to update the ACLs of %(count)d ports of security "
+            "group %(sg)s") % {'count': sum(len(chunk) for chunk in chunks),
+                               'sg': security_group_id}
+    raise RuntimeError(msg)
+
+
+def _get_sg_for_rule_update(plugin, admin_context, security_group_id,
+                            security_group_rule, is_add_acl):
+    """Return the security group before and after the rule update"""
+    sg = plugin.get_security_group(admin_context, security_group_id)
+    rules = [r for r in sg['security_group_rules']
+             if r['id'] != security_group_rule['id']]
+    sg_without_rule = dict(sg, security_group_rules=rules)
+    sg_with_rule = dict(sg, security_group_rules=rules + [
+        security_group_rule])
+    if is_add_acl:
+        return sg_without_rule, sg_with_rule
+    return sg_with_rule, sg_without_rule
+
+
+def _update_port_group_acls(ovn, port_group, old_acls, new_acls):
+    old_keys = set(acl_key(acl) for acl in old_acls)
+    new_keys = set(acl_key(acl) for acl in new_acls)
+    stale_acls = [acl for acl in old_acls if acl_key(acl) not in new_keys]
+    missing_acls = [acl for acl in new_acls if acl_key(acl) not in old_keys]
+    with ovn.transaction(check_error=True) as txn:
+        if stale_acls:
+            txn.add(ovn.delete_port_group_acls(port_group, stale_acls))
+        if missing_acls:
+            txn.add(ovn.add_port_group_acls(port_group, missing_acls))
+
+
+def _update_acls_for_ports(plugin, admin_context, ovn, port_ids,
+                           security_group_rule, is_add_acl, sg_cache=None):
     port_list = plugin.get_ports(admin_context,
-                                 filters={'id': sg_port_ids})
+                                 filters={'id': port_ids})
+    # ACLs associated with a security group may span logical switches
     lswitch_names = set([p['network_id'] for p in port_list])
     acl_new_values_dict = {}
 
+    # With aggregation, the ACLs of the ports are compared with their new
+    # ACLs, built from the updated security group in sg_cache.
+    if sg_cache is not None:
+        subnet_cache = {}
+        for port in port_list:
+            acl_new_values_dict[port['id']] = add_acls(
+                plugin, admin_context, port, sg_cache, subnet_cache)
+        ovn.update_acls(list(lswitch_names),
+                        iter(port_list),
+                        acl_new_values_dict,
+                        need_compare=True).execute(check_error=True)
+        return
+
     # NOTE(lizk): We can directly locate the affected acl records,
     # so no need to compare new acl values with existing acl objects.
     for port in port_list:
@@ -287,8 +679,13 @@ def add_acls(plugin, admin_context, port, sg_cache, subnet_cache):
     if not sec_groups:
         return acl_list
 
+    # With port groups, the drop and security group rule ACLs belong to the
+    # port groups of the port, see acl_port_groups.
+    port_groups = config.is_ovn_port_groups()
+
     # Drop all IP traffic to and from the logical port by default.
-    acl_list += drop_all_ip_traffic_for_port(port)
+    if not port_groups:
+        acl_list += drop_all_ip_traffic_for_port(port)
 
     # Add DHCP ACLs if not using OVN native DHCP.
     if not config.is_ovn_dhcp():
@@ -305,6 +702,9 @@ def add_acls(plugin, admin_context, port, sg_cache, subnet_cache):
                 acl_list += add_acl_dhcp(port, subnet)
                 port_subnet_ids.add(subnet['id'])
 
+    if port_groups:
+        return acl_list
+
     # We create an ACL entry for each rule on each security group applied
     # to this port.
     for sg_id in sec_groups:
@@ -312,7 +712,7 @@ def add_acls(plugin, admin_context, port, sg_cache, subnet_cache):
                                 admin_context,
                                 sg_cache,
                                 sg_id)
-        for r in sg['security_group_rules']:
+        for r in _get_sg_rules(sg):
             acl = _add_sg_rule_acl_for_port(port, r)
             if acl and acl not in acl_list:
                 acl_list.append(acl)
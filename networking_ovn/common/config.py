@@ -80,6 +80,120 @@ ovn_opts = [
                default=(12 * 60 * 60),
                help=_('Default least time (in seconds ) to use when '
                       'ovn_native_dhcp is enabled.')),
+    cfg.BoolOpt('ovn_nb_sfc_tables',
+                default=False,
+                help=_('Whether to replicate the service function chaining '
+                       'tables of the OVN_Northbound OVSDB in the '
+                       'neutron-server workers. Only enable it when the '
+                       'port chain API of the OVN driver is used.')),
+    cfg.StrOpt('ovn_idl_snapshot_dir',
+               help=_('The directory where the neutron-server workers keep '
+                      'a snapshot of the OVN_Northbound and OVN_Southbound '
+                      'rows they replicate. On restart, the workers load '
+                      'the snapshot and only fetch the changes made since '
+                      'it was saved, when the ovsdb-server supports it. '
+                      'This requires an OVS python library supporting '
+                      'monitor_cond_since, the snapshot is disabled with '
+                      'older ones. The snapshot is disabled when not '
+                      'set.')),
+    cfg.IntOpt('ovn_idl_snapshot_interval',
+               default=300,
+               min=1,
+               help=_('Minimum interval in seconds between two saves of the '
+                      'IDL snapshot.')),
+    cfg.IntOpt('ovn_notify_workers',
+               default=1,
+               min=1,
+               help=_('The number of workers handling the OVN_Northbound '
+                      'and OVN_Southbound notify events in the OVN worker. '
+                      'The events are partitioned by row, so that the '
+                      'events of a row are handled in order while the '
+                      'events of different rows are handled concurrently.')),
+    cfg.IntOpt('ovn_notify_queue_depth',
+               default=0,
+               min=0,
+               help=_('The number of pending notify events per notify '
+                      'worker above which a warning is logged. The queues '
+                      'are not bounded, since the OVSDB connection thread '
+                      'queuing the events must never block. 0 disables the '
+                      'warning.')),
+    cfg.BoolOpt('ovn_notify_coalesce_events',
+                default=False,
+                help=_('Whether to coalesce the pending notify events of a '
+                       'row which only depend on its latest state, like the '
+                       'port status and chassis events. A pending event is '
+                       'replaced by a newer one for the same row and '
+                       'dropped.')),
+    cfg.IntOpt('ovn_chassis_reschedule_interval',
+               default=0,
+               min=0,
+               help=_('The interval in seconds over which the Chassis '
+                      'events are aggregated before rescheduling the '
+                      'unhosted routers once. 0 reschedules the routers on '
+                      'every Chassis event.')),
+    cfg.IntOpt('ovn_port_up_slow_threshold',
+               default=30,
+               min=0,
+               help=_('The number of seconds after which a port which goes '
+                      'up is logged as slow, with the latency of each stage '
+                      'from the OVN_Northbound commit until the port is '
+                      'active. Only the ports created in OVN '
+                      'by the OVN worker, as with ovn_journal_mode, are '
+                      'tracked. 0 disables the slow port log.')),
+    cfg.IntOpt('ovn_nb_group_commit_window',
+               default=0,
+               min=0,
+               help=_('The window in milliseconds over which the '
+                      'OVN_Northbound transactions of a neutron-server '
+                      'worker are merged into a single OVSDB transaction. '
+                      'When the merged transaction fails, the transactions '
+                      'are committed separately so that each one gets its '
+                      'own result. 0 disables the group commit.')),
+    cfg.IntOpt('ovn_nb_txn_retry_backoff',
+               default=0,
+               min=0,
+               help=_('The base in milliseconds of the jittered exponential '
+                      'backoff applied before retrying an OVN_Northbound '
+                      'transaction whose verified columns were changed '
+                      'concurrently, so that the neutron-server workers '
+                      'stop invalidating each other. The backoff is waited '
+                      'for by the caller of the transaction, not by the '
+                      'OVSDB connection thread. 0 retries immediately.')),
+    cfg.BoolOpt('ovn_journal_mode',
+                default=False,
+                help=_('Whether the network and port changes are recorded '
+                       'in a journal table of the neutron database, in the '
+                       'transaction of the change, instead of being applied '
+                       'to the OVN_Northbound database before the API call '
+                       'returns. The OVN worker applies the journal entries '
+                       'in order, retrying the failed ones. The ports of a '
+                       'bulk port create are then created in OVN a batch at '
+                       'a time, while without the journal each of them is '
+                       'created in its own OVN_Northbound transaction.')),
+    cfg.IntOpt('ovn_journal_sync_interval',
+               default=1,
+               min=1,
+               help=_('The interval in seconds at which the OVN worker '
+                      'applies the pending journal entries to the '
+                      'OVN_Northbound database when ovn_journal_mode is '
+                      'enabled.')),
+    cfg.BoolOpt('ovn_port_groups',
+                default=False,
+                help=_('Whether to implement the security groups with OVN '
+                       'port groups. Each security group then maps to a '
+                       'Port_Group holding one ACL per rule, instead of '
+                       'one ACL per rule on each of its ports. Requires an '
+                       'OVN_Northbound schema with the Port_Group table.')),
+    cfg.BoolOpt('ovn_acl_aggregation',
+                default=False,
+                help=_('Whether to merge the rules of a security group '
+                       'which only differ by their remote IP prefix or by '
+                       'their TCP or UDP port range into a single ACL. The '
+                       'prefixes are merged into the smallest set of CIDRs '
+                       'and the port ranges into a set of ports and ranges, '
+                       'reducing the number of ACLs and OpenFlow flows. '
+                       'The ids of the merged rules are recorded in the '
+                       'external_ids of the ACL.')),
 ]
 
 cfg.CONF.register_opts(ovn_opts, group='ovn')
@@ -129,3 +243,59 @@ def is_ovn_dhcp():
 
 def get_ovn_dhcp_default_lease_time():
     return cfg.CONF.ovn.dhcp_default_lease_time
+
+
+def is_ovn_nb_sfc_tables():
+    return cfg.CONF.ovn.ovn_nb_sfc_tables
+
+
+def get_ovn_idl_snapshot_dir():
+    return cfg.CONF.ovn.ovn_idl_snapshot_dir
+
+
+def get_ovn_idl_snapshot_interval():
+    return cfg.CONF.ovn.ovn_idl_snapshot_interval
+
+
+def get_ovn_notify_workers():
+    return cfg.CONF.ovn.ovn_notify_workers
+
+
+def get_ovn_notify_queue_depth():
+    return cfg.CONF.ovn.ovn_notify_queue_depth
+
+
+def is_ovn_notify_coalesce_events():
+    return cfg.CONF.ovn.ovn_notify_coalesce_events
+
+
+def get_ovn_chassis_reschedule_interval():
+    return cfg.CONF.ovn.ovn_chassis_reschedule_interval
+
+
+def get_ovn_port_up_slow_threshold():
+    return cfg.CONF.ovn.ovn_port_up_slow_threshold
+
+
+def get_ovn_nb_group_commit_window():
+    return cfg.CONF.ovn.ovn_nb_group_commit_window
+
+
+def get_ovn_nb_txn_retry_backoff():
+    return cfg.CONF.ovn.ovn_nb_txn_retry_backoff
+
+
+def is_ovn_journal_mode():
+    return cfg.CONF.ovn.ovn_journal_mode
+
+
+def get_ovn_journal_sync_interval():
+    return cfg.CONF.ovn.ovn_journal_sync_interval
+
+
+def is_ovn_port_groups():
+    return cfg.CONF.ovn.ovn_port_groups
+
+
+def is_ovn_acl_aggregation():
+    return cfg.CONF.ovn.ovn_acl_aggregation
@@ -18,6 +18,9 @@ OVN_NETWORK_NAME_EXT_ID_KEY = 'neutron:network_name'
 OVN_PORT_NAME_EXT_ID_KEY = 'neutron:port_name'
 OVN_ROUTER_NAME_EXT_ID_KEY = 'neutron:router_name'
 OVN_SG_NAME_EXT_ID_KEY = 'neutron:security_group_name'
+OVN_SG_EXT_ID_KEY = 'neutron:security_group_id'
+OVN_SG_RULE_EXT_ID_KEY = 'neutron:security_group_rule_id'
+OVN_SG_RULE_IDS_EXT_ID_KEY = 'neutron:security_group_rule_ids'
 OVN_PHYSNET_EXT_ID_KEY = 'neutron:provnet-physical-network'
 OVN_NETTYPE_EXT_ID_KEY = 'neutron:provnet-network-type'
 OVN_SEGID_EXT_ID_KEY = 'neutron:provnet-segmentation-id'
@@ -39,6 +42,10 @@ ACL_ACTION_DROP = 'drop'
 ACL_ACTION_ALLOW_RELATED = 'allow-related'
 ACL_ACTION_ALLOW = 'allow'
 
+# In port group mode, the ports having security groups are members of this
+# port group, whose ACLs drop all their IP traffic by default.
+OVN_DROP_PORT_GROUP_NAME = 'neutron_pg_drop'
+
 # When a OVN L3 gateway is created, it needs to be bound to a chassis. In
 # case a chassis is not found OVN_GATEWAY_INVALID_CHASSIS will be set in
 # the options column of the Logical Router. This value is used to detect
@@ -52,3 +59,13 @@ SUPPORTED_DHCP_OPTS = [
     'router-solicitation', 'arp-timeout', 'ethernet-encap',
     'tcp-ttl', 'tcp-keepalive', 'nis-server', 'ntp-server',
     'tftp-server']
+
+# The journal entries record the network and port changes to apply to the
+# OVN NB database when ovn_journal_mode is enabled.
+JOURNAL_NETWORK = 'network'
+JOURNAL_PORT = 'port'
+JOURNAL_CREATE = 'create'
+JOURNAL_UPDATE = 'update'
+JOURNAL_DELETE = 'delete'
+JOURNAL_PENDING = 'pending'
+JOURNAL_FAILED = 'failed'
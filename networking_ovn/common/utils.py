@@ -55,6 +55,15 @@ def ovn_addrset_name(sg_id, ip_version):
     return ('as-%s-%s' % (ip_version, sg_id)).replace('-', '_')
 
 
+def ovn_port_group_name(sg_id):
+    # The name of the port group for the given security group id. The
+    # format is:
+    #   pg_<security group uuid>
+    # with all '-' replaced with '_', since port group names are used as
+    # identifiers in the ACL matches.
+    return ('pg_%s' % sg_id).replace('-', '_')
+
+
 def get_lsp_dhcpv4_opts(port):
     # Get dhcpv4 options from Neutron port, for setting DHCP_Options row
     # in OVN.
@@ -0,0 +1,237 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import itertools
+import time
+
+from eventlet import greenthread
+from oslo_log import log
+from oslo_service import loopingcall
+
+from neutron import context as n_context
+
+from networking_ovn._i18n import _LE, _LI, _LW
+from networking_ovn.common import config
+from networking_ovn.common import constants as ovn_const
+from networking_ovn.db import models
+
+LOG = log.getLogger(__name__)
+
+# Number of pending entries read from the journal at once.
+JOURNAL_BATCH_SIZE = 100
+
+# Number of times an entry is applied before it is marked as failed.
+JOURNAL_MAX_RETRIES = 5
+
+# Interval in seconds between the checks of the entries waited for.
+JOURNAL_WAIT_INTERVAL = 0.5
+
+
+def record(context, object_type, object_uuid, operation, data):
+    """Record a change to apply to the OVN NB database
+
+    Must be called in the transaction of the neutron change, so that the
+    entry is committed, or rolled back, with it.
+    """
+    context.session.add(models.OVNJournal(
+        object_type=object_type, object_uuid=object_uuid,
+        operation=operation, data=data, state=ovn_const.JOURNAL_PENDING,
+        retry_count=0))
+
+
+def get_pending_entries(context, limit=JOURNAL_BATCH_SIZE):
+    """Return the oldest pending entries, in the order of their changes"""
+    return (context.session.query(models.OVNJournal).
+            filter_by(state=ovn_const.JOURNAL_PENDING).
+            order_by(models.OVNJournal.seqnum).
+            limit(limit).all())
+
+
+def delete_entry(context, entry):
+    with context.session.begin(subtransactions=True):
+        context.session.delete(entry)
+
+
+def update_entry_retry(context, entry):
+    """Count a failed attempt, marking the entry failed after the last one
+
+    Return whether the entry will be retried.
+    """
+    with context.session.begin(subtransactions=True):
+        entry.retry_count += 1
+        if entry.retry_count >= JOURNAL_MAX_RETRIES:
+            entry.state = ovn_const.JOURNAL_FAILED
+    return entry.state == ovn_const.JOURNAL_PENDING
+
+
+def _get_pending_query(context, object_uuids=None):
+    query = context.session.query(models.OVNJournal).filter_by(
+        state=ovn_const.JOURNAL_PENDING)
+    if object_uuids is not None:
+        query = query.filter(models.OVNJournal.object_uuid.in_(object_uuids))
+    return query
+
+
+def wait_for_entries(object_uuids=None):
+    """Wait until the pending entries of the given objects are applied
+
+    The changes still applied synchronously to the OVN NB database, like
+    the router interfaces, the subnets, the security group rules and the
+    trunks, may depend on network and port changes still in the journal.
+    Without object uuids, all the entries pending when called are waited
+    for. Gives up after the OVSDB timeout, return whether the entries were
+    applied.
+    """
+    if not config.is_ovn_journal_mode():
+        return True
+    context = n_context.get_admin_context()
+    last_entry = _get_pending_query(context, object_uuids).order_by(
+        models.OVNJournal.seqnum.desc()).first()
+    if last_entry is None:
+        return True
+    # The entries recorded later are not waited for, so that a busy journal
+    # doesn't delay the caller forever.
+    last_seqnum = last_entry.seqnum
+    deadline = time.time() + config.get_ovn_ovsdb_timeout()
+    while True:
+        greenthread.sleep(JOURNAL_WAIT_INTERVAL)
+        pending = _get_pending_query(context, object_uuids).filter(
+            models.OVNJournal.seqnum <= last_seqnum).count()
+        if not pending:
+            return True
+        if time.time() >= deadline:
+            LOG.warning(_LW("Timed out waiting for %(count)d pending OVN "
+                            "journal entries up to %(seqnum)s"),
+                        {'count': pending, 'seqnum': last_seqnum})
+            return False
+
+
+def _is_port_create(entry):
+    return (entry.object_type == ovn_const.JOURNAL_PORT and
+            entry.operation == ovn_const.JOURNAL_CREATE)
+
+
+def _entry_dependencies(entry):
+    """Return the keys of the failed entries the entry must wait for
+
+    Besides the previous entries of its object, a port entry waits for the
+    entries of its network, and a network entry for the entries of the
+    ports of the network.
+    """
+    if entry.object_type == ovn_const.JOURNAL_PORT:
+        return (entry.object_uuid, entry.data['current']['network_id'])
+    return (entry.object_uuid, (ovn_const.JOURNAL_PORT, entry.object_uuid))
+
+
+def _entry_blocked_keys(entry):
+    """Return the keys of the entries waiting for a failed entry"""
+    if entry.object_type == ovn_const.JOURNAL_PORT:
+        return (entry.object_uuid,
+                (ovn_const.JOURNAL_PORT,
+                 entry.data['current']['network_id']))
+    return (entry.object_uuid,)
+
+
+def _is_blocked(entry, blocked_objects):
+    return any(key in blocked_objects for key in _entry_dependencies(entry))
+
+
+class OvnJournal(object):
+    """Apply the journal entries to the OVN NB database in order
+
+    Runs in the OVN worker. Like the notify events, the journal is only
+    applied by the neutron server which has the event lock of the NB IDL,
+    so that a single server applies each entry.
+    """
+
+    def __init__(self, driver):
+        self._driver = driver
+        self._timer = None
+
+    def start(self):
+        LOG.info(_LI("Starting the OVN journal"))
+        self._timer = loopingcall.FixedIntervalLoopingCall(self.sync_pending)
+        self._timer.start(config.get_ovn_journal_sync_interval(),
+                          stop_on_exception=False)
+
+    def stop(self):
+        if self._timer is not None:
+            self._timer.stop()
+            self._timer = None
+
+    def _has_lock(self):
+        idl = self._driver._nb_ovn.idl
+        return not (idl.is_lock_contended and not idl.has_lock)
+
+    def sync_pending(self):
+        """Apply the pending entries, batch by batch"""
+        if not self._has_lock():
+            return
+        context = n_context.get_admin_context()
+        while True:
+            entries = get_pending_entries(context)
+            if not entries:
+                return
+            if not self._sync_entries(context, entries):
+                # Leave the entries to retry to the next run.
+                return
+
+    def _sync_entries(self, context, entries):
+        # The entries of an object, and of the objects it depends on, are
+        # applied in order, so those following an entry to retry wait for
+        # it (see _entry_dependencies).
+        blocked_objects = set()
+        # The consecutive port creations are applied in bulk, typically
+        # those of a bulk port create or of the ports of a new instance.
+        for is_port_create, group in itertools.groupby(
+                entries, key=_is_port_create):
+            group = [entry for entry in group
+                     if not _is_blocked(entry, blocked_objects)]
+            if is_port_create and len(group) > 1:
+                self._sync_port_creations(context, group, blocked_objects)
+                continue
+            for entry in group:
+                if _is_blocked(entry, blocked_objects):
+                    continue
+                try:
+                    self._driver.apply_journal_entry(
+                        entry.object_type, entry.operation, entry.data)
+                except Exception:
+                    LOG.exception(_LE("Failed to apply the OVN journal entry "
+                                      "%(seqnum)s, %(operation)s %(type)s "
+                                      "%(uuid)s"),
+                                  {'seqnum': entry.seqnum,
+                                   'operation': entry.operation,
+                                   'type': entry.object_type,
+                                   'uuid': entry.object_uuid})
+                    self._entry_failed(context, entry, blocked_objects)
+                    continue
+                delete_entry(context, entry)
+        return not blocked_objects
+
+    def _sync_port_creations(self, context, entries, blocked_objects):
+        failed_port_ids = self._driver.create_ports_in_ovn(
+            [entry.data['current'] for entry in entries])
+        for entry in entries:
+            if entry.object_uuid in failed_port_ids:
+                self._entry_failed(context, entry, blocked_objects)
+            else:
+                delete_entry(context, entry)
+
+    def _entry_failed(self, context, entry, blocked_objects):
+        if update_entry_retry(context, entry):
+            blocked_objects.update(_entry_blocked_keys(entry))
+        else:
+            LOG.error(_LE("Giving up on the OVN journal entry "
+                          "%(seqnum)s after %(retries)d attempts"),
+                      {'seqnum': entry.seqnum,
+                       'retries': entry.retry_count})
@@ -0,0 +1,52 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+
+"""Add the ovn_journal table
+
+Revision ID: bc9e4c3f0a52
+Revises: start_networking_ovn
+Create Date: 2016-10-03 00:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+from neutron.db.migration import cli
+
+
+# revision identifiers, used by Alembic.
+revision = 'bc9e4c3f0a52'
+down_revision = 'start_networking_ovn'
+branch_labels = (cli.EXPAND_BRANCH,)
+
+
+def upgrade():
+    op.create_table(
+        'ovn_journal',
+        sa.Column('seqnum', sa.BigInteger().with_variant(sa.Integer(),
+                                                         'sqlite'),
+                  primary_key=True, autoincrement=True),
+        sa.Column('object_type', sa.String(36), nullable=False),
+        sa.Column('object_uuid', sa.String(36), nullable=False),
+        sa.Column('operation', sa.String(36), nullable=False),
+        sa.Column('data', sa.PickleType, nullable=True),
+        sa.Column('state', sa.Enum('pending', 'failed',
+                                   name='ovn_journal_state'),
+                  nullable=False, default='pending'),
+        sa.Column('retry_count', sa.Integer, nullable=False, default=0),
+        sa.Column('created_at', sa.DateTime,
+                  server_default=sa.func.now()),
+        sa.Column('last_retried', sa.TIMESTAMP,
+                  server_default=sa.func.now(),
+                  onupdate=sa.func.now()))
@@ -0,0 +1,38 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import sqlalchemy as sa
+
+from neutron.db import model_base
+
+from networking_ovn.common import constants as ovn_const
+
+
+class OVNJournal(model_base.BASEV2):
+    """A network or port change to apply to the OVN NB database"""
+
+    __tablename__ = 'ovn_journal'
+
+    seqnum = sa.Column(sa.BigInteger().with_variant(sa.Integer(), 'sqlite'),
+                       primary_key=True, autoincrement=True)
+    object_type = sa.Column(sa.String(36), nullable=False)
+    object_uuid = sa.Column(sa.String(36), nullable=False)
+    operation = sa.Column(sa.String(36), nullable=False)
+    data = sa.Column(sa.PickleType, nullable=True)
+    state = sa.Column(sa.Enum(ovn_const.JOURNAL_PENDING,
+                              ovn_const.JOURNAL_FAILED,
+                              name='ovn_journal_state'),
+                      nullable=False, default=ovn_const.JOURNAL_PENDING)
+    retry_count = sa.Column(sa.Integer, nullable=False, default=0)
+    created_at = sa.Column(sa.DateTime, server_default=sa.func.now())
+    last_retried = sa.Column(sa.TIMESTAMP, server_default=sa.func.now(),
+                             onupdate=sa.func.now())
@@ -29,6 +29,7 @@ from networking_ovn._i18n import _LE, _LI
 from networking_ovn.common import constants as ovn_const
 from networking_ovn.common import extensions
 from networking_ovn.common import utils
+from networking_ovn.db import journal
 from networking_ovn.l3 import l3_ovn_scheduler
 from networking_ovn.ovsdb import impl_idl_ovn
 
@@ -232,6 +233,9 @@ class OVNL3RouterPlugin(service_base.ServicePluginBase,
                 context, router_id, interface_info)
 
         port = self._plugin.get_port(context, router_interface_info['port_id'])
+        # The logical switch port of the interface may still be waiting in
+        # the journal.
+        journal.wait_for_entries([port['id'], port['network_id']])
         if (len(router_interface_info['subnet_ids']) == 1 and
                 len(port['fixed_ips']) > 1):
             # NOTE(lizk) It's adding a subnet onto an already existing router
@@ -246,6 +250,7 @@ class OVNL3RouterPlugin(service_base.ServicePluginBase,
             super(OVNL3RouterPlugin, self).remove_router_interface(
                 context, router_id, interface_info)
         port_id = router_interface_info['port_id']
+        journal.wait_for_entries([port_id])
         try:
             port = self._plugin.get_port(context, port_id)
             # The router interface port still exists, call ovn to update it.
@@ -21,13 +21,13 @@ from neutron_lib import exceptions as n_exc
 from oslo_config import cfg
 from oslo_db import exception as os_db_exc
 from oslo_log import log
-import six
 
 from neutron.callbacks import events
 from neutron.callbacks import registry
 from neutron.callbacks import resources
 from neutron.common import utils as n_utils
 from neutron import context as n_context
+from neutron.db import models_v2
 from neutron.db import provisioning_blocks
 from neutron.extensions import portbindings
 from neutron.extensions import portsecurity as psec
@@ -38,16 +38,18 @@ from neutron.plugins.ml2 import driver_api
 from neutron.services.qos import qos_consts
 from neutron.services.segments import db as segment_service_db
 
-from networking_ovn._i18n import _, _LI, _LW
+from networking_ovn._i18n import _, _LE, _LI, _LW
 from networking_ovn.common import acl as ovn_acl
 from networking_ovn.common import config
 from networking_ovn.common import constants as ovn_const
 from networking_ovn.common import utils
+from networking_ovn.db import journal
 from networking_ovn.ml2 import qos_driver
 from networking_ovn.ml2 import trunk_driver
 from networking_ovn import ovn_db_sync
 from networking_ovn.ovsdb import impl_idl_ovn
 from networking_ovn.ovsdb import ovsdb_monitor
+from networking_ovn.ovsdb import port_latency
 
 
 LOG = log.getLogger(__name__)
@@ -58,6 +60,13 @@ OvnPortInfo = collections.namedtuple('OvnPortInfo', ['type', 'options',
                                                      'parent_name', 'tag',
                                                      'dhcpv4_options'])
 
+# Number of ports whose status is changed in a single DB transaction when
+# reconciling the port statuses in bulk.
+PORT_STATUS_BATCH_SIZE = 100
+
+# Number of ports created in a single OVN transaction by create_ports_in_ovn.
+PORT_CREATE_BATCH_SIZE = 100
+
 
 class OVNMechanismDriver(driver_api.MechanismDriver):
     """OVN ML2 mechanism driver
@@ -94,6 +103,10 @@ class OVNMechanismDriver(driver_api.MechanismDriver):
         self._sb_ovn = None
         self._plugin_property = None
         self.sg_enabled = ovn_acl.is_sg_enabled()
+        self.journal_mode = config.is_ovn_journal_mode()
+        self._journal = None
+        self.port_latency_tracker = None
+        self.port_groups = config.is_ovn_port_groups()
         if cfg.CONF.SECURITYGROUP.firewall_driver:
             LOG.warning(_LW('Firewall driver configuration is ignored'))
         self._setup_vif_port_bindings()
@@ -158,12 +171,25 @@ class OVNMechanismDriver(driver_api.MechanismDriver):
                                events.BEFORE_DELETE)
 
     def post_fork_initialize(self, resource, event, trigger, **kwargs):
+        if trigger.im_class == ovsdb_monitor.OvnWorker:
+            # Only the OvnWorker handles the up events of the ports, the
+            # latency of the ports it creates can be tracked.
+            self.port_latency_tracker = port_latency.PortUpLatencyTracker(
+                config.get_ovn_port_up_slow_threshold())
+
         # NOTE(rtheis): This will initialize all workers (API, RPC,
         # plugin service and OVN) with OVN IDL connections.
         self._nb_ovn, self._sb_ovn = impl_idl_ovn.get_ovn_idls(self,
                                                                trigger)
+        if self.port_groups and not self._nb_ovn.is_port_groups_supported():
+            LOG.error(_LE("ovn_port_groups is enabled but the "
+                          "OVN_Northbound schema has no Port_Group table, "
+                          "the security groups can't be implemented"))
 
         if trigger.im_class == ovsdb_monitor.OvnWorker:
+            if self.port_groups and self.sg_enabled:
+                self._create_drop_port_group()
+
             # Call the synchronization task if its ovn worker
             # This sync neutron DB to OVN-NB DB only in inconsistent states
             self.nb_synchronizer = ovn_db_sync.OvnNbSynchronizer(
@@ -182,10 +208,29 @@ class OVNMechanismDriver(driver_api.MechanismDriver):
             )
             self.sb_synchronizer.sync()
 
+            if self.journal_mode:
+                self._journal = journal.OvnJournal(self)
+                self._journal.start()
+
+    def _create_drop_port_group(self):
+        with self._nb_ovn.transaction(check_error=True) as txn:
+            txn.add(self._nb_ovn.create_port_group(
+                ovn_const.OVN_DROP_PORT_GROUP_NAME, may_exist=True,
+                acls=ovn_acl.drop_all_ip_traffic_for_port_group()))
+
     def _process_sg_notification(self, resource, event, trigger, **kwargs):
         sg = kwargs.get('security_group')
         external_ids = {ovn_const.OVN_SG_NAME_EXT_ID_KEY: sg['name']}
         with self._nb_ovn.transaction(check_error=True) as txn:
+            if self.port_groups:
+                pg_name = utils.ovn_port_group_name(sg['id'])
+                if event == events.AFTER_CREATE:
+                    txn.add(self._nb_ovn.create_port_group(
+                        pg_name,
+                        acls=ovn_acl.port_group_acls_for_security_group(sg),
+                        external_ids={ovn_const.OVN_SG_EXT_ID_KEY: sg['id']}))
+                elif event == events.BEFORE_DELETE:
+                    txn.add(self._nb_ovn.delete_port_group(pg_name))
             for ip_version in ['ip4', 'ip6']:
                 if event == events.AFTER_CREATE:
                     txn.add(self._nb_ovn.create_address_set(
@@ -215,6 +260,11 @@ class OVNMechanismDriver(driver_api.MechanismDriver):
             sg_id = sg_rule['security_group_id']
             is_add_acl = False
 
+        # The ACLs of the ports are updated on their logical switches, which
+        # may still be waiting in the journal.
+        if not self.port_groups:
+            journal.wait_for_entries()
+
         # TODO(russellb) It's possible for Neutron and OVN to get out of sync
         # here. If updating ACls fails somehow, we're out of sync until another
         # change causes another refresh attempt.
@@ -224,6 +274,8 @@ class OVNMechanismDriver(driver_api.MechanismDriver):
                                                sg_id,
                                                sg_rule,
                                                is_add_acl=is_add_acl)
+        if not is_add_acl:
+            ovn_acl.invalidate_sg_rule_match(sg_rule['id'])
 
     def _is_network_type_supported(self, network_type):
         return (network_type in [plugin_const.TYPE_LOCAL,
@@ -259,6 +311,9 @@ class OVNMechanismDriver(driver_api.MechanismDriver):
         of the current transaction.
         """
         self._validate_network_segments(context.network_segments)
+        if self.journal_mode:
+            self._record_journal_entry(context, ovn_const.JOURNAL_NETWORK,
+                                       ovn_const.JOURNAL_CREATE)
 
     def create_network_postcommit(self, context):
         """Create a network.
@@ -271,7 +326,11 @@ class OVNMechanismDriver(driver_api.MechanismDriver):
         drastically affect performance. Raising an exception will
         cause the deletion of the resource.
         """
-        network = context.current
+        if self.journal_mode:
+            return
+        self._create_network(context.current)
+
+    def _create_network(self, network):
         physnet = self._get_attribute(network, pnet.PHYSICAL_NETWORK)
         segid = self._get_attribute(network, pnet.SEGMENTATION_ID)
         self.create_network_in_ovn(network, {}, physnet, segid)
@@ -326,6 +385,9 @@ class OVNMechanismDriver(driver_api.MechanismDriver):
         state or state changes that it does not know or care about.
         """
         self._validate_network_segments(context.network_segments)
+        if self.journal_mode:
+            self._record_journal_entry(context, ovn_const.JOURNAL_NETWORK,
+                                       ovn_const.JOURNAL_UPDATE)
 
     def update_network_postcommit(self, context):
         """Update a network.
@@ -343,12 +405,31 @@ class OVNMechanismDriver(driver_api.MechanismDriver):
         network state.  It is up to the mechanism driver to ignore
         state or state changes that it does not know or care about.
         """
-        network = context.current
-        original_network = context.original
+        if self.journal_mode:
+            return
+        self._update_network(context.current, context.original)
+
+    def _update_network(self, network, original_network):
         if network['name'] != original_network['name']:
             self._set_network_name(network['id'], network['name'])
         self.qos_driver.update_network(network, original_network)
 
+    def delete_network_precommit(self, context):
+        """Delete resources for a network.
+
+        :param context: NetworkContext instance describing the current
+        state of the network, prior to the call to delete it.
+
+        Delete network resources previously allocated by this
+        mechanism driver for a network. Called inside transaction
+        context on session. Runtime errors are not expected, but
+        raising an exception will result in rollback of the
+        transaction.
+        """
+        if self.journal_mode:
+            self._record_journal_entry(context, ovn_const.JOURNAL_NETWORK,
+                                       ovn_const.JOURNAL_DELETE)
+
     def delete_network_postcommit(self, context):
         """Delete a network.
 
@@ -361,19 +442,25 @@ class OVNMechanismDriver(driver_api.MechanismDriver):
         expected, and will not prevent the resource from being
         deleted.
         """
-        network = context.current
+        if self.journal_mode:
+            return
+        self._delete_network(context.current)
+
+    def _delete_network(self, network):
         self._nb_ovn.delete_lswitch(
             utils.ovn_name(network['id']), if_exists=True).execute(
                 check_error=True)
 
     def create_subnet_postcommit(self, context):
         subnet = context.current
+        journal.wait_for_entries([subnet['network_id']])
         if subnet['enable_dhcp'] and config.is_ovn_dhcp():
             self.add_subnet_dhcp_options_in_ovn(subnet,
                                                 context.network.current)
 
     def update_subnet_postcommit(self, context):
         subnet = context.current
+        journal.wait_for_entries([subnet['network_id']])
         if config.is_ovn_dhcp() and (
             subnet['enable_dhcp'] or context.original['enable_dhcp']):
             self.add_subnet_dhcp_options_in_ovn(subnet,
@@ -381,6 +468,7 @@ class OVNMechanismDriver(driver_api.MechanismDriver):
 
     def delete_subnet_postcommit(self, context):
         subnet = context.current
+        journal.wait_for_entries([subnet['network_id']])
         if config.is_ovn_dhcp():
             with self._nb_ovn.transaction(check_error=True) as txn:
                 subnet_dhcp_options = self._nb_ovn.get_subnet_dhcp_options(
@@ -468,6 +556,9 @@ class OVNMechanismDriver(driver_api.MechanismDriver):
         port = context.current
         self.validate_and_get_data_from_binding_profile(port)
         self._insert_port_provisioning_block(context._plugin_context, port)
+        if self.journal_mode:
+            self._record_journal_entry(context, ovn_const.JOURNAL_PORT,
+                                       ovn_const.JOURNAL_CREATE)
 
     def validate_and_get_data_from_binding_profile(self, port):
         if (ovn_const.OVN_PORT_BINDING_PROFILE not in port or
@@ -551,7 +642,11 @@ class OVNMechanismDriver(driver_api.MechanismDriver):
         drastically affect performance.  Raising an exception will
         result in the deletion of the resource.
         """
-        port = context.current
+        if self.journal_mode:
+            return
+        self._create_port(context.current)
+
+    def _create_port(self, port):
         ovn_port_info = self.get_ovn_port_options(port)
         self.create_port_in_ovn(port, ovn_port_info)
 
@@ -613,48 +708,124 @@ class OVNMechanismDriver(driver_api.MechanismDriver):
                            parent_name, tag, dhcpv4_options)
 
     def create_port_in_ovn(self, port, ovn_port_info):
-        external_ids = {ovn_const.OVN_PORT_NAME_EXT_ID_KEY: port['name']}
-        lswitch_name = utils.ovn_name(port['network_id'])
+        self._create_ports_in_ovn([(port, ovn_port_info)],
+                                  n_context.get_admin_context(), {}, {})
+
+    def create_ports_in_ovn(self, ports):
+        """Create ports in OVN in bulk
+
+        The ports share the security group and subnet caches used to build
+        their ACLs, and are created PORT_CREATE_BATCH_SIZE at a time in a
+        single transaction which adds the addresses of all the ports of the
+        batch to each address set at once. If the transaction of a batch
+        fails, its ports are created one by one.
+
+        Used by the journal and the DB sync only: ML2 calls
+        create_port_postcommit once per port, even for a bulk port create,
+        so the API path without the journal creates the ports one by one.
+
+        :param ports: list of neutron ports
+        :returns: set of the ids of the ports which failed to be created
+        """
         admin_context = n_context.get_admin_context()
         sg_cache = {}
         subnet_cache = {}
+        failed_port_ids = set()
+        for i in range(0, len(ports), PORT_CREATE_BATCH_SIZE):
+            batch = []
+            for port in ports[i:i + PORT_CREATE_BATCH_SIZE]:
+                try:
+                    batch.append((port, self.get_ovn_port_options(port)))
+                except Exception:
+                    LOG.exception(_LE("Failed to get the OVN options of "
+                                      "port %s"), port['id'])
+                    failed_port_ids.add(port['id'])
+            if len(batch) > 1:
+                try:
+                    self._create_ports_in_ovn(batch, admin_context,
+                                              sg_cache, subnet_cache)
+                    continue
+                except Exception as e:
+                    LOG.warning(_LW("Failed to create %(count)d ports in "
+                                    "OVN at once, creating them one by one: "
+                                    "%(error)s"),
+                                {'count': len(batch), 'error': e})
+            for port, ovn_port_info in batch:
+                try:
+                    self._create_ports_in_ovn([(port, ovn_port_info)],
+                                              admin_context, sg_cache,
+                                              subnet_cache)
+                except Exception:
+                    LOG.exception(_LE("Failed to create port %s in OVN"),
+                                  port['id'])
+                    failed_port_ids.add(port['id'])
+        return failed_port_ids
+
+    def _create_ports_in_ovn(self, ports, admin_context, sg_cache,
+                             subnet_cache):
+        # The addresses of the ports to add to each address set
+        addrset_addresses = collections.OrderedDict()
+        # The ports to add to each port group
+        port_group_ports = collections.OrderedDict()
 
         with self._nb_ovn.transaction(check_error=True) as txn:
-            # The lport_name *must* be neutron port['id'].  It must match the
-            # iface-id set in the Interfaces table of the Open_vSwitch
-            # database which nova sets to be the port ID.
-            txn.add(self._nb_ovn.create_lswitch_port(
-                    lport_name=port['id'],
-                    lswitch_name=lswitch_name,
-                    addresses=ovn_port_info.addresses,
-                    external_ids=external_ids,
-                    parent_name=ovn_port_info.parent_name,
-                    tag=ovn_port_info.tag,
-                    enabled=port.get('admin_state_up'),
-                    options=ovn_port_info.options,
-                    type=ovn_port_info.type,
-                    port_security=ovn_port_info.port_security,
-                    dhcpv4_options=ovn_port_info.dhcpv4_options))
-
-            acls_new = ovn_acl.add_acls(self._plugin, admin_context,
-                                        port, sg_cache, subnet_cache)
-            for acl in acls_new:
-                txn.add(self._nb_ovn.add_acl(**acl))
-
-            sg_ids = port.get('security_groups', [])
-            if port.get('fixed_ips') and sg_ids:
-                addresses = ovn_acl.acl_port_ips(port)
-                # NOTE(rtheis): Fail port creation if the address set doesn't
-                # exist. This prevents ports from being created on any security
-                # groups out-of-sync between neutron and OVN.
-                for sg_id in sg_ids:
-                    for ip_version in addresses:
-                        if addresses[ip_version]:
-                            txn.add(self._nb_ovn.update_address_set(
-                                name=utils.ovn_addrset_name(sg_id, ip_version),
-                                addrs_add=addresses[ip_version],
-                                addrs_remove=None,
-                                if_exists=False))
+            for port, ovn_port_info in ports:
+                external_ids = {
+                    ovn_const.OVN_PORT_NAME_EXT_ID_KEY: port['name']}
+                # The lport_name *must* be neutron port['id'].  It must match
+                # the iface-id set in the Interfaces table of the Open_vSwitch
+                # database which nova sets to be the port ID.
+                txn.add(self._nb_ovn.create_lswitch_port(
+                        lport_name=port['id'],
+                        lswitch_name=utils.ovn_name(port['network_id']),
+                        addresses=ovn_port_info.addresses,
+                        external_ids=external_ids,
+                        parent_name=ovn_port_info.parent_name,
+                        tag=ovn_port_info.tag,
+                        enabled=port.get('admin_state_up'),
+                        options=ovn_port_info.options,
+                        type=ovn_port_info.type,
+                        port_security=ovn_port_info.port_security,
+                        dhcpv4_options=ovn_port_info.dhcpv4_options))
+
+                acls_new = ovn_acl.add_acls(self._plugin, admin_context,
+                                            port, sg_cache, subnet_cache)
+                for acl in acls_new:
+                    txn.add(self._nb_ovn.add_acl(**acl))
+
+                sg_ids = port.get('security_groups', [])
+                if port.get('fixed_ips') and sg_ids:
+                    addresses = ovn_acl.acl_port_ips(port)
+                    for sg_id in sg_ids:
+                        for ip_version in addresses:
+                            if addresses[ip_version]:
+                                addrset_addresses.setdefault(
+                                    utils.ovn_addrset_name(sg_id, ip_version),
+                                    []).extend(addresses[ip_version])
+
+                if self.port_groups:
+                    for pg_name in ovn_acl.acl_port_groups(port):
+                        port_group_ports.setdefault(pg_name, []).append(
+                            port['id'])
+
+            # NOTE(rtheis): Fail port creation if the address set doesn't
+            # exist. This prevents ports from being created on any security
+            # groups out-of-sync between neutron and OVN.
+            for name, addresses in addrset_addresses.items():
+                txn.add(self._nb_ovn.update_address_set(
+                    name=name,
+                    addrs_add=addresses,
+                    addrs_remove=None,
+                    if_exists=False))
+
+            for pg_name, lports in port_group_ports.items():
+                txn.add(self._nb_ovn.update_port_group_ports(
+                    pg_name, lports, None, if_exists=False))
+
+        if self.port_latency_tracker is not None:
+            for port, ovn_port_info in ports:
+                self.port_latency_tracker.record(port['id'],
+                                                 port_latency.NB_COMMIT)
 
     def update_port_precommit(self, context):
         """Update resources of a port.
@@ -672,6 +843,9 @@ class OVNMechanismDriver(driver_api.MechanismDriver):
         state changes that it does not know or care about.
         """
         self.validate_and_get_data_from_binding_profile(context.current)
+        if self.journal_mode:
+            self._record_journal_entry(context, ovn_const.JOURNAL_PORT,
+                                       ovn_const.JOURNAL_UPDATE)
 
     def update_port_postcommit(self, context):
         """Update a port.
@@ -689,9 +863,9 @@ class OVNMechanismDriver(driver_api.MechanismDriver):
         state. It is up to the mechanism driver to ignore state or
         state changes that it does not know or care about.
         """
-        port = context.current
-        original_port = context.original
-        self.update_port(port, original_port)
+        if self.journal_mode:
+            return
+        self.update_port(context.current, context.original)
 
     def update_port(self, port, original_port, qos_options=None):
         ovn_port_info = self.get_ovn_port_options(port, qos_options)
@@ -740,6 +914,19 @@ class OVNMechanismDriver(driver_api.MechanismDriver):
                                                  {port['id']: acls_new},
                                                  need_compare=True))
 
+            # Move the port to the port groups of its security groups.
+            if self.port_groups and (detached_sg_ids or attached_sg_ids):
+                pg_names = ovn_acl.acl_port_groups(port)
+                old_pg_names = ovn_acl.acl_port_groups(original_port)
+                for pg_name in pg_names:
+                    if pg_name not in old_pg_names:
+                        txn.add(self._nb_ovn.update_port_group_ports(
+                            pg_name, [port['id']], None, if_exists=False))
+                for pg_name in old_pg_names:
+                    if pg_name not in pg_names:
+                        txn.add(self._nb_ovn.update_port_group_ports(
+                            pg_name, None, [port['id']]))
+
             # Refresh address sets for changed security groups or fixed IPs.
             if (len(port.get('fixed_ips')) != 0 or
                     len(original_port.get('fixed_ips')) != 0):
@@ -849,6 +1036,20 @@ class OVNMechanismDriver(driver_api.MechanismDriver):
 
         return self._nb_ovn.get_port_dhcp_options(subnet_id, port['id'])
 
+    def delete_port_precommit(self, context):
+        """Delete resources of a port.
+
+        :param context: PortContext instance describing the current
+        state of the port, prior to the call to delete it.
+
+        Called inside transaction context on session. Runtime errors
+        are not expected, but raising an exception will result in
+        rollback of the transaction.
+        """
+        if self.journal_mode:
+            self._record_journal_entry(context, ovn_const.JOURNAL_PORT,
+                                       ovn_const.JOURNAL_DELETE)
+
     def delete_port_postcommit(self, context):
         """Delete a port.
 
@@ -861,7 +1062,11 @@ class OVNMechanismDriver(driver_api.MechanismDriver):
         expected, and will not prevent the resource from being
         deleted.
         """
-        port = context.current
+        if self.journal_mode:
+            return
+        self._delete_port(context.current)
+
+    def _delete_port(self, port):
         with self._nb_ovn.transaction(check_error=True) as txn:
             txn.add(self._nb_ovn.delete_lswitch_port(port['id'],
                     utils.ovn_name(port['network_id'])))
@@ -885,6 +1090,35 @@ class OVNMechanismDriver(driver_api.MechanismDriver):
             if cmd:
                 txn.add(cmd)
 
+    def _record_journal_entry(self, context, object_type, operation):
+        data = {'current': context.current}
+        if operation == ovn_const.JOURNAL_UPDATE:
+            data['original'] = context.original
+        journal.record(context._plugin_context, object_type,
+                       context.current['id'], operation, data)
+
+    def apply_journal_entry(self, object_type, operation, data):
+        """Apply a network or port change recorded in the journal
+
+        The change is applied with the data of the resource when it was
+        recorded, like the postcommit would have.
+        """
+        current = data['current']
+        if object_type == ovn_const.JOURNAL_NETWORK:
+            if operation == ovn_const.JOURNAL_CREATE:
+                self._create_network(current)
+            elif operation == ovn_const.JOURNAL_UPDATE:
+                self._update_network(current, data['original'])
+            else:
+                self._delete_network(current)
+        elif object_type == ovn_const.JOURNAL_PORT:
+            if operation == ovn_const.JOURNAL_CREATE:
+                self._create_port(current)
+            elif operation == ovn_const.JOURNAL_UPDATE:
+                self.update_port(current, data['original'])
+            else:
+                self._delete_port(current)
+
     def bind_port(self, context):
         """Attempt to bind a port.
 
@@ -979,11 +1213,21 @@ class OVNMechanismDriver(driver_api.MechanismDriver):
         # port is up. Any provisioning block (possibly added during port
         # creation or when OVN reports that the port is down) must be removed.
         LOG.info(_LI("OVN reports status up for port: %s"), port_id)
+        admin_context = n_context.get_admin_context()
         provisioning_blocks.provisioning_complete(
-            n_context.get_admin_context(),
+            admin_context,
             port_id,
             resources.PORT,
             provisioning_blocks.L2_AGENT_ENTITY)
+        if (self.port_latency_tracker is not None and
+                self.port_latency_tracker.is_tracked(port_id)):
+            # The port is only set active once all its provisioning blocks
+            # are removed, and if it is bound.
+            port_db = admin_context.session.query(
+                models_v2.Port.status).filter_by(id=port_id).first()
+            if port_db and port_db.status == const.PORT_STATUS_ACTIVE:
+                self.port_latency_tracker.record(
+                    port_id, port_latency.PROVISIONING_COMPLETE)
 
     def set_port_status_down(self, port_id):
         # Port provisioning is required now that OVN has reported that the
@@ -1004,6 +1248,59 @@ class OVNMechanismDriver(driver_api.MechanismDriver):
             LOG.debug("Port not found during OVN status down report: %s",
                       port_id)
 
+    def set_port_statuses(self, port_states):
+        """Reconcile the status of the neutron ports with OVN in bulk
+
+        Used for the initial dump of the Logical_Switch_Port table, where
+        most of the ports are already in the right state. The statuses are
+        fetched with one query per batch of ports and only the ports whose
+        status differs go through the provisioning blocks and ML2 updates.
+
+        :param port_states: dictionary of the OVN 'up' state by port id
+        """
+        admin_context = n_context.get_admin_context()
+        port_ids = list(port_states)
+        up_port_ids = []
+        down_port_ids = []
+        for i in range(0, len(port_ids), PORT_STATUS_BATCH_SIZE):
+            query = admin_context.session.query(
+                models_v2.Port.id, models_v2.Port.status).filter(
+                    models_v2.Port.id.in_(
+                        port_ids[i:i + PORT_STATUS_BATCH_SIZE]))
+            for port_id, status in query:
+                up = port_states[port_id]
+                if up and status != const.PORT_STATUS_ACTIVE:
+                    up_port_ids.append(port_id)
+                elif not up and status != const.PORT_STATUS_DOWN:
+                    down_port_ids.append(port_id)
+        LOG.info(_LI("OVN reports status up for %(up)d and down for "
+                     "%(down)d out of sync ports"),
+                 {'up': len(up_port_ids), 'down': len(down_port_ids)})
+
+        for port_id in up_port_ids:
+            provisioning_blocks.provisioning_complete(
+                admin_context, port_id, resources.PORT,
+                provisioning_blocks.L2_AGENT_ENTITY)
+        for i in range(0, len(down_port_ids), PORT_STATUS_BATCH_SIZE):
+            self._set_port_statuses_down(
+                admin_context, down_port_ids[i:i + PORT_STATUS_BATCH_SIZE])
+
+    def _set_port_statuses_down(self, admin_context, port_ids):
+        # Same as set_port_status_down, with the ports of the batch fetched
+        # at once.
+        ports = self._plugin.get_ports(admin_context,
+                                       filters={'id': port_ids})
+        for port in ports:
+            try:
+                port['status'] = const.PORT_STATUS_DOWN
+                self._insert_port_provisioning_block(admin_context, port)
+                self._plugin.update_port_status(admin_context,
+                                                port['id'],
+                                                const.PORT_STATUS_DOWN)
+            except (os_db_exc.DBReferenceError, n_exc.PortNotFound):
+                LOG.debug("Port not found during OVN status down report: %s",
+                          port['id'])
+
     def update_segment_host_mapping(self, host, phy_nets):
         """Update SegmentHostMapping in DB"""
         if not host:
@@ -1029,8 +1326,6 @@ class OVNMechanismDriver(driver_api.MechanismDriver):
         if not phynet:
             return
 
-        host_phynets_map = self._sb_ovn.get_chassis_hostname_and_physnets()
-        hosts = {host for host, phynets in six.iteritems(host_phynets_map)
-                 if phynet in phynets}
+        hosts = self._sb_ovn.get_chassis_hostnames_for_physnet(phynet)
         segment_service_db.map_segment_to_hosts(context, segment.id, hosts)
 
@@ -14,6 +14,7 @@ from oslo_config import cfg
 
 from networking_ovn.common import config
 from networking_ovn.common.constants import OVN_ML2_MECH_DRIVER_NAME
+from networking_ovn.db import journal
 
 from neutron.callbacks import events
 from neutron.callbacks import registry
@@ -31,6 +32,8 @@ class OVNTrunkHandler(object):
         self.plugin_driver = plugin_driver
 
     def _set_sub_ports(self, parent_port, subports):
+        journal.wait_for_entries(
+            [parent_port] + [port.port_id for port in subports])
         _nb_ovn = self.plugin_driver._nb_ovn
         with _nb_ovn.transaction(check_error=True) as txn:
             for port in subports:
@@ -39,6 +42,7 @@ class OVNTrunkHandler(object):
                                                  tag=port.segmentation_id))
 
     def _unset_sub_ports(self, subports):
+        journal.wait_for_entries([port.port_id for port in subports])
         _nb_ovn = self.plugin_driver._nb_ovn
         with _nb_ovn.transaction(check_error=True) as txn:
             for port in subports:
@@ -11,6 +11,7 @@
 #    under the License.
 
 import abc
+import collections
 
 from datetime import datetime
 from eventlet import greenthread
@@ -76,6 +77,7 @@ class OvnNbSynchronizer(OvnDbSynchronizer):
 
         ctx = context.get_admin_context()
         self.sync_address_sets(ctx)
+        self.sync_port_groups(ctx)
         self.sync_networks_ports_and_dhcp_opts(ctx)
         self.sync_acls(ctx)
         self.sync_routers_and_rports(ctx)
@@ -92,31 +94,67 @@ class OvnNbSynchronizer(OvnDbSynchronizer):
         segid = self._get_attribute(net, pnet.SEGMENTATION_ID)
         self.ovn_driver.create_network_in_ovn(net, {}, physnet, segid)
 
-    def _create_port_in_ovn(self, ctx, port):
-        # Remove any old ACLs for the port to avoid creating duplicate ACLs.
-        self.ovn_api.delete_acl(
-            utils.ovn_name(port['network_id']),
-            port['id']).execute(check_error=True)
+    def _create_ports_in_ovn(self, ctx, ports):
+        # Remove any old ACLs for the ports to avoid creating duplicate ACLs.
+        with self.ovn_api.transaction(check_error=True) as txn:
+            for port in ports:
+                txn.add(self.ovn_api.delete_acl(
+                    utils.ovn_name(port['network_id']), port['id']))
 
-        # Create the port in OVN. This will include ACL and Address Set
+        # Create the ports in OVN. This will include ACL and Address Set
         # updates as needed.
-        ovn_port_info = self.ovn_driver.get_ovn_port_options(port)
-        self.ovn_driver.create_port_in_ovn(port, ovn_port_info)
+        return self.ovn_driver.create_ports_in_ovn(ports)
 
     def remove_common_acls(self, neutron_acls, nb_acls):
         """Take out common acls of the two acl dictionaries.
 
+        The acls are compared in their canonical form (see acl.acl_key) and
+        the copies of each acl are counted, so the cost is linear in the
+        number of acls. The NB acls are removed by match, so when an acl
+        has duplicates in NB, all its NB copies are left to remove and the
+        neutron acl is left to add back.
+
         @param   neutron_acls: neutron dictionary of port vs acls
         @type    neutron_acls: {}
         @param   nb_acls: nb dictionary of port vs acls
         @type    nb_acls: {}
-        @return: Nothing, original dictionary modified
+        @return: Counts of the acls to add, to remove and duplicated in NB,
+                 the original dictionaries are modified
+        @rtype:  {'add': int, 'remove': int, 'duplicate': int}
         """
-        for port in neutron_acls.keys():
-            for acl in list(neutron_acls[port]):
-                if port in nb_acls and acl in nb_acls[port]:
-                    neutron_acls[port].remove(acl)
-                    nb_acls[port].remove(acl)
+        counts = {'add': 0, 'remove': 0, 'duplicate': 0}
+        for port in set(neutron_acls) | set(nb_acls):
+            neutron_port_acls = collections.OrderedDict()
+            for acl in neutron_acls.get(port, []):
+                neutron_port_acls.setdefault(
+                    acl_utils.acl_key(acl), []).append(acl)
+            nb_port_acls = collections.OrderedDict()
+            for acl in nb_acls.get(port, []):
+                nb_port_acls.setdefault(
+                    acl_utils.acl_key(acl), []).append(acl)
+
+            acls_to_add = []
+            acls_to_remove = []
+            for key, acls in six.iteritems(neutron_port_acls):
+                nb_copies = nb_port_acls.get(key, [])
+                extra_copies = len(nb_copies) - len(acls)
+                if extra_copies > 0:
+                    counts['duplicate'] += extra_copies
+                    acls_to_add.extend(acls)
+                    acls_to_remove.extend(nb_copies)
+                elif extra_copies < 0:
+                    counts['add'] -= extra_copies
+                    acls_to_add.extend(acls[len(nb_copies):])
+            for key, nb_copies in six.iteritems(nb_port_acls):
+                if key not in neutron_port_acls:
+                    counts['remove'] += len(nb_copies)
+                    acls_to_remove.extend(nb_copies)
+
+            if port in neutron_acls:
+                neutron_acls[port][:] = acls_to_add
+            if port in nb_acls:
+                nb_acls[port][:] = acls_to_remove
+        return counts
 
     def compute_address_set_difference(self, neutron_sgs, nb_sgs):
         neutron_sgs_name_set = set(neutron_sgs.keys())
@@ -219,6 +257,103 @@ class OvnNbSynchronizer(OvnDbSynchronizer):
             LOG.debug('Address-Set-SYNC: transaction finished @ %s' %
                       str(datetime.now()))
 
+    def _compute_port_group_update(self, neutron_pg, nb_pg):
+        acls = dict((acl_utils.acl_key(acl), acl)
+                    for acl in neutron_pg['acls'])
+        nb_acls = dict((acl_utils.acl_key(acl), acl)
+                       for acl in nb_pg['acls'])
+        lports = set(neutron_pg['lports'])
+        nb_lports = set(nb_pg['ports'])
+        return {
+            'acls_add': [acl for key, acl in six.iteritems(acls)
+                         if key not in nb_acls],
+            'acls_remove': [acl for key, acl in six.iteritems(nb_acls)
+                            if key not in acls],
+            'lports_add': sorted(lports - nb_lports),
+            'lports_remove': sorted(nb_lports - lports)}
+
+    def sync_port_groups(self, ctx):
+        """Sync the Port Groups of the security groups between neutron and NB.
+
+        Only the ports already in the NB database are synced as members of
+        the port groups, the missing ports join their port groups when they
+        are created by sync_networks_ports_and_dhcp_opts.
+
+        @param ctx: neutron context
+        @type  ctx: object of type neutron.context.Context
+        @return: Nothing
+        """
+        if not (config.is_ovn_port_groups() and acl_utils.is_sg_enabled()):
+            return
+
+        LOG.debug('Port-Group-SYNC: started @ %s' % str(datetime.now()))
+
+        with ctx.session.begin(subtransactions=True):
+            db_sgs = self.core_plugin.get_security_groups(ctx)
+            db_ports = self.core_plugin.get_ports(ctx)
+
+        neutron_pgs = {const.OVN_DROP_PORT_GROUP_NAME: {
+            'name': const.OVN_DROP_PORT_GROUP_NAME,
+            'acls': acl_utils.drop_all_ip_traffic_for_port_group(),
+            'lports': [], 'external_ids': {}}}
+        for sg in db_sgs:
+            name = utils.ovn_port_group_name(sg['id'])
+            neutron_pgs[name] = {
+                'name': name,
+                'acls': acl_utils.port_group_acls_for_security_group(sg),
+                'lports': [],
+                'external_ids': {const.OVN_SG_EXT_ID_KEY: sg['id']}}
+
+        nb_lports = self.ovn_api.get_all_logical_switch_ports_ids()
+        for port in db_ports:
+            if port['id'] not in nb_lports:
+                continue
+            for name in acl_utils.acl_port_groups(port):
+                if name in neutron_pgs:
+                    neutron_pgs[name]['lports'].append(port['id'])
+
+        nb_pgs = self.ovn_api.get_port_groups()
+        pgnames_to_add = [name for name in neutron_pgs if name not in nb_pgs]
+        pgnames_to_delete = [name for name in nb_pgs
+                             if name not in neutron_pgs]
+        pgs_to_update = {}
+        for name, nb_pg in six.iteritems(nb_pgs):
+            if name not in neutron_pgs:
+                continue
+            update = self._compute_port_group_update(neutron_pgs[name],
+                                                     nb_pg)
+            if any(six.itervalues(update)):
+                pgs_to_update[name] = update
+
+        LOG.debug('Port_Groups added %d, removed %d, updated %d',
+                  len(pgnames_to_add), len(pgnames_to_delete),
+                  len(pgs_to_update))
+
+        if self.mode == SYNC_MODE_REPAIR:
+            LOG.debug('Port-Group-SYNC: transaction started @ %s' %
+                      str(datetime.now()))
+            with self.ovn_api.transaction(check_error=True) as txn:
+                for pgname in pgnames_to_add:
+                    pg = neutron_pgs[pgname]
+                    txn.add(self.ovn_api.create_port_group(
+                        pgname, acls=pg['acls'], lports=pg['lports'],
+                        external_ids=pg['external_ids']))
+                for pgname, update in six.iteritems(pgs_to_update):
+                    if update['acls_remove']:
+                        txn.add(self.ovn_api.delete_port_group_acls(
+                            pgname, update['acls_remove']))
+                    if update['acls_add']:
+                        txn.add(self.ovn_api.add_port_group_acls(
+                            pgname, update['acls_add']))
+                    if update['lports_add'] or update['lports_remove']:
+                        txn.add(self.ovn_api.update_port_group_ports(
+                            pgname, update['lports_add'],
+                            update['lports_remove']))
+                for pgname in pgnames_to_delete:
+                    txn.add(self.ovn_api.delete_port_group(pgname))
+            LOG.debug('Port-Group-SYNC: transaction finished @ %s' %
+                      str(datetime.now()))
+
     def sync_acls(self, ctx):
         """Sync ACLs between neutron and NB.
 
@@ -256,29 +391,35 @@ class OvnNbSynchronizer(OvnDbSynchronizer):
 
         nb_acls = self.get_acls(ctx)
 
-        self.remove_common_acls(neutron_acls, nb_acls)
+        counts = self.remove_common_acls(neutron_acls, nb_acls)
 
-        LOG.debug('ACLs-to-be-added %d ACLs-to-be-removed %d' %
-                  (len(list(itertools.chain(*six.itervalues(neutron_acls)))),
-                   len(list(itertools.chain(*six.itervalues(nb_acls))))))
+        LOG.debug('ACLs-to-be-added %(add)d ACLs-to-be-removed %(remove)d '
+                  'ACLs-duplicated-in-NB %(duplicate)d', counts)
 
         if self.mode == SYNC_MODE_REPAIR:
             LOG.debug('ACL-SYNC: transaction started @ %s' %
                       str(datetime.now()))
             with self.ovn_api.transaction(check_error=True) as txn:
-                for acla in list(itertools.chain(
-                                 *six.itervalues(neutron_acls))):
-                    txn.add(self.ovn_api.add_acl(**acla))
+                # The NB acls are removed before the neutron acls are added,
+                # since the removal of a duplicated acl matches all copies.
+                # Each match is removed once, the copies are already gone.
+                removed_matches = set()
                 for aclr in list(itertools.chain(*six.itervalues(nb_acls))):
                     # Both lswitch and lport aren't needed within the ACL.
                     lswitchr = aclr.pop('lswitch').replace('neutron-', '')
                     lportr = aclr.pop('lport')
+                    if (lswitchr, aclr['match']) in removed_matches:
+                        continue
+                    removed_matches.add((lswitchr, aclr['match']))
                     aclr_dict = {lportr: aclr}
                     txn.add(self.ovn_api.update_acls([lswitchr],
                                                      [lportr],
                                                      aclr_dict,
                                                      need_compare=False,
                                                      is_add_acl=False))
+                for acla in list(itertools.chain(
+                                 *six.itervalues(neutron_acls))):
+                    txn.add(self.ovn_api.add_acl(**acla))
             LOG.debug('ACL-SYNC: transaction finished @ %s' %
                       str(datetime.now()))
 
@@ -608,18 +749,21 @@ class OvnNbSynchronizer(OvnDbSynchronizer):
         for port_id, port in db_ports.items():
             LOG.warning(_LW("Port found in Neutron but not in OVN "
                             "DB, port_id=%s"), port['id'])
-            if self.mode == SYNC_MODE_REPAIR:
-                try:
-                    LOG.debug('Creating the port %s in OVN NB DB',
-                              port['id'])
-                    self._create_port_in_ovn(ctx, port)
-                    if port_id in ovn_all_dhcp_options['ports']:
-                        _, lsp_opts = utils.get_lsp_dhcpv4_opts(port)
-                        if lsp_opts:
-                            ovn_all_dhcp_options['ports'].pop(port_id)
-                except RuntimeError:
+        if db_ports and self.mode == SYNC_MODE_REPAIR:
+            LOG.debug('Creating %d ports in OVN NB DB', len(db_ports))
+            try:
+                failed_port_ids = self._create_ports_in_ovn(
+                    ctx, list(db_ports.values()))
+            except RuntimeError:
+                failed_port_ids = set(db_ports)
+            for port_id, port in db_ports.items():
+                if port_id in failed_port_ids:
                     LOG.warning(_LW("Create port in OVN NB failed for"
-                                    " port %s"), port['id'])
+                                    " port %s"), port_id)
+                elif port_id in ovn_all_dhcp_options['ports']:
+                    _, lsp_opts = utils.get_lsp_dhcpv4_opts(port)
+                    if lsp_opts:
+                        ovn_all_dhcp_options['ports'].pop(port_id)
 
         with self.ovn_api.transaction(check_error=True) as txn:
             for lswitch in del_lswitchs_list:
@@ -10,13 +10,17 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
+
 import six
 
 from neutron.agent.ovsdb.native import commands
 from neutron.agent.ovsdb.native import idlutils
 
 from networking_ovn._i18n import _
+from networking_ovn.common import acl as ovn_acl
 from networking_ovn.common import utils
+from networking_ovn.ovsdb import row_index
 
 
 # TODO(rtheis): These wrapper functions are't needed once OpenStack
@@ -94,8 +98,8 @@ class AddLSwitchCommand(commands.BaseCommand):
 
     def run_idl(self, txn):
         if self.may_exist:
-            lswitch = idlutils.row_by_value(self.api.idl, 'Logical_Switch',
-                                            'name', self.name, None)
+            lswitch = row_index.row_by_name(self.api.idl, 'Logical_Switch',
+                                            self.name, None)
             if lswitch:
                 return
         row = txn.insert(self.api._tables['Logical_Switch'])
@@ -112,8 +116,8 @@ class DelLSwitchCommand(commands.BaseCommand):
 
     def run_idl(self, txn):
         try:
-            lswitch = idlutils.row_by_value(self.api.idl, 'Logical_Switch',
-                                            'name', self.name)
+            lswitch = row_index.row_by_name(self.api.idl, 'Logical_Switch',
+                                            self.name)
         except idlutils.RowNotFound:
             if self.if_exists:
                 return
@@ -133,8 +137,8 @@ class LSwitchSetExternalIdCommand(commands.BaseCommand):
 
     def run_idl(self, txn):
         try:
-            lswitch = idlutils.row_by_value(self.api.idl, 'Logical_Switch',
-                                            'name', self.name)
+            lswitch = row_index.row_by_name(self.api.idl, 'Logical_Switch',
+                                            self.name)
 
         except idlutils.RowNotFound:
             if self.if_exists:
@@ -159,16 +163,16 @@ class AddLPortChainCommand(commands.BaseCommand):
 
     def run_idl(self, txn):
         try:
-            lswitch = idlutils.row_by_value(self.api.idl, 'Logical_Switch',
-                                            'name', self.lswitch)
+            lswitch = row_index.row_by_name(self.api.idl, 'Logical_Switch',
+                                            self.lswitch)
             port_chains = getattr(lswitch, 'port_chains', [])
 
         except idlutils.RowNotFound:
             msg = _("Logical Switch %s does not exist") % self.lswitch
             raise RuntimeError(msg)
         if self.may_exist:
-            port_chain = idlutils.row_by_value(self.api.idl,
-                                               'Logical_Port_Chain', 'name',
+            port_chain = row_index.row_by_name(self.api.idl,
+                                               'Logical_Port_Chain',
                                                self.lport_chain, None)
             if port_chain:
                 return
@@ -190,11 +194,11 @@ class DelLPortChainCommand(commands.BaseCommand):
 
     def run_idl(self, txn):
         try:
-            lport_chain = idlutils.row_by_value(self.api.idl,
+            lport_chain = row_index.row_by_name(self.api.idl,
                                                 'Logical_Port_Chain',
-                                                'name', self.lport_chain)
-            lswitch = idlutils.row_by_value(self.api.idl, 'Logical_Switch',
-                                            'name', self.lswitch)
+                                                self.lport_chain)
+            lswitch = row_index.row_by_name(self.api.idl, 'Logical_Switch',
+                                            self.lswitch)
             port_chains = getattr(lswitch, 'port_chains', [])
         except idlutils.RowNotFound:
             if self.if_exists:
@@ -217,9 +221,9 @@ class SetLogicalPortChainCommand(commands.BaseCommand):
 
     def run_idl(self, txn):
         try:
-            lport_chain = idlutils.row_by_value(self.api.idl,
+            lport_chain = row_index.row_by_name(self.api.idl,
                                                 'Logical_Port_Chain',
-                                                'name', self.lport_chain)
+                                                self.lport_chain)
         except idlutils.RowNotFound:
             if self.if_exists:
                 return
@@ -241,17 +245,17 @@ class AddLogicalPortPairGroupCommand(commands.BaseCommand):
 
     def run_idl(self, txn):
         try:
-            lport_chain = idlutils.row_by_value(self.api.idl,
+            lport_chain = row_index.row_by_name(self.api.idl,
                                                 'Logical_Port_Chain',
-                                                'name', self.lport_chain)
+                                                self.lport_chain)
             port_pair_groups = getattr(lport_chain,
                                        'port_pair_groups', [])
         except idlutils.RowNotFound:
             msg = _("Logical Port Chain %s does not exist") % self.lport_chain
             raise RuntimeError(msg)
         if self.may_exist:
-            port_pair_group = idlutils.row_by_value(
-                self.api.idl, 'Logical_Port_Pair_Group', 'name',
+            port_pair_group = row_index.row_by_name(
+                self.api.idl, 'Logical_Port_Pair_Group',
                 self.lport_pair_group, None)
             if port_pair_group:
                 return
@@ -277,9 +281,9 @@ class SetLogicalPortPairGroupCommand(commands.BaseCommand):
 
     def run_idl(self, txn):
         try:
-            port_pair_group = idlutils.row_by_value(
+            port_pair_group = row_index.row_by_name(
                 self.api.idl, 'Logical_Port_Pair_Group',
-                'name', self.lport_pair_group)
+                self.lport_pair_group)
             port_pairs = getattr(self.lport_pair_group, 'port_pairs', [])
         except idlutils.RowNotFound:
             if self.if_exists:
@@ -301,12 +305,12 @@ class DelLogicalPortPairGroupCommand(commands.BaseCommand):
 
     def run_idl(self, txn):
         try:
-            lport_pair_group = idlutils.row_by_value(
+            lport_pair_group = row_index.row_by_name(
                 self.api.idl, 'Logical_Port_Pair_Group',
-                'name', self.lport_pair_group)
-            lport_chain = idlutils.row_by_value(self.api.idl,
+                self.lport_pair_group)
+            lport_chain = row_index.row_by_name(self.api.idl,
                                                 'Logical_Port_Chain',
-                                                'name', self.lport_chain)
+                                                self.lport_chain)
             port_pair_groups = getattr(lport_chain, 'port_pair_groups', [])
         except idlutils.RowNotFound:
             if self.if_exists:
@@ -334,14 +338,14 @@ class AddLSwitchPortCommand(commands.BaseCommand):
 
     def run_idl(self, txn):
         try:
-            lswitch = idlutils.row_by_value(self.api.idl, 'Logical_Switch',
-                                            'name', self.lswitch)
+            lswitch = row_index.row_by_name(self.api.idl, 'Logical_Switch',
+                                            self.lswitch)
         except idlutils.RowNotFound:
             msg = _("Logical Switch %s does not exist") % self.lswitch
             raise RuntimeError(msg)
         if self.may_exist:
-            port = idlutils.row_by_value(self.api.idl,
-                                         'Logical_Switch_Port', 'name',
+            port = row_index.row_by_name(self.api.idl,
+                                         'Logical_Switch_Port',
                                          self.lport, None)
             if port:
                 return
@@ -363,8 +367,8 @@ class SetLSwitchPortCommand(commands.BaseCommand):
 
     def run_idl(self, txn):
         try:
-            port = idlutils.row_by_value(self.api.idl, 'Logical_Switch_Port',
-                                         'name', self.lport)
+            port = row_index.row_by_name(self.api.idl, 'Logical_Switch_Port',
+                                         self.lport)
         except idlutils.RowNotFound:
             if self.if_exists:
                 return
@@ -385,6 +389,11 @@ class SetLSwitchPortCommand(commands.BaseCommand):
         for col, val in self.columns.items():
             setattr(port, col, val)
 
+    def merge(self, command):
+        """Merge a later update of the same port into this command"""
+        self.columns.update(command.columns)
+        self.if_exists = self.if_exists and command.if_exists
+
 
 class DelLSwitchPortCommand(commands.BaseCommand):
     def __init__(self, api, lport, lswitch, if_exists):
@@ -395,10 +404,10 @@ class DelLSwitchPortCommand(commands.BaseCommand):
 
     def run_idl(self, txn):
         try:
-            lport = idlutils.row_by_value(self.api.idl, 'Logical_Switch_Port',
-                                          'name', self.lport)
-            lswitch = idlutils.row_by_value(self.api.idl, 'Logical_Switch',
-                                            'name', self.lswitch)
+            lport = row_index.row_by_name(self.api.idl, 'Logical_Switch_Port',
+                                          self.lport)
+            lswitch = row_index.row_by_name(self.api.idl, 'Logical_Switch',
+                                            self.lswitch)
         except idlutils.RowNotFound:
             if self.if_exists:
                 return
@@ -419,15 +428,15 @@ class AddLogicalPortPairCommand(commands.BaseCommand):
 
     def run_idl(self, txn):
         try:
-            lswitch = idlutils.row_by_value(self.api.idl, 'Logical_Switch',
-                                            'name', self.lswitch)
+            lswitch = row_index.row_by_name(self.api.idl, 'Logical_Switch',
+                                            self.lswitch)
             port_pairs = getattr(lswitch, 'port_pairs', [])
         except idlutils.RowNotFound:
             msg = _("Logical Switch %s does not exist") % self.lswitch
             raise RuntimeError(msg)
         if self.may_exist:
-            port_pair = idlutils.row_by_value(self.api.idl,
-                                              'Logical_Port_Pair', 'name',
+            port_pair = row_index.row_by_name(self.api.idl,
+                                              'Logical_Port_Pair',
                                               self.lport_pair, None)
             if port_pair:
                 return
@@ -452,9 +461,9 @@ class SetLogicalPortPairCommand(commands.BaseCommand):
 
     def run_idl(self, txn):
         try:
-            port_pair = idlutils.row_by_value(self.api.idl,
+            port_pair = row_index.row_by_name(self.api.idl,
                                               'Logical_Port_Pair',
-                                              'name', self.lport_pair)
+                                              self.lport_pair)
         except idlutils.RowNotFound:
             if self.if_exists:
                 return
@@ -475,14 +484,14 @@ class DelLogicalPortPairCommand(commands.BaseCommand):
 
     def run_idl(self, txn):
         try:
-            lport_pair = idlutils.row_by_value(self.api.idl,
+            lport_pair = row_index.row_by_name(self.api.idl,
                                                'Logical_Port_Pair',
-                                               'name', self.lport_pair)
-            lswitch = idlutils.row_by_value(self.api.idl, 'Logical_Switch',
-                                            'name', self.lswitch)
-            lppg = idlutils.row_by_value(self.api.idl,
+                                               self.lport_pair)
+            lswitch = row_index.row_by_name(self.api.idl, 'Logical_Switch',
+                                            self.lswitch)
+            lppg = row_index.row_by_name(self.api.idl,
                                          'Logical_Port_Pair_Group',
-                                         'name', self.lport_pair_group) 
+                                         self.lport_pair_group) 
             port_pairs = getattr(lswitch, 'port_pairs', [])
             port_pairs_ppg = getattr(lppg, 'port_pairs', [])
         except idlutils.RowNotFound:
@@ -512,16 +521,16 @@ class AddLogicalFlowClassifierCommand(commands.BaseCommand):
 
     def run_idl(self, txn):
         try:
-            port_chain = idlutils.row_by_value(self.api.idl,
+            port_chain = row_index.row_by_name(self.api.idl,
                                                'Logical_Port_Chain',
-                                               'name', self.lport_chain)
+                                               self.lport_chain)
             fc = getattr(port_chain, 'flow_classifier', [])
         except idlutils.RowNotFound:
             msg = _("Logical port chain %s does not exist") % self.lport_chain
             raise RuntimeError(msg)
         if self.may_exist:
-            flow_classifier = idlutils.row_by_value(
-                self.api.idl, 'Logical_Flow_Classifier', 'name',
+            flow_classifier = row_index.row_by_name(
+                self.api.idl, 'Logical_Flow_Classifier',
                 self.lflow_classifier, None)
             if flow_classifier:
                 return
@@ -546,9 +555,9 @@ class SetLogicalFlowClassifierCommand(commands.BaseCommand):
 
     def run_idl(self, txn):
         try:
-            flow_classifier = idlutils.row_by_value(
+            flow_classifier = row_index.row_by_name(
                 self.api.idl, 'Logical_Flow_Classifier',
-                'name', self.lflow_classifier)
+                self.lflow_classifier)
         except idlutils.RowNotFound:
             if self.if_exists:
                 return
@@ -569,12 +578,12 @@ class DelLogicalFlowClassifierCommand(commands.BaseCommand):
 
     def run_idl(self, txn):
         try:
-            lflow_classifier = idlutils.row_by_value(
+            lflow_classifier = row_index.row_by_name(
                 self.api.idl, 'Logical_Flow_Classifier',
-                'name', self.lflow_classifier)
-            port_chain = idlutils.row_by_value(self.api.idl,
+                self.lflow_classifier)
+            port_chain = row_index.row_by_name(self.api.idl,
                                                'Logical_Port_Chain',
-                                               'name', self.lport_chain)
+                                               self.lport_chain)
             flow_classifier = getattr(port_chain, 'flow_classifier', [])
         except idlutils.RowNotFound:
             if self.if_exists:
@@ -601,8 +610,8 @@ class AddLRouterCommand(commands.BaseCommand):
 
     def run_idl(self, txn):
         if self.may_exist:
-            lrouter = idlutils.row_by_value(self.api.idl, 'Logical_Router',
-                                            'name', self.name, None)
+            lrouter = row_index.row_by_name(self.api.idl, 'Logical_Router',
+                                            self.name, None)
             if lrouter:
                 return
 
@@ -621,8 +630,8 @@ class UpdateLRouterCommand(commands.BaseCommand):
 
     def run_idl(self, txn):
         try:
-            lrouter = idlutils.row_by_value(self.api.idl, 'Logical_Router',
-                                            'name', self.name, None)
+            lrouter = row_index.row_by_name(self.api.idl, 'Logical_Router',
+                                            self.name, None)
         except idlutils.RowNotFound:
             if self.if_exists:
                 return
@@ -643,8 +652,8 @@ class DelLRouterCommand(commands.BaseCommand):
 
     def run_idl(self, txn):
         try:
-            lrouter = idlutils.row_by_value(self.api.idl, 'Logical_Router',
-                                            'name', self.name)
+            lrouter = row_index.row_by_name(self.api.idl, 'Logical_Router',
+                                            self.name)
         except idlutils.RowNotFound:
             if self.if_exists:
                 return
@@ -664,14 +673,14 @@ class AddLRouterPortCommand(commands.BaseCommand):
     def run_idl(self, txn):
 
         try:
-            lrouter = idlutils.row_by_value(self.api.idl, 'Logical_Router',
-                                            'name', self.lrouter)
+            lrouter = row_index.row_by_name(self.api.idl, 'Logical_Router',
+                                            self.lrouter)
         except idlutils.RowNotFound:
             msg = _("Logical Router %s does not exist") % self.lrouter
             raise RuntimeError(msg)
         try:
-            idlutils.row_by_value(self.api.idl, 'Logical_Router_Port',
-                                  'name', self.name)
+            row_index.row_by_name(self.api.idl, 'Logical_Router_Port',
+                                  self.name)
             # The LRP entry with certain name has already exist, raise an
             # exception to notice caller. It's caller's responsibility to
             # call UpdateLRouterPortCommand to get LRP entry processed
@@ -696,9 +705,9 @@ class UpdateLRouterPortCommand(commands.BaseCommand):
 
     def run_idl(self, txn):
         try:
-            lrouter_port = idlutils.row_by_value(self.api.idl,
+            lrouter_port = row_index.row_by_name(self.api.idl,
                                                  'Logical_Router_Port',
-                                                 'name', self.name)
+                                                 self.name)
         except idlutils.RowNotFound:
             if self.if_exists:
                 return
@@ -720,17 +729,17 @@ class DelLRouterPortCommand(commands.BaseCommand):
 
     def run_idl(self, txn):
         try:
-            lrouter_port = idlutils.row_by_value(self.api.idl,
+            lrouter_port = row_index.row_by_name(self.api.idl,
                                                  'Logical_Router_Port',
-                                                 'name', self.name)
+                                                 self.name)
         except idlutils.RowNotFound:
             if self.if_exists:
                 return
             msg = _("Logical Router Port %s does not exist") % self.name
             raise RuntimeError(msg)
         try:
-            lrouter = idlutils.row_by_value(self.api.idl, 'Logical_Router',
-                                            'name', self.lrouter)
+            lrouter = row_index.row_by_name(self.api.idl, 'Logical_Router',
+                                            self.lrouter)
         except idlutils.RowNotFound:
             msg = _("Logical Router %s does not exist") % self.lrouter
             raise RuntimeError(msg)
@@ -746,8 +755,8 @@ class SetLRouterPortInLSwitchPortCommand(commands.BaseCommand):
 
     def run_idl(self, txn):
         try:
-            port = idlutils.row_by_value(self.api.idl, 'Logical_Switch_Port',
-                                         'name', self.lswitch_port)
+            port = row_index.row_by_name(self.api.idl, 'Logical_Switch_Port',
+                                         self.lswitch_port)
         except idlutils.RowNotFound:
             msg = _("Logical Switch Port %s does not "
                     "exist") % self.lswitch_port
@@ -767,8 +776,8 @@ class AddACLCommand(commands.BaseCommand):
 
     def run_idl(self, txn):
         try:
-            lswitch = idlutils.row_by_value(self.api.idl, 'Logical_Switch',
-                                            'name', self.lswitch)
+            lswitch = row_index.row_by_name(self.api.idl, 'Logical_Switch',
+                                            self.lswitch)
         except idlutils.RowNotFound:
             msg = _("Logical Switch %s does not exist") % self.lswitch
             raise RuntimeError(msg)
@@ -789,8 +798,8 @@ class DelACLCommand(commands.BaseCommand):
 
     def run_idl(self, txn):
         try:
-            lswitch = idlutils.row_by_value(self.api.idl, 'Logical_Switch',
-                                            'name', self.lswitch)
+            lswitch = row_index.row_by_name(self.api.idl, 'Logical_Switch',
+                                            self.lswitch)
         except idlutils.RowNotFound:
             if self.if_exists:
                 return
@@ -833,32 +842,21 @@ class UpdateACLsCommand(commands.BaseCommand):
         self.need_compare = need_compare
         self.is_add_acl = is_add_acl
 
-    def _acl_list_sub(self, acl_list1, acl_list2):
-        """Compute the elements in acl_list1 but not in acl_list2.
-
-        If acl_list1 and acl_list2 were sets, the result of this routine
-        could be thought of as acl_list1 - acl_list2. Note that acl_list1
-        and acl_list2 cannot actually be sets as they contain dictionary
-        items i.e. set([{'a':1}) doesn't work.
-        """
-        acl_diff = []
-        for acl in acl_list1:
-            if acl not in acl_list2:
-                acl_diff.append(acl)
-        return acl_diff
-
     def _compute_acl_differences(self, port_list, acl_old_values_dict,
                                  acl_new_values_dict, acl_obj_dict):
         """Compute the difference between the new and old sets of acls
 
+        The acls are compared in their canonical form (see acl.acl_key), so
+        the cost is linear in the number of old and new acls.
+
         @param port_list: Iterator of a List of ports
         @type port_list: []
         @param acl_old_values_dict: Dictionary of old acl values indexed
                                     by port id
         @param acl_new_values_dict: Dictionary of new acl values indexed
                                     by port id
-        @param acl_obj_dict: Dictionary of acl objects indexed by the acl
-                             value in string format.
+        @param acl_obj_dict: Dictionary of lists of acl objects indexed by
+                             the canonical form of the acl.
         @var acl_del_objs_dict: Dictionary of acl objects to be deleted
                                 indexed by the lswitch.
         @var acl_add_values_dict: Dictionary of acl values to be added
@@ -871,15 +869,23 @@ class UpdateACLsCommand(commands.BaseCommand):
         acl_add_values_dict = {}
         for port in port_list:
             lswitch_name = port['network_id']
-            acls_old = acl_old_values_dict.get(port['id'], [])
-            acls_new = acl_new_values_dict.get(port['id'], [])
-            acls_del = self._acl_list_sub(acls_old, acls_new)
-            acls_add = self._acl_list_sub(acls_new, acls_old)
+            # Ordered dictionaries keep the acls in order while giving the
+            # constant time lookups of sets.
+            acls_old = collections.OrderedDict.fromkeys(
+                ovn_acl.acl_key(acl)
+                for acl in acl_old_values_dict.get(port['id'], []))
+            acls_new = collections.OrderedDict(
+                (ovn_acl.acl_key(acl), acl)
+                for acl in acl_new_values_dict.get(port['id'], []))
             acl_del_objs = acl_del_objs_dict.setdefault(lswitch_name, [])
-            for acl in acls_del:
-                acl_del_objs.append(acl_obj_dict[str(acl)])
+            for key in acls_old:
+                if key not in acls_new:
+                    # The NB database may hold duplicates of the acl
+                    acl_del_objs.extend(acl_obj_dict[key])
             acl_add_values = acl_add_values_dict.setdefault(lswitch_name, [])
-            for acl in acls_add:
+            for key, acl in six.iteritems(acls_new):
+                if key in acls_old:
+                    continue
                 # Remove lport and lswitch columns
                 del acl['lswitch']
                 del acl['lport']
@@ -890,8 +896,8 @@ class UpdateACLsCommand(commands.BaseCommand):
         lswitch_ovsdb_dict = {}
         for switch_name in self.lswitch_names:
             switch_name = utils.ovn_name(switch_name)
-            lswitch = idlutils.row_by_value(self.api.idl, 'Logical_Switch',
-                                            'name', switch_name)
+            lswitch = row_index.row_by_name(self.api.idl, 'Logical_Switch',
+                                            switch_name)
             lswitch_ovsdb_dict[switch_name] = lswitch
         if self.is_add_acl:
             acl_add_values_dict = {}
@@ -921,14 +927,15 @@ class UpdateACLsCommand(commands.BaseCommand):
     def run_idl(self, txn):
 
         if self.need_compare:
-            # Get all relevant ACLs in 1 shot
+            # Get the existing ACLs of the ports in 1 shot
+            port_list = list(self.port_list)
             acl_values_dict, acl_obj_dict, lswitch_ovsdb_dict = \
-                self.api.get_acls_for_lswitches(self.lswitch_names)
+                self.api.get_acls_for_lports(self.lswitch_names, port_list)
 
             # Compute the difference between the new and old set of ACLs
             acl_del_objs_dict, acl_add_values_dict = \
                 self._compute_acl_differences(
-                    self.port_list, acl_values_dict,
+                    port_list, acl_values_dict,
                     self.acl_new_values_dict, acl_obj_dict)
         else:
             lswitch_ovsdb_dict, acl_del_objs_dict, acl_add_values_dict = \
@@ -971,8 +978,8 @@ class AddStaticRouteCommand(commands.BaseCommand):
 
     def run_idl(self, txn):
         try:
-            lrouter = idlutils.row_by_value(self.api.idl, 'Logical_Router',
-                                            'name', self.lrouter)
+            lrouter = row_index.row_by_name(self.api.idl, 'Logical_Router',
+                                            self.lrouter)
         except idlutils.RowNotFound:
             msg = _("Logical Router %s does not exist") % self.lrouter
             raise RuntimeError(msg)
@@ -993,8 +1000,8 @@ class DelStaticRouteCommand(commands.BaseCommand):
 
     def run_idl(self, txn):
         try:
-            lrouter = idlutils.row_by_value(self.api.idl, 'Logical_Router',
-                                            'name', self.lrouter)
+            lrouter = row_index.row_by_name(self.api.idl, 'Logical_Router',
+                                            self.lrouter)
         except idlutils.RowNotFound:
             if self.if_exists:
                 return
@@ -1020,8 +1027,8 @@ class AddAddrSetCommand(commands.BaseCommand):
 
     def run_idl(self, txn):
         if self.may_exist:
-            addrset = idlutils.row_by_value(self.api.idl, 'Address_Set',
-                                            'name', self.name, None)
+            addrset = row_index.row_by_name(self.api.idl, 'Address_Set',
+                                            self.name, None)
             if addrset:
                 return
         row = txn.insert(self.api._tables['Address_Set'])
@@ -1038,8 +1045,8 @@ class DelAddrSetCommand(commands.BaseCommand):
 
     def run_idl(self, txn):
         try:
-            addrset = idlutils.row_by_value(self.api.idl, 'Address_Set',
-                                            'name', self.name)
+            addrset = row_index.row_by_name(self.api.idl, 'Address_Set',
+                                            self.name)
         except idlutils.RowNotFound:
             if self.if_exists:
                 return
@@ -1060,8 +1067,8 @@ class UpdateAddrSetCommand(commands.BaseCommand):
 
     def run_idl(self, txn):
         try:
-            addrset = idlutils.row_by_value(self.api.idl, 'Address_Set',
-                                            'name', self.name)
+            addrset = row_index.row_by_name(self.api.idl, 'Address_Set',
+                                            self.name)
         except idlutils.RowNotFound:
             if self.if_exists:
                 return
@@ -1074,6 +1081,22 @@ class UpdateAddrSetCommand(commands.BaseCommand):
             new_values=self.addrs_add,
             old_values=self.addrs_remove)
 
+    def merge(self, command):
+        """Merge a later update of the same address set into this command
+
+        An address added by one command and removed by the other ends up
+        in the addresses of the later command only.
+        """
+        addrs_add = list(command.addrs_add or [])
+        addrs_remove = list(command.addrs_remove or [])
+        self.addrs_add = [addr for addr in self.addrs_add or []
+                          if addr not in addrs_remove and
+                          addr not in addrs_add] + addrs_add or None
+        self.addrs_remove = [addr for addr in self.addrs_remove or []
+                             if addr not in addrs_add and
+                             addr not in addrs_remove] + addrs_remove or None
+        self.if_exists = self.if_exists and command.if_exists
+
 
 class UpdateAddrSetExtIdsCommand(commands.BaseCommand):
     def __init__(self, api, name, external_ids, if_exists):
@@ -1084,8 +1107,8 @@ class UpdateAddrSetExtIdsCommand(commands.BaseCommand):
 
     def run_idl(self, txn):
         try:
-            addrset = idlutils.row_by_value(self.api.idl, 'Address_Set',
-                                            'name', self.name)
+            addrset = row_index.row_by_name(self.api.idl, 'Address_Set',
+                                            self.name)
         except idlutils.RowNotFound:
             if self.if_exists:
                 return
@@ -1100,6 +1123,174 @@ class UpdateAddrSetExtIdsCommand(commands.BaseCommand):
         addrset.external_ids = addrset_external_ids
 
 
+def _get_lsp_rows(api, lport_names):
+    rows = []
+    for lport_name in lport_names:
+        try:
+            row = row_index.row_by_name(api.idl, 'Logical_Switch_Port',
+                                        lport_name)
+        except idlutils.RowNotFound:
+            msg = _("Logical Switch Port %s does not exist") % lport_name
+            raise RuntimeError(msg)
+        rows.append(row)
+    return rows
+
+
+def _insert_acl_rows(api, txn, acls):
+    rows = []
+    for acl in acls:
+        row = txn.insert(api._tables['ACL'])
+        for col, val in acl.items():
+            setattr(row, col, val)
+        rows.append(row)
+    return rows
+
+
+def _get_acl_row_key(row):
+    acl = {column: getattr(row, column)
+           for column in ovn_acl.ACL_KEY_COLUMNS}
+    acl['external_ids'] = getattr(row, 'external_ids', {})
+    return ovn_acl.acl_key(acl)
+
+
+class AddPortGroupCommand(commands.BaseCommand):
+    def __init__(self, api, name, may_exist, acls=None, lports=None,
+                 **columns):
+        super(AddPortGroupCommand, self).__init__(api)
+        self.name = name
+        self.may_exist = may_exist
+        self.acls = acls or []
+        self.lports = lports or []
+        self.columns = columns
+
+    def run_idl(self, txn):
+        if self.may_exist:
+            port_group = row_index.row_by_name(self.api.idl, 'Port_Group',
+                                               self.name, None)
+            if port_group:
+                return
+        row = txn.insert(self.api._tables['Port_Group'])
+        row.name = self.name
+        for col, val in self.columns.items():
+            setattr(row, col, val)
+        row.ports = _get_lsp_rows(self.api, self.lports)
+        row.acls = _insert_acl_rows(self.api, txn, self.acls)
+
+
+class DelPortGroupCommand(commands.BaseCommand):
+    def __init__(self, api, name, if_exists):
+        super(DelPortGroupCommand, self).__init__(api)
+        self.name = name
+        self.if_exists = if_exists
+
+    def run_idl(self, txn):
+        try:
+            port_group = row_index.row_by_name(self.api.idl, 'Port_Group',
+                                               self.name)
+        except idlutils.RowNotFound:
+            if self.if_exists:
+                return
+            msg = _("Port group %s does not exist. "
+                    "Can't delete.") % self.name
+            raise RuntimeError(msg)
+
+        # The ACLs of the port group are garbage collected with it.
+        port_group.delete()
+
+
+class UpdatePortGroupPortsCommand(commands.BaseCommand):
+    def __init__(self, api, name, lports_add, lports_remove, if_exists):
+        super(UpdatePortGroupPortsCommand, self).__init__(api)
+        self.name = name
+        self.lports_add = lports_add
+        self.lports_remove = lports_remove
+        self.if_exists = if_exists
+
+    def run_idl(self, txn):
+        try:
+            port_group = row_index.row_by_name(self.api.idl, 'Port_Group',
+                                               self.name)
+        except idlutils.RowNotFound:
+            if self.if_exists:
+                return
+            msg = _("Port group %s does not exist. "
+                    "Can't update ports") % self.name
+            raise RuntimeError(msg)
+
+        # The ports to remove may already be deleted, their references are
+        # then removed by the OVSDB server.
+        lports_remove = [
+            row_index.row_by_name(self.api.idl, 'Logical_Switch_Port',
+                                  lport_name, None)
+            for lport_name in self.lports_remove or []]
+        _updatevalues_in_list(
+            port_group, 'ports',
+            new_values=_get_lsp_rows(self.api, self.lports_add or []),
+            old_values=[row for row in lports_remove if row is not None])
+
+    def merge(self, command):
+        """Merge a later update of the same port group into this command"""
+        lports_add = list(command.lports_add or [])
+        lports_remove = list(command.lports_remove or [])
+        self.lports_add = [lport for lport in self.lports_add or []
+                           if lport not in lports_remove and
+                           lport not in lports_add] + lports_add or None
+        self.lports_remove = [lport for lport in self.lports_remove or []
+                              if lport not in lports_add and
+                              lport not in lports_remove
+                              ] + lports_remove or None
+        self.if_exists = self.if_exists and command.if_exists
+
+
+class AddPortGroupACLsCommand(commands.BaseCommand):
+    def __init__(self, api, name, acls, if_exists):
+        super(AddPortGroupACLsCommand, self).__init__(api)
+        self.name = name
+        self.acls = acls
+        self.if_exists = if_exists
+
+    def run_idl(self, txn):
+        try:
+            port_group = row_index.row_by_name(self.api.idl, 'Port_Group',
+                                               self.name)
+        except idlutils.RowNotFound:
+            if self.if_exists:
+                return
+            msg = _("Port group %s does not exist. "
+                    "Can't add ACLs") % self.name
+            raise RuntimeError(msg)
+
+        _updatevalues_in_list(
+            port_group, 'acls',
+            new_values=_insert_acl_rows(self.api, txn, self.acls))
+
+
+class DelPortGroupACLsCommand(commands.BaseCommand):
+    def __init__(self, api, name, acls, if_exists):
+        super(DelPortGroupACLsCommand, self).__init__(api)
+        self.name = name
+        self.acls = acls
+        self.if_exists = if_exists
+
+    def run_idl(self, txn):
+        try:
+            port_group = row_index.row_by_name(self.api.idl, 'Port_Group',
+                                               self.name)
+        except idlutils.RowNotFound:
+            if self.if_exists:
+                return
+            msg = _("Port group %s does not exist. "
+                    "Can't delete ACLs") % self.name
+            raise RuntimeError(msg)
+
+        acl_keys = set(ovn_acl.acl_key(acl) for acl in self.acls)
+        acls_to_del = [acl for acl in getattr(port_group, 'acls', [])
+                       if _get_acl_row_key(acl) in acl_keys]
+        _updatevalues_in_list(port_group, 'acls', old_values=acls_to_del)
+        for acl in acls_to_del:
+            acl.delete()
+
+
 class AddDHCPOptionsCommand(commands.BaseCommand):
     def __init__(self, api, subnet_id, port_id=None, may_exists=True,
                  **columns):
@@ -1110,6 +1301,12 @@ class AddDHCPOptionsCommand(commands.BaseCommand):
         self.port_id = port_id
 
     def _get_dhcp_options_row(self):
+        index = getattr(self.api.idl, 'dhcp_options_index', None)
+        if isinstance(index, row_index.DhcpOptionsIndex):
+            if self.port_id:
+                return index.get_port_row(self.subnet_id, self.port_id)
+            return index.get_subnet_row(self.subnet_id)
+
         for row in self.api._tables['DHCP_Options'].rows.values():
             external_ids = getattr(row, 'external_ids', {})
             port_id = external_ids.get('port_id')
@@ -1142,3 +1339,79 @@ class DelDHCPOptionsCommand(commands.BaseCommand):
             raise RuntimeError(msg)
 
         self.api._tables['DHCP_Options'].rows[self.row_uuid].delete()
+
+
+# The commands which can be merged with a later command of the same class
+# updating the same row, see merge_commands.
+MERGEABLE_COMMANDS = (SetLSwitchPortCommand, UpdateAddrSetCommand,
+                      UpdatePortGroupPortsCommand)
+
+
+def _get_merge_row(command):
+    if isinstance(command, (AddAddrSetCommand, DelAddrSetCommand,
+                            UpdateAddrSetCommand,
+                            UpdateAddrSetExtIdsCommand)):
+        return 'Address_Set', command.name
+    if isinstance(command, (AddLSwitchPortCommand, SetLSwitchPortCommand,
+                            DelLSwitchPortCommand)):
+        return 'Logical_Switch_Port', command.lport
+    if isinstance(command, SetLRouterPortInLSwitchPortCommand):
+        return 'Logical_Switch_Port', command.lswitch_port
+    if isinstance(command, (AddPortGroupCommand, DelPortGroupCommand,
+                            UpdatePortGroupPortsCommand,
+                            AddPortGroupACLsCommand,
+                            DelPortGroupACLsCommand)):
+        return 'Port_Group', command.name
+
+
+def _get_merge_refs(command):
+    """Return the rows a mergeable command refers to"""
+    refs = {_get_merge_row(command)}
+    if isinstance(command, UpdatePortGroupPortsCommand):
+        lports = (command.lports_add or []) + (command.lports_remove or [])
+        refs.update(('Logical_Switch_Port', lport) for lport in lports)
+    return refs
+
+
+def merge_commands(commands):
+    """Merge the commands of a transaction updating the same row
+
+    A command of MERGEABLE_COMMANDS is merged with the previous command of
+    the same class updating the same row, unless another command changes
+    the row in between. The address set and port group updates are
+    unioned, and the port columns set by the later command win.
+
+    The merged command runs at the position of the later command, since
+    the later command may refer to rows created in between, like the port
+    added to a port group after its creation. The earlier command can't
+    be moved after a command deleting a row it refers to, so such a
+    command prevents the merge.
+
+    :returns: the list of commands left and the number of merged commands
+    """
+    merged_commands = []
+    # The index of the last mergeable command of each row
+    mergeable = {}
+    for command in commands:
+        if isinstance(command, DelLSwitchCommand):
+            # The ports of the logical switch are deleted with it
+            mergeable.clear()
+        elif isinstance(command, DelLSwitchPortCommand):
+            lport = ('Logical_Switch_Port', command.lport)
+            for row, index in list(mergeable.items()):
+                if lport in _get_merge_refs(merged_commands[index]):
+                    del mergeable[row]
+        row = _get_merge_row(command)
+        previous = mergeable.pop(row, None) if row else None
+        if previous is not None and (
+                type(merged_commands[previous]) is type(command)):
+            earlier = merged_commands[previous]
+            merged_commands[previous] = None
+            earlier.merge(command)
+            command = earlier
+        if row and isinstance(command, MERGEABLE_COMMANDS):
+            mergeable[row] = len(merged_commands)
+        merged_commands.append(command)
+    merged_commands = [command for command in merged_commands
+                       if command is not None]
+    return merged_commands, len(commands) - len(merged_commands)
@@ -0,0 +1,97 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import threading
+import time
+import traceback
+
+from oslo_log import log
+
+from neutron.agent.ovsdb.native import idlutils
+
+from networking_ovn.ovsdb import txn_retry
+
+LOG = log.getLogger(__name__)
+
+
+class TransactionGroup(object):
+    """Merge the transactions committed within a window into one
+
+    The group stands for the OVSDB connection of the transactions it
+    merges: their commit() queues them to the group, which queues a single
+    GroupedTransaction to the connection at the end of the window. The
+    first transaction of a window waits for the others.
+    """
+
+    def __init__(self, ovsdb_connection, window):
+        self.ovsdb_connection = ovsdb_connection
+        self.window = window
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def queue_txn(self, txn):
+        with self._lock:
+            self._pending.append(txn)
+            if len(self._pending) > 1:
+                return
+        time.sleep(self.window)
+        with self._lock:
+            transactions, self._pending = self._pending, []
+        self.ovsdb_connection.queue_txn(GroupedTransaction(transactions))
+
+
+class GroupedTransaction(txn_retry.RetryTransaction):
+    """The commands of several transactions run in one OVSDB transaction
+
+    The results of the commands are put back in the result queue of each
+    transaction. If the grouped transaction fails, the transactions are
+    committed one by one, so that each caller only gets its own error.
+    """
+
+    def __init__(self, transactions):
+        first = transactions[0]
+        super(GroupedTransaction, self).__init__(
+            first.api, first.ovsdb_connection, first.timeout,
+            check_error=True, log_errors=False)
+        self.transactions = transactions
+        for txn in transactions:
+            self.commands.extend(txn.commands)
+
+    def do_commit(self):
+        if len(self.transactions) > 1:
+            try:
+                result = super(GroupedTransaction, self).do_commit()
+            except Exception as e:
+                LOG.debug("Group commit of %(count)d transactions failed "
+                          "with %(error)s, committing them separately",
+                          {'count': len(self.transactions), 'error': e})
+            else:
+                if result is txn_retry.TRY_AGAIN:
+                    # Each caller backs off and queues its transaction
+                    # again, after the change which made the group fail.
+                    for txn in self.transactions:
+                        txn._seqno = self._seqno
+                        txn.results.put(result)
+                    return
+                if result is not None:
+                    offset = 0
+                    for txn in self.transactions:
+                        count = len(txn.commands)
+                        txn.results.put(result[offset:offset + count])
+                        offset += count
+                    return
+        for txn in self.transactions:
+            try:
+                txn.results.put(txn.do_commit())
+            except Exception as ex:
+                txn.results.put(idlutils.ExceptionResult(
+                    ex=ex, tb=traceback.format_exc()))
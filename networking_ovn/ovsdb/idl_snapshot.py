@@ -0,0 +1,183 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import errno
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+
+from oslo_log import log
+from ovs.db import data
+from ovs.db import idl
+import six
+
+from networking_ovn._i18n import _LI, _LW
+
+LOG = log.getLogger(__name__)
+
+
+class IdlSnapshot(object):
+    """On-disk copy of the rows replicated by an IDL
+
+    The snapshot holds the rows of the registered tables and the id of the
+    last transaction they reflect. An IDL loaded from it asks the server for
+    the changes since that transaction only (monitor_cond_since), and the
+    server sends a full dump when it can't serve them.
+
+    This needs a python IDL with monitor_cond_since support, which is
+    detected by its last_id attribute. The snapshot is ignored otherwise.
+
+    The rows are copied in the thread running the IDL, but serialized and
+    written in a separate thread so that the IDL keeps processing updates.
+    """
+
+    VERSION = 1
+
+    def __init__(self, directory, schema_name, interval):
+        self.directory = directory
+        self.schema_name = schema_name
+        self.interval = interval
+        self._saved_seqno = None
+        self._saved_at = 0
+        self._save_thread = None
+
+    @staticmethod
+    def is_supported(idl_):
+        return hasattr(idl_, 'last_id')
+
+    @staticmethod
+    def _registered_columns(idl_):
+        return {table_name: sorted(table.columns)
+                for table_name, table in six.iteritems(idl_.tables)}
+
+    def _path(self, idl_):
+        # Workers registering different tables and columns must not share
+        # their snapshots.
+        digest = hashlib.md5(json.dumps(self._registered_columns(idl_),
+                                        sort_keys=True).encode('utf-8'))
+        return os.path.join(self.directory, '%s-%s.json' % (
+            self.schema_name, digest.hexdigest()[:8]))
+
+    def load(self, idl_):
+        """Populate the tables of an IDL which hasn't run yet
+
+        :returns: the list of the loaded rows
+        """
+        if not self.is_supported(idl_):
+            LOG.info(_LI('The OVS python IDL does not support '
+                         'monitor_cond_since, ignoring the %s snapshot'),
+                     self.schema_name)
+            return []
+        path = self._path(idl_)
+        try:
+            with open(path) as f:
+                snapshot = json.load(f)
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                LOG.warning(_LW('Unable to read the IDL snapshot %(path)s: '
+                                '%(error)s'), {'path': path, 'error': e})
+            return []
+        except ValueError as e:
+            LOG.warning(_LW('Ignoring the corrupted IDL snapshot %(path)s: '
+                            '%(error)s'), {'path': path, 'error': e})
+            return []
+        if (snapshot.get('version') != self.VERSION or
+                snapshot.get('columns') != self._registered_columns(idl_)):
+            return []
+
+        rows = []
+        for table_name, table_rows in six.iteritems(snapshot['tables']):
+            table = idl_.tables[table_name]
+            for row_uuid, row_json in six.iteritems(table_rows):
+                row_uuid = uuid.UUID(row_uuid)
+                row_data = {
+                    column_name: data.Datum.from_json(
+                        table.columns[column_name].type, datum_json)
+                    for column_name, datum_json in six.iteritems(row_json)}
+                row = idl.Row(idl_, table, row_uuid, row_data)
+                table.rows[row_uuid] = row
+                rows.append(row)
+        idl_.last_id = snapshot['last_id']
+        LOG.info(_LI('Loaded %(count)d rows of %(schema)s from the IDL '
+                     'snapshot %(path)s'),
+                 {'count': len(rows), 'schema': self.schema_name,
+                  'path': path})
+        return rows
+
+    @staticmethod
+    def _copy_tables(idl_):
+        # The IDL replaces the datums of a row on update instead of changing
+        # them, so copying the row data dicts is enough to freeze the rows.
+        return {table_name: {row_uuid: dict(row._data)
+                             for row_uuid, row in six.iteritems(table.rows)}
+                for table_name, table in six.iteritems(idl_.tables)}
+
+    def _write(self, path, columns, last_id, tables):
+        snapshot = {
+            'version': self.VERSION,
+            'last_id': last_id,
+            'columns': columns,
+            'tables': {
+                table_name: {
+                    str(row_uuid): {column_name: datum.to_json()
+                                    for column_name, datum in
+                                    six.iteritems(row_data)}
+                    for row_uuid, row_data in six.iteritems(table_rows)}
+                for table_name, table_rows in six.iteritems(tables)},
+        }
+        # Several workers may save the same snapshot, so write it to a
+        # private file first and atomically rename it.
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(snapshot, f)
+            os.rename(tmp_path, path)
+        except (IOError, OSError) as e:
+            LOG.warning(_LW('Unable to write the IDL snapshot %(path)s: '
+                            '%(error)s'), {'path': path, 'error': e})
+
+    def _save_args(self, idl_):
+        return (self._path(idl_), self._registered_columns(idl_),
+                str(idl_.last_id), self._copy_tables(idl_))
+
+    def save(self, idl_):
+        """Write the rows of an IDL, replacing the previous snapshot"""
+        self._write(*self._save_args(idl_))
+
+    def save_async(self, idl_):
+        """Copy the rows of an IDL and write them in a separate thread"""
+        self._save_thread = threading.Thread(target=self._write,
+                                             args=self._save_args(idl_))
+        self._save_thread.setDaemon(True)
+        self._save_thread.start()
+
+    def maybe_save(self, idl_):
+        """Save the snapshot if the IDL changed since the last interval"""
+        if not self.is_supported(idl_):
+            return
+        if getattr(idl_, 'state', None) != getattr(
+                idl_, 'IDL_S_MONITORING', None):
+            # Don't save the tables in the middle of the initial dump.
+            return
+        now = time.time()
+        if (idl_.change_seqno == self._saved_seqno or
+                now - self._saved_at < self.interval):
+            return
+        if self._save_thread is not None and self._save_thread.is_alive():
+            # The previous snapshot is still being written.
+            return
+        self.save_async(idl_)
+        self._saved_seqno = idl_.change_seqno
+        self._saved_at = now
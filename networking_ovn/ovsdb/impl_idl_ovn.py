@@ -15,22 +15,62 @@ from oslo_log import log
 import retrying
 import six
 
-from neutron.agent.ovsdb import impl_idl
-from neutron.agent.ovsdb.native import connection
 from neutron.agent.ovsdb.native import idlutils
 from neutron.common import utils as n_utils
 
 from networking_ovn._i18n import _, _LI
+from networking_ovn.common import acl as ovn_acl
 from networking_ovn.common import config as cfg
 from networking_ovn.common import constants as ovn_const
 from networking_ovn.common import utils
 from networking_ovn.ovsdb import commands as cmd
+from networking_ovn.ovsdb import group_commit
 from networking_ovn.ovsdb import ovn_api
 from networking_ovn.ovsdb import ovsdb_monitor
+from networking_ovn.ovsdb import row_index
+from networking_ovn.ovsdb import txn_retry
 
 
 LOG = log.getLogger(__name__)
 
+# The OVN_Northbound tables and columns used by the mechanism driver, the L3
+# plugin and the QoS driver. A value of None registers every column.
+NB_API_TABLE_COLUMNS = {
+    'Logical_Switch': ['name', 'ports', 'acls', 'external_ids'],
+    'Logical_Switch_Port': ['name', 'addresses', 'port_security',
+                            'external_ids', 'parent_name', 'tag', 'enabled',
+                            'options', 'type', 'dhcpv4_options'],
+    'ACL': ['priority', 'direction', 'match', 'action', 'log',
+            'external_ids'],
+    'Address_Set': ['name', 'addresses', 'external_ids'],
+    'Logical_Router': ['name', 'ports', 'static_routes', 'enabled',
+                       'options', 'external_ids'],
+    'Logical_Router_Port': ['name', 'mac', 'networks'],
+    'Logical_Router_Static_Route': ['ip_prefix', 'nexthop'],
+    'DHCP_Options': ['cidr', 'options', 'external_ids'],
+}
+
+# The port group table, only registered when the security groups are
+# implemented with port groups.
+NB_PORT_GROUP_TABLE_COLUMNS = {
+    'Port_Group': ['name', 'ports', 'acls', 'external_ids'],
+}
+
+# The OvnWorker also needs the columns matched by the monitor events.
+NB_WORKER_TABLE_COLUMNS = dict(
+    NB_API_TABLE_COLUMNS,
+    Logical_Switch_Port=(NB_API_TABLE_COLUMNS['Logical_Switch_Port'] +
+                         ['up']))
+
+# The service function chaining tables, only registered when enabled.
+NB_SFC_TABLE_COLUMNS = {
+    'Logical_Switch': ['port_chains', 'port_pairs'],
+    'Logical_Port_Chain': None,
+    'Logical_Port_Pair_Group': None,
+    'Logical_Port_Pair': None,
+    'Logical_Flow_Classifier': None,
+}
+
 
 class OvsdbConnectionUnavailable(n_exc.ServiceUnavailable):
     message = _("OVS database connection to %(db_schema)s failed with error: "
@@ -53,13 +93,38 @@ def get_ovn_idls(driver, trigger):
     sb_ovn_idl = get_ovn_idl_retry(OvsdbSbOvnIdl, driver, trigger)
     return nb_ovn_idl, sb_ovn_idl
 
+# The OVN_Southbound tables and columns used by the chassis lookups and the
+# Chassis monitor event of the OvnWorker.
+SB_TABLE_COLUMNS = {
+    'Chassis': ['name', 'hostname', 'external_ids'],
+}
+
+
+def get_nb_table_columns(worker=False):
+    """Return the OVN_Northbound tables and columns to register
+
+    :param worker: True for the OvnWorker, which handles the monitor events
+    """
+    if worker:
+        table_columns = dict(NB_WORKER_TABLE_COLUMNS)
+    else:
+        table_columns = dict(NB_API_TABLE_COLUMNS)
+    if cfg.is_ovn_nb_sfc_tables():
+        for table_name, columns in six.iteritems(NB_SFC_TABLE_COLUMNS):
+            if table_name in table_columns:
+                columns = table_columns[table_name] + columns
+            table_columns[table_name] = columns
+    if cfg.is_ovn_port_groups():
+        table_columns.update(NB_PORT_GROUP_TABLE_COLUMNS)
+    return table_columns
+
 
 def get_connection(db_class, trigger=None):
     # The trigger is the start() method of the NeutronWorker class
     if trigger and trigger.im_class == ovsdb_monitor.OvnWorker:
         cls = ovsdb_monitor.OvnConnection
     else:
-        cls = connection.Connection
+        cls = ovsdb_monitor.BaseOvnConnection
 
     if db_class == OvsdbNbOvnIdl:
         return cls(cfg.get_ovn_nb_connection(),
@@ -72,6 +137,7 @@ def get_connection(db_class, trigger=None):
 class OvsdbNbOvnIdl(ovn_api.API):
 
     ovsdb_connection = None
+    transaction_group = None
 
     def __init__(self, driver, trigger=None):
         super(OvsdbNbOvnIdl, self).__init__()
@@ -81,11 +147,20 @@ class OvsdbNbOvnIdl(ovn_api.API):
                     OvsdbNbOvnIdl, trigger)
             if isinstance(OvsdbNbOvnIdl.ovsdb_connection,
                           ovsdb_monitor.OvnConnection):
-                OvsdbNbOvnIdl.ovsdb_connection.start(driver)
+                OvsdbNbOvnIdl.ovsdb_connection.start(
+                    driver, table_columns=get_nb_table_columns(worker=True))
             else:
-                OvsdbNbOvnIdl.ovsdb_connection.start()
+                OvsdbNbOvnIdl.ovsdb_connection.start(
+                    table_columns=get_nb_table_columns())
             self.idl = OvsdbNbOvnIdl.ovsdb_connection.idl
             self.ovsdb_timeout = cfg.get_ovn_ovsdb_timeout()
+            group_commit_window = cfg.get_ovn_nb_group_commit_window()
+            if (group_commit_window and
+                    OvsdbNbOvnIdl.transaction_group is None):
+                OvsdbNbOvnIdl.transaction_group = (
+                    group_commit.TransactionGroup(
+                        OvsdbNbOvnIdl.ovsdb_connection,
+                        group_commit_window / 1000.0))
         except Exception as e:
             connection_exception = OvsdbConnectionUnavailable(
                 db_schema='OVN_Northbound', error=e)
@@ -97,10 +172,14 @@ class OvsdbNbOvnIdl(ovn_api.API):
         return self.idl.tables
 
     def transaction(self, check_error=False, log_errors=True, **kwargs):
-        return impl_idl.Transaction(self,
-                                    OvsdbNbOvnIdl.ovsdb_connection,
-                                    self.ovsdb_timeout,
-                                    check_error, log_errors)
+        # The transactions committed within the group commit window are
+        # merged into one OVSDB transaction.
+        ovsdb_connection = (OvsdbNbOvnIdl.transaction_group or
+                            OvsdbNbOvnIdl.ovsdb_connection)
+        return txn_retry.RetryTransaction(self,
+                                          ovsdb_connection,
+                                          self.ovsdb_timeout,
+                                          check_error, log_errors)
 
     def create_lswitch(self, lswitch_name, may_exist=True, **columns):
         return cmd.AddLSwitchCommand(self, lswitch_name,
@@ -227,9 +306,10 @@ class OvsdbNbOvnIdl(ovn_api.API):
         return result
 
     def get_logical_switch_ids(self, lswitch_name):
-        for row in self._tables['Logical_Switch'].rows.values():
-            if row.name == lswitch_name:
-                return row.external_ids
+        row = row_index.row_by_name(self.idl, 'Logical_Switch',
+                                    lswitch_name, None)
+        if row:
+            return row.external_ids
         return {}
 
     def get_all_logical_switch_ports_ids(self):
@@ -284,8 +364,9 @@ class OvsdbNbOvnIdl(ovn_api.API):
         @var acl_values_dict: A dictionary indexed by port_id containing the
                               list of acl values in string format that belong
                               to that port
-        @var acl_obj_dict: A dictionary indexed by acl value containing the
-                           corresponding acl idl object.
+        @var acl_obj_dict: A dictionary indexed by the canonical form of the
+                           acls (see acl.acl_key) containing the list of
+                           corresponding acl idl objects.
         @var lswitch_ovsdb_dict: A dictionary mapping from logical switch
                                  name to lswitch idl object
         @return: (acl_values_dict, acl_obj_dict, lswitch_ovsdb_dict)
@@ -295,9 +376,8 @@ class OvsdbNbOvnIdl(ovn_api.API):
         lswitch_ovsdb_dict = {}
         for lswitch_name in lswitch_names:
             try:
-                lswitch = idlutils.row_by_value(self.idl,
+                lswitch = row_index.row_by_name(self.idl,
                                                 'Logical_Switch',
-                                                'name',
                                                 utils.ovn_name(lswitch_name))
             except idlutils.RowNotFound:
                 # It is possible for the logical switch to be deleted
@@ -314,17 +394,61 @@ class OvsdbNbOvnIdl(ovn_api.API):
                 ext_ids = getattr(acl, 'external_ids', {})
                 port_id = ext_ids.get('neutron:lport')
                 acl_list = acl_values_dict.setdefault(port_id, [])
-                acl_string = {'lport': port_id,
-                              'lswitch': utils.ovn_name(lswitch_name)}
-                for acl_key in six.iterkeys(getattr(acl, "_data", {})):
-                    try:
-                        acl_string[acl_key] = getattr(acl, acl_key)
-                    except AttributeError:
-                        pass
-                acl_obj_dict[str(acl_string)] = acl
+                acl_string = self._get_acl_string(acl, port_id, lswitch_name)
+                acl_obj_dict.setdefault(ovn_acl.acl_key(acl_string),
+                                        []).append(acl)
                 acl_list.append(acl_string)
         return acl_values_dict, acl_obj_dict, lswitch_ovsdb_dict
 
+    def _get_acl_string(self, acl, port_id, lswitch_name):
+        acl_string = {'lport': port_id,
+                      'lswitch': utils.ovn_name(lswitch_name)}
+        for acl_key in six.iterkeys(getattr(acl, "_data", {})):
+            try:
+                acl_string[acl_key] = getattr(acl, acl_key)
+            except AttributeError:
+                pass
+        return acl_string
+
+    def get_acls_for_lports(self, lswitch_names, port_list):
+        """Get the existing set of acls that belong to the given ports
+
+        Same as get_acls_for_lswitches, except that only the acls of the
+        ports in port_list are returned. They are taken from the ACL index
+        of the idl, so the cost doesn't depend on the number of acls on the
+        logical switches.
+
+        @param lswitch_names: List of logical switch names
+        @type lswitch_names: []
+        @param port_list: List of ports
+        @type port_list: []
+        @return: (acl_values_dict, acl_obj_dict, lswitch_ovsdb_dict)
+        """
+        acl_values_dict = {}
+        acl_obj_dict = {}
+        lswitch_ovsdb_dict = {}
+        for lswitch_name in lswitch_names:
+            lswitch = row_index.row_by_name(self.idl, 'Logical_Switch',
+                                            utils.ovn_name(lswitch_name),
+                                            None)
+            # It is possible for the logical switch to be deleted
+            # while we are searching for it by name in idl.
+            if lswitch:
+                lswitch_ovsdb_dict[lswitch_name] = lswitch
+
+        for port in port_list:
+            lswitch_name = port['network_id']
+            if lswitch_name not in lswitch_ovsdb_dict:
+                continue
+            acl_list = acl_values_dict.setdefault(port['id'], [])
+            port_acls = self.idl.acl_index.get_port_acls(port['id'])
+            for key, acls in six.iteritems(port_acls):
+                acl_obj_dict.setdefault(key, []).extend(acls)
+                for acl in acls:
+                    acl_list.append(self._get_acl_string(acl, port['id'],
+                                                         lswitch_name))
+        return acl_values_dict, acl_obj_dict, lswitch_ovsdb_dict
+
     def create_lrouter(self, name, may_exist=True, **columns):
         return cmd.AddLRouterCommand(self, name,
                                      may_exist, **columns)
@@ -386,6 +510,47 @@ class OvsdbNbOvnIdl(ovn_api.API):
         return cmd.UpdateAddrSetExtIdsCommand(self, name, external_ids,
                                               if_exists)
 
+    def is_port_groups_supported(self):
+        return 'Port_Group' in self._tables
+
+    def create_port_group(self, name, may_exist=True, acls=None, lports=None,
+                          **columns):
+        return cmd.AddPortGroupCommand(self, name, may_exist, acls=acls,
+                                       lports=lports, **columns)
+
+    def delete_port_group(self, name, if_exists=True):
+        return cmd.DelPortGroupCommand(self, name, if_exists)
+
+    def update_port_group_ports(self, name, lports_add, lports_remove,
+                                if_exists=True):
+        return cmd.UpdatePortGroupPortsCommand(self, name, lports_add,
+                                               lports_remove, if_exists)
+
+    def add_port_group_acls(self, name, acls, if_exists=True):
+        return cmd.AddPortGroupACLsCommand(self, name, acls, if_exists)
+
+    def delete_port_group_acls(self, name, acls, if_exists=True):
+        return cmd.DelPortGroupACLsCommand(self, name, acls, if_exists)
+
+    def get_port_groups(self):
+        port_groups = {}
+        for row in self._tables['Port_Group'].rows.values():
+            if (ovn_const.OVN_SG_EXT_ID_KEY not in row.external_ids and
+                    row.name != ovn_const.OVN_DROP_PORT_GROUP_NAME):
+                continue
+            acls = []
+            for acl_row in row.acls:
+                acl = {column: getattr(acl_row, column)
+                       for column in ovn_acl.ACL_KEY_COLUMNS}
+                acl['external_ids'] = acl_row.external_ids
+                acls.append(acl)
+            port_groups[row.name] = {
+                'name': row.name,
+                'external_ids': row.external_ids,
+                'ports': [lsp.name for lsp in row.ports],
+                'acls': acls}
+        return port_groups
+
     def get_all_chassis_router_bindings(self, chassis_candidate_list=None):
         chassis_bindings = {}
         for chassis_name in chassis_candidate_list or []:
@@ -405,9 +570,8 @@ class OvsdbNbOvnIdl(ovn_api.API):
 
     def get_router_chassis_binding(self, router_name):
         try:
-            router = idlutils.row_by_value(self.idl,
+            router = row_index.row_by_name(self.idl,
                                            'Logical_Router',
-                                           'name',
                                            router_name)
             chassis_name = router.options.get('chassis')
             if chassis_name == ovn_const.OVN_GATEWAY_INVALID_CHASSIS:
@@ -443,15 +607,16 @@ class OvsdbNbOvnIdl(ovn_api.API):
     def delete_dhcp_options(self, row_uuid, if_exists=True):
         return cmd.DelDHCPOptionsCommand(self, row_uuid, if_exists=if_exists)
 
+    def _get_dhcp_options_info(self, row):
+        if row is None:
+            return None
+        return {'cidr': row.cidr, 'options': dict(row.options),
+                'external_ids': dict(getattr(row, 'external_ids', {})),
+                'uuid': row.uuid}
+
     def get_subnet_dhcp_options(self, subnet_id):
-        for row in self._tables['DHCP_Options'].rows.values():
-            external_ids = getattr(row, 'external_ids', {})
-            port_id = external_ids.get('port_id')
-            if subnet_id == external_ids.get('subnet_id') and not port_id:
-                return {'cidr': row.cidr, 'options': dict(row.options),
-                        'external_ids': dict(external_ids),
-                        'uuid': row.uuid}
-        return None
+        return self._get_dhcp_options_info(
+            self.idl.dhcp_options_index.get_subnet_row(subnet_id))
 
     def get_all_dhcp_options(self):
         dhcp_options = {'subnets': {}, 'ports': {}}
@@ -476,14 +641,8 @@ class OvsdbNbOvnIdl(ovn_api.API):
         return dhcp_options
 
     def get_port_dhcp_options(self, subnet_id, port_id):
-        for row in self._tables['DHCP_Options'].rows.values():
-            external_ids = getattr(row, 'external_ids', {})
-            if subnet_id == external_ids.get('subnet_id') and (
-                    port_id == external_ids.get('port_id')):
-                return {'cidr': row.cidr, 'options': dict(row.options),
-                        'external_ids': dict(external_ids),
-                        'uuid': row.uuid}
-        return None
+        return self._get_dhcp_options_info(
+            self.idl.dhcp_options_index.get_port_row(subnet_id, port_id))
 
     def compose_dhcp_options_commands(self, subnet_id, **columns):
         # First add the subnet DHCP options.
@@ -492,13 +651,10 @@ class OvsdbNbOvnIdl(ovn_api.API):
         # Check if there are any port DHCP options which
         # belongs to this 'subnet_id' and frame the commands to update them.
         port_dhcp_options = []
-        for row in self._tables['DHCP_Options'].rows.values():
-            external_ids = getattr(row, 'external_ids', {})
-            port_id = external_ids.get('port_id')
-            if subnet_id == external_ids.get('subnet_id'):
-                if port_id:
-                    port_dhcp_options.append({'port_id': port_id,
-                                             'port_dhcp_opts': row.options})
+        port_rows = self.idl.dhcp_options_index.get_port_rows(subnet_id)
+        for port_id, row in six.iteritems(port_rows):
+            port_dhcp_options.append({'port_id': port_id,
+                                      'port_dhcp_opts': row.options})
 
         for port_dhcp_opt in port_dhcp_options:
             if columns.get('options'):
@@ -540,9 +696,10 @@ class OvsdbSbOvnIdl(ovn_api.SbAPI):
                           ovsdb_monitor.OvnConnection):
                 # We only need to know the content of Chassis in OVN_Southbound
                 OvsdbSbOvnIdl.ovsdb_connection.start(
-                    driver, table_name_list=['Chassis'])
+                    driver, table_columns=SB_TABLE_COLUMNS)
             else:
-                OvsdbSbOvnIdl.ovsdb_connection.start()
+                OvsdbSbOvnIdl.ovsdb_connection.start(
+                    table_columns=SB_TABLE_COLUMNS)
             self.idl = OvsdbSbOvnIdl.ovsdb_connection.idl
             self.ovsdb_timeout = cfg.get_ovn_ovsdb_timeout()
         except Exception as e:
@@ -559,6 +716,9 @@ class OvsdbSbOvnIdl(ovn_api.SbAPI):
             chassis_info_dict[ch.hostname] = mapping_dict.keys()
         return chassis_info_dict
 
+    def get_chassis_hostnames_for_physnet(self, physnet):
+        return self.idl.chassis_physnet_index.get_hostnames(physnet)
+
     def get_all_chassis(self, chassis_type=None):
         # TODO(azbiswas): Use chassis_type as input once the compute type
         # preference patch (as part of external ids) merges.
@@ -548,6 +548,93 @@ class API(object):
         :returns:             :class:`Command` with no result
         """
 
+    @abc.abstractmethod
+    def is_port_groups_supported(self):
+        """Return whether the OVN_Northbound schema has port groups"""
+
+    @abc.abstractmethod
+    def create_port_group(self, name, may_exist=True, acls=None, lports=None,
+                          **columns):
+        """Create a port group
+
+        :param name:        The name of the port group
+        :type name:         string
+        :param may_exist:   Do not fail if port group already exists
+        :type may_exist:    bool
+        :param acls:        The ACLs of the port group, as dictionaries of
+                            ACL columns
+        :type acls:         list of dictionaries
+        :param lports:      The names of the logical switch ports of the
+                            port group
+        :type lports:       list
+        :param columns:     Dictionary of port group columns
+                            Supported columns: external_ids
+        :type columns:      dictionary
+        :returns:           :class:`Command` with no result
+        """
+
+    @abc.abstractmethod
+    def delete_port_group(self, name, if_exists=True):
+        """Delete a port group and its ACLs
+
+        :param name:        The name of the port group
+        :type name:         string
+        :param if_exists:   Do not fail if the port group does not exist
+        :type if_exists:    bool
+        :returns:           :class:`Command` with no result
+        """
+
+    @abc.abstractmethod
+    def update_port_group_ports(self, name, lports_add, lports_remove,
+                                if_exists=True):
+        """Add and remove logical switch ports of a port group
+
+        :param name:          The name of the port group
+        :type name:           string
+        :param lports_add:    The names of the ports to add
+        :type lports_add:     list
+        :param lports_remove: The names of the ports to remove
+        :type lports_remove:  list
+        :param if_exists:     Do not fail if the port group does not exist
+        :type if_exists:      bool
+        :returns:             :class:`Command` with no result
+        """
+
+    @abc.abstractmethod
+    def add_port_group_acls(self, name, acls, if_exists=True):
+        """Add ACLs to a port group
+
+        :param name:        The name of the port group
+        :type name:         string
+        :param acls:        The ACLs to add, as dictionaries of ACL columns
+        :type acls:         list of dictionaries
+        :param if_exists:   Do not fail if the port group does not exist
+        :type if_exists:    bool
+        :returns:           :class:`Command` with no result
+        """
+
+    @abc.abstractmethod
+    def delete_port_group_acls(self, name, acls, if_exists=True):
+        """Delete the ACLs of a port group having the given columns
+
+        :param name:        The name of the port group
+        :type name:         string
+        :param acls:        The ACLs to delete, as dictionaries of ACL columns
+        :type acls:         list of dictionaries
+        :param if_exists:   Do not fail if the port group does not exist
+        :type if_exists:    bool
+        :returns:           :class:`Command` with no result
+        """
+
+    @abc.abstractmethod
+    def get_port_groups(self):
+        """Gets the port groups of the security groups in the OVN_Northbound DB
+
+        :returns: dictionary indexed by name, with the external_ids, the
+                  names of the ports and the ACL dictionaries of the port
+                  group as values
+        """
+
     @abc.abstractmethod
     def get_all_chassis_router_bindings(self, chassis_candidate_list=None):
         """Return a dictionary of chassis name:list of router gateways
@@ -668,6 +755,14 @@ class SbAPI(object):
         value. And hostname and physnets are related to the same host.
         """
 
+    @abc.abstractmethod
+    def get_chassis_hostnames_for_physnet(self, physnet):
+        """Return the set of hostnames of the chassis bridging a physnet
+
+        :param physnet:    The physical network name
+        :type physnet:     string
+        """
+
     @abc.abstractmethod
     def get_all_chassis(self, chassis_type=None):
         """Return a list of all chassis which match the compute_type
@@ -15,6 +15,7 @@
 import atexit
 from eventlet import greenthread
 import retrying
+import six
 from six.moves import queue
 import threading
 
@@ -22,9 +23,12 @@ from oslo_log import log
 from ovs.db import idl
 from ovs import poller
 
-from networking_ovn._i18n import _LE
+from networking_ovn._i18n import _LE, _LI, _LW
 from networking_ovn.common import config as ovn_config
+from networking_ovn.ovsdb import idl_snapshot
+from networking_ovn.ovsdb import port_latency
 from networking_ovn.ovsdb import row_event
+from networking_ovn.ovsdb import row_index
 from neutron.agent.ovsdb.native import connection
 from neutron.agent.ovsdb.native import idlutils
 from neutron.common import config
@@ -38,6 +42,7 @@ LOG = log.getLogger(__name__)
 
 class ChassisEvent(row_event.RowEvent):
     """Chassis create update delete event."""
+    COALESCE_GROUP = 'Chassis'
 
     def __init__(self, driver):
         self.driver = driver
@@ -47,8 +52,43 @@ class ChassisEvent(row_event.RowEvent):
         events = (self.ROW_CREATE, self.ROW_UPDATE, self.ROW_DELETE)
         super(ChassisEvent, self).__init__(events, table, None)
         self.event_name = 'ChassisEvent'
+        # The rescheduling of the routers is debounced: the Chassis events
+        # received within the interval trigger a single rescheduling, over
+        # the chassis at the end of the interval.
+        self.reschedule_interval = (
+            ovn_config.get_ovn_chassis_reschedule_interval())
+        self._reschedule_pending = False
+        self.reschedule_runs = 0
+        self.suppressed_reschedules = 0
+        self._suppressed_since_run = 0
+
+    @staticmethod
+    def _bridge_mappings_changed(row, old):
+        """Whether the hostname or the bridge mappings changed on update
+
+        The old row only contains the columns which changed.
+        """
+        if old is None:
+            return True
+        try:
+            if old.hostname != row.hostname:
+                return True
+        except (KeyError, AttributeError):
+            pass
+        try:
+            old_external_ids = old.external_ids
+        except (KeyError, AttributeError):
+            return False
+        return (old_external_ids.get('ovn-bridge-mappings') !=
+                row.external_ids.get('ovn-bridge-mappings'))
 
     def run(self, event, row, old):
+        if (event == self.ROW_UPDATE and
+                not self._bridge_mappings_changed(row, old)):
+            LOG.debug("Chassis %s update doesn't change the hostname or the "
+                      "bridge mappings, ignoring it", row.name)
+            return
+
         host = row.hostname
         phy_nets = []
         if event != self.ROW_DELETE:
@@ -58,46 +98,65 @@ class ChassisEvent(row_event.RowEvent):
 
         self.driver.update_segment_host_mapping(host, phy_nets)
         if ovn_config.is_ovn_l3():
+            self.schedule_unhosted_routers()
+
+    def schedule_unhosted_routers(self):
+        if not self.reschedule_interval:
+            self._schedule_unhosted_routers()
+        elif self._reschedule_pending:
+            self.suppressed_reschedules += 1
+            self._suppressed_since_run += 1
+        else:
+            self._reschedule_pending = True
+            greenthread.spawn_after(self.reschedule_interval,
+                                    self._schedule_unhosted_routers)
+
+    def _schedule_unhosted_routers(self):
+        self._reschedule_pending = False
+        if self._suppressed_since_run:
+            LOG.info(_LI('Rescheduling the unhosted routers once for '
+                         '%(count)d Chassis events (%(suppressed)d '
+                         'reschedulings suppressed in total)'),
+                     {'count': self._suppressed_since_run + 1,
+                      'suppressed': self.suppressed_reschedules})
+            self._suppressed_since_run = 0
+        self.reschedule_runs += 1
+        try:
             self.l3_plugin.schedule_unhosted_routers()
+        except Exception:
+            LOG.exception(_LE('Unexpected exception while rescheduling the '
+                              'unhosted routers'))
 
 
-class LogicalSwitchPortCreateUpEvent(row_event.RowEvent):
-    """Row create event - Logical_Switch_Port 'up' = True.
+class LogicalSwitchPortStatusDumpEvent(row_event.RowEvent):
+    """Reconcile the neutron port statuses with the dump of all ports
 
-    On connection, we get a dump of all ports, so if there is a neutron
-    port that is down that has since been activated, we'll catch it here.
-    This event will not be generated for new ports getting created.
+    On connection, we get a dump of all ports, so if a neutron port has
+    since been activated or deactivated, we'll catch it here. This event is
+    queued once the dump is complete rather than matched against the rows,
+    so that the statuses are reconciled in bulk. The 'up' states are read
+    when the event runs rather than when it is queued: the event is queued
+    once for all the ports, so the events of a port received after the dump
+    may be handled first by another notify loop.
     """
+    ONETIME = True
 
-    def __init__(self, driver):
+    def __init__(self, driver, lsp_table):
         self.driver = driver
+        self.lsp_table = lsp_table
         table = 'Logical_Switch_Port'
-        events = (self.ROW_CREATE)
-        super(LogicalSwitchPortCreateUpEvent, self).__init__(
-            events, table, (('up', '=', True),))
-        self.event_name = 'LogicalSwitchPortCreateUpEvent'
+        super(LogicalSwitchPortStatusDumpEvent, self).__init__(
+            (), table, None)
+        self.event_name = 'LogicalSwitchPortStatusDumpEvent'
 
     def run(self, event, row, old):
-        self.driver.set_port_status_up(row.name)
-
-
-class LogicalSwitchPortCreateDownEvent(row_event.RowEvent):
-    """Row create event - Logical_Switch_Port 'up' = False
-
-    On connection, we get a dump of all ports, so if there is a neutron
-    port that is up that has since been deactivated, we'll catch it here.
-    This event will not be generated for new ports getting created.
-    """
-    def __init__(self, driver):
-        self.driver = driver
-        table = 'Logical_Switch_Port'
-        events = (self.ROW_CREATE)
-        super(LogicalSwitchPortCreateDownEvent, self).__init__(
-            events, table, (('up', '=', False),))
-        self.event_name = 'LogicalSwitchPortCreateDownEvent'
-
-    def run(self, event, row, old):
-        self.driver.set_port_status_down(row.name)
+        port_states = {}
+        for row in list(self.lsp_table.rows.values()):
+            # The 'up' column is optional, it is not set until ovn-northd
+            # handles the port.
+            if row.up:
+                port_states[row.name] = row.up[0]
+        self.driver.set_port_statuses(port_states)
 
 
 class LogicalSwitchPortUpdateUpEvent(row_event.RowEvent):
@@ -107,8 +166,12 @@ class LogicalSwitchPortUpdateUpEvent(row_event.RowEvent):
     New value of Logical_Switch_Port 'up' will be True and the old value will
     be False.
     """
-    def __init__(self, driver):
+    # Only the last status reported for a port matters
+    COALESCE_GROUP = 'LogicalSwitchPortStatus'
+
+    def __init__(self, driver, port_latency_tracker=None):
         self.driver = driver
+        self.port_latency_tracker = port_latency_tracker
         table = 'Logical_Switch_Port'
         events = (self.ROW_UPDATE)
         super(LogicalSwitchPortUpdateUpEvent, self).__init__(
@@ -117,6 +180,9 @@ class LogicalSwitchPortUpdateUpEvent(row_event.RowEvent):
         self.event_name = 'LogicalSwitchPortUpdateUpEvent'
 
     def run(self, event, row, old):
+        if self.port_latency_tracker is not None:
+            self.port_latency_tracker.record(row.name,
+                                             port_latency.UP_RECEIVED)
         self.driver.set_port_status_up(row.name)
 
 
@@ -127,6 +193,9 @@ class LogicalSwitchPortUpdateDownEvent(row_event.RowEvent):
     New value of Logical_Switch_Port 'up' will be False and the old value will
     be True.
     """
+    # Only the last status reported for a port matters
+    COALESCE_GROUP = 'LogicalSwitchPortStatus'
+
     def __init__(self, driver):
         self.driver = driver
         table = 'Logical_Switch_Port'
@@ -143,76 +212,215 @@ class LogicalSwitchPortUpdateDownEvent(row_event.RowEvent):
 class OvnDbNotifyHandler(object):
 
     STOP_EVENT = ("STOP", None, None, None)
+    # Queued in place of a coalesced event, with its key as the event.
+    COALESCED = "COALESCED"
 
     def __init__(self, driver):
         self.driver = driver
-        self.__watched_events = set()
+        # The watched events are indexed by (table, event type). The index is
+        # replaced rather than modified when events are (un)watched, so that
+        # the notify path can read it without taking the lock.
+        self.__watched_events = frozenset()
+        self.__dispatch = {}
         self.__lock = threading.Lock()
-        self.notifications = queue.Queue()
-        self.notify_thread = greenthread.spawn_n(self.notify_loop)
+        # The events are partitioned by row UUID between a pool of notify
+        # loops, so that the events of a row are handled in order while the
+        # events of other rows are handled concurrently. The queues are not
+        # bounded: the events are queued by the OVSDB connection thread,
+        # which the notify loops need to commit their transactions, so it
+        # must never block on a full queue.
+        self.notification_queues = [
+            queue.Queue()
+            for i in range(ovn_config.get_ovn_notify_workers())]
+        # The events queued beyond the queue depth are counted and logged.
+        self.queue_depth = ovn_config.get_ovn_notify_queue_depth()
+        self.overflowed_events = 0
+        self.notify_threads = [
+            greenthread.spawn_n(self.notify_loop, notifications)
+            for notifications in self.notification_queues]
+        # The pending coalescable events, by (row UUID, coalesce group). A
+        # newer event of the same group replaces the pending one.
+        self.coalesce_events = ovn_config.is_ovn_notify_coalesce_events()
+        self.dropped_events = 0
+        self.__pending = {}
+        self.__pending_lock = threading.Lock()
         atexit.register(self.shutdown)
 
+    @staticmethod
+    def _build_dispatch(watched_events):
+        dispatch = {}
+        for watched in watched_events:
+            events = watched.events
+            if isinstance(events, six.string_types):
+                events = (events,)
+            for event in events:
+                dispatch.setdefault((watched.table, event), []).append(
+                    watched)
+        return {key: tuple(value) for key, value in six.iteritems(dispatch)}
+
+    def _set_watched_events(self, watched_events):
+        # Must be called with the lock held
+        self.__dispatch = self._build_dispatch(watched_events)
+        self.__watched_events = frozenset(watched_events)
+
     def matching_events(self, event, row, updates):
-        with self.__lock:
-            return tuple(t for t in self.__watched_events
-                         if t.matches(event, row, updates))
+        candidates = self.__dispatch.get((row._table.name, event), ())
+        return tuple(t for t in candidates
+                     if t.matches(event, row, updates))
 
     def watch_event(self, event):
-        with self.__lock:
-            self.__watched_events.add(event)
+        self.watch_events([event])
 
     def watch_events(self, events):
         with self.__lock:
-            for event in events:
-                self.__watched_events.add(event)
+            self._set_watched_events(self.__watched_events.union(events))
 
     def unwatch_event(self, event):
-        with self.__lock:
-            try:
-                self.__watched_events.remove(event)
-            except KeyError:
-                # For ONETIME events, they should normally clear on their own
-                pass
+        # For ONETIME events, they should normally clear on their own
+        self.unwatch_events([event])
 
     def unwatch_events(self, events):
         with self.__lock:
-            for event in events:
-                try:
-                    self.__watched_events.remove(event)
-                except KeyError:
-                    # For ONETIME events, they should normally clear on
-                    # their own
-                    pass
+            self._set_watched_events(self.__watched_events.difference(events))
 
     def shutdown(self):
-        self.notifications.put(OvnDbNotifyHandler.STOP_EVENT)
+        for notifications in self.notification_queues:
+            notifications.put(OvnDbNotifyHandler.STOP_EVENT)
+
+    def get_partition(self, row_uuid):
+        """Return the index of the notify loop handling the row events"""
+        return hash(row_uuid) % len(self.notification_queues)
 
-    def notify_loop(self):
+    def notify_loop(self, notifications):
         while True:
             try:
-                match, event, row, updates = self.notifications.get()
+                match, event, row, updates = notifications.get()
+                if match is OvnDbNotifyHandler.COALESCED:
+                    with self.__pending_lock:
+                        match, event, row, updates = self.__pending.pop(event)
                 if (not isinstance(match, row_event.RowEvent) and
                         (match, event, row, updates) == (
                             OvnDbNotifyHandler.STOP_EVENT)):
-                    self.notifications.task_done()
+                    notifications.task_done()
                     break
                 match.run(event, row, updates)
                 if match.ONETIME:
                     self.unwatch_event(match)
-                self.notifications.task_done()
+                notifications.task_done()
             except Exception:
                 # If any unexpected exception happens we don't want the
                 # notify_loop to exit.
                 LOG.exception(_LE('Unexpected exception in notify_loop'))
 
+    def _put(self, notifications, item):
+        notifications.put(item)
+        if not self.queue_depth:
+            return
+        pending = notifications.qsize()
+        if pending > self.queue_depth:
+            self.overflowed_events += 1
+            if pending == self.queue_depth + 1:
+                LOG.warning(_LW("%(pending)d notify events are pending in a "
+                                "notify worker queue, %(overflowed)d events "
+                                "were queued beyond the queue depth so far"),
+                            {'pending': pending,
+                             'overflowed': self.overflowed_events})
+
+    def queue_event(self, match, event=None, row=None, updates=None,
+                    partition=0):
+        """Run an event in the given notify loop without matching it"""
+        self._put(self.notification_queues[partition],
+                  (match, event, row, updates))
+
+    @staticmethod
+    def _coalesce(pending, newer):
+        """Return the event replacing a pending event and a newer one
+
+        The events of a coalesce group depend on the latest state of the
+        row, except that a create must remain a create, and that an update
+        must carry the old value of every column changed since the pending
+        event was queued.
+        """
+        if pending is None:
+            return newer
+        match, event, row, updates = newer
+        pending_event, pending_updates = pending[1], pending[3]
+        if pending_event == idl.ROW_CREATE and event == idl.ROW_UPDATE:
+            return match, pending_event, row, None
+        if (pending_event == idl.ROW_UPDATE and event == idl.ROW_UPDATE and
+                pending_updates is not None and updates is not None):
+            # The oldest value of each column wins
+            data = dict(updates._data)
+            data.update(pending_updates._data)
+            updates = idl.Row(updates._idl, updates._table, updates.uuid,
+                              data)
+        return match, event, row, updates
+
     def notify(self, event, row, updates=None):
         matching = self.matching_events(
             event, row, updates)
+        if not matching:
+            return
+        notifications = self.notification_queues[
+            self.get_partition(row.uuid)]
         for match in matching:
-            self.notifications.put((match, event, row, updates))
+            if self.coalesce_events and match.COALESCE_GROUP:
+                key = (row.uuid, match.COALESCE_GROUP)
+                with self.__pending_lock:
+                    pending = self.__pending.get(key)
+                    self.__pending[key] = self._coalesce(
+                        pending, (match, event, row, updates))
+                    if pending:
+                        self.dropped_events += 1
+                if pending:
+                    LOG.debug("Replaced a pending %(group)s event of row "
+                              "%(row)s, %(dropped)d events dropped so far",
+                              {'group': match.COALESCE_GROUP,
+                               'row': row.uuid,
+                               'dropped': self.dropped_events})
+                    continue
+                self._put(notifications,
+                          (OvnDbNotifyHandler.COALESCED, key, None, None))
+            else:
+                self._put(notifications, (match, event, row, updates))
+
+
+class BaseOvnIdl(idl.Idl):
+
+    def __init__(self, remote, schema):
+        super(BaseOvnIdl, self).__init__(remote, schema)
+        self.name_index = row_index.NameIndex(self.tables)
+        self.dhcp_options_index = row_index.DhcpOptionsIndex(self.tables)
+        self.acl_index = row_index.AclIndex(self.tables)
+        self.chassis_physnet_index = row_index.ChassisPhysnetIndex(
+            self.tables)
+        self.row_indexes = [self.name_index, self.dhcp_options_index,
+                            self.acl_index, self.chassis_physnet_index]
+        self.snapshot = None
+
+    def notify(self, event, row, updates=None):
+        for index in self.row_indexes:
+            index.notify(event, row, updates)
+
+    def load_snapshot(self, snapshot):
+        """Load the tables from a snapshot and keep saving it while running
+
+        Must be called before the IDL first runs. The loaded rows are only
+        added to the row indexes, they don't trigger any notify event.
+        """
+        self.snapshot = snapshot
+        for row in snapshot.load(self):
+            for index in self.row_indexes:
+                index.notify(idl.ROW_CREATE, row)
 
+    def run(self):
+        changed = super(BaseOvnIdl, self).run()
+        if self.snapshot is not None:
+            self.snapshot.maybe_save(self)
+        return changed
 
-class OvnIdl(idl.Idl):
+
+class OvnIdl(BaseOvnIdl):
 
     def __init__(self, driver, remote, schema):
         super(OvnIdl, self).__init__(remote, schema)
@@ -238,6 +446,8 @@ class OvnIdl(idl.Idl):
         self.event_lock_name = "neutron_ovn_event_lock"
 
     def notify(self, event, row, updates=None):
+        # The indexes must be maintained whether or not we own the event lock.
+        super(OvnIdl, self).notify(event, row, updates)
         # Do not handle the notification if the event lock is requested,
         # but not granted by the ovsdb-server.
         if (self.is_lock_contended and not self.has_lock):
@@ -256,32 +466,29 @@ class OvnNbIdl(OvnIdl):
 
     def __init__(self, driver, remote, schema):
         super(OvnNbIdl, self).__init__(driver, remote, schema)
-        self._lsp_update_up_event = LogicalSwitchPortUpdateUpEvent(driver)
+        self._lsp_update_up_event = LogicalSwitchPortUpdateUpEvent(
+            driver, driver.port_latency_tracker)
         self._lsp_update_down_event = LogicalSwitchPortUpdateDownEvent(driver)
-        self._lsp_create_up_event = LogicalSwitchPortCreateUpEvent(driver)
-        self._lsp_create_down_event = LogicalSwitchPortCreateDownEvent(driver)
 
-        self.notify_handler.watch_events([self._lsp_create_up_event,
-                                          self._lsp_create_down_event,
-                                          self._lsp_update_up_event,
+        self.notify_handler.watch_events([self._lsp_update_up_event,
                                           self._lsp_update_down_event])
 
-    def unwatch_logical_switch_port_create_events(self):
-        """Unwatch the logical switch port create events.
+    def post_initialize(self, driver):
+        """Reconcile the port statuses with the dump of all ports.
 
         When the ovs idl client connects to the ovsdb-server, it gets
-        a dump of all logical switch ports as events and we need to process
-        them at start up.
-        After the startup, there is no need to watch these events.
-        So unwatch these events.
+        a dump of all logical switch ports. Instead of handling a create
+        event for each of them, the 'up' state of all the ports is collected
+        once the dump is complete and reconciled in bulk by the notify loop.
         """
-        self.notify_handler.unwatch_events([self._lsp_create_up_event,
-                                            self._lsp_create_down_event])
-        self._lsp_create_up_event = None
-        self._lsp_create_down_event = None
-
-    def post_initialize(self, driver):
-        self.unwatch_logical_switch_port_create_events()
+        # Like the notify events, the dump is only handled by the neutron
+        # server which has the event lock.
+        if self.is_lock_contended and not self.has_lock:
+            return
+        # All the ports are reconciled by a single event, so that the ports
+        # of the dump are queried only once.
+        self.notify_handler.queue_event(LogicalSwitchPortStatusDumpEvent(
+            driver, self.tables['Logical_Switch_Port']))
 
 
 class OvnSbIdl(OvnIdl):
@@ -298,7 +505,80 @@ class OvnSbIdl(OvnIdl):
         self.notify_handler.watch_events([self._chassis_event])
 
 
-class OvnConnection(connection.Connection):
+class BaseOvnConnection(connection.Connection):
+    """Connection whose IDL maintains the networking-ovn row indexes"""
+
+    def _get_schema_helper(self):
+        try:
+            return idlutils.get_schema_helper(self.connection,
+                                              self.schema_name)
+        except Exception:
+            # There is a small window for a race, so retry up to a second
+            @retrying.retry(wait_exponential_multiplier=10,
+                            stop_max_delay=1000)
+            def do_get_schema_helper():
+                return idlutils.get_schema_helper(self.connection,
+                                                  self.schema_name)
+            return do_get_schema_helper()
+
+    def _register_tables(self, helper, table_name_list, table_columns=None):
+        if table_columns is not None:
+            # Tables and columns missing from the schema of the server are
+            # skipped, since the helper asserts they exist.
+            schema_tables = helper.schema_json['tables']
+            for table_name, columns in six.iteritems(table_columns):
+                if table_name not in schema_tables:
+                    continue
+                if columns is None:
+                    helper.register_table(table_name)
+                    continue
+                schema_columns = schema_tables[table_name]['columns']
+                helper.register_columns(
+                    table_name,
+                    [column for column in columns if column in schema_columns])
+        elif table_name_list is None:
+            helper.register_all()
+        else:
+            for table_name in table_name_list:
+                helper.register_table(table_name)
+
+    def _load_snapshot(self, idl_):
+        snapshot_dir = ovn_config.get_ovn_idl_snapshot_dir()
+        if not snapshot_dir:
+            return
+        if not idl_snapshot.IdlSnapshot.is_supported(idl_):
+            LOG.warning(_LW('ovn_idl_snapshot_dir is set but the OVS python '
+                            'IDL does not support monitor_cond_since, the '
+                            '%s snapshot is disabled'), self.schema_name)
+            return
+        idl_.load_snapshot(idl_snapshot.IdlSnapshot(
+            snapshot_dir, self.schema_name,
+            ovn_config.get_ovn_idl_snapshot_interval()))
+
+    def _start_thread(self):
+        self.poller = poller.Poller()
+        self.thread = threading.Thread(target=self.run)
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def start(self, table_name_list=None, table_columns=None):
+        # The implementation of this function is same as the base class start()
+        # except that BaseOvnIdl object is created instead of idl.Idl and the
+        # enable_connection_uri() helper isn't called (since ovs-vsctl won't
+        # exist on the controller node when using the reference architecture).
+        with self.lock:
+            if self.idl is not None:
+                return
+
+            helper = self._get_schema_helper()
+            self._register_tables(helper, table_name_list, table_columns)
+            self.idl = BaseOvnIdl(self.connection, helper)
+            self._load_snapshot(self.idl)
+            idlutils.wait_for_change(self.idl, self.timeout)
+            self._start_thread()
+
+
+class OvnConnection(BaseOvnConnection):
 
     def get_ovn_idl_cls(self):
         """Get the ovn idl class
@@ -312,42 +592,22 @@ class OvnConnection(connection.Connection):
         # Return the ovn nb idl for the backward compatibility
         return OvnNbIdl
 
-    def start(self, driver, table_name_list=None):
-        # The implementation of this function is same as the base class start()
-        # except that OvnIdl object is created instead of idl.Idl and the
-        # enable_connection_uri() helper isn't called (since ovs-vsctl won't
-        # exist on the controller node when using the reference architecture).
+    def start(self, driver, table_name_list=None, table_columns=None):
+        # Same as BaseOvnConnection.start() except that the OvnIdl object
+        # handling the notify events is created and the event lock is set.
         with self.lock:
             if self.idl is not None:
                 return
 
-            try:
-                helper = idlutils.get_schema_helper(self.connection,
-                                                    self.schema_name)
-            except Exception:
-                # There is a small window for a race, so retry up to a second
-                @retrying.retry(wait_exponential_multiplier=10,
-                                stop_max_delay=1000)
-                def do_get_schema_helper():
-                    return idlutils.get_schema_helper(self.connection,
-                                                      self.schema_name)
-                helper = do_get_schema_helper()
-
-            if table_name_list is None:
-                helper.register_all()
-            else:
-                for table_name in table_name_list:
-                    helper.register_table(table_name)
-
+            helper = self._get_schema_helper()
+            self._register_tables(helper, table_name_list, table_columns)
             idl_cls = self.get_ovn_idl_cls()
             self.idl = idl_cls(driver, self.connection, helper)
+            self._load_snapshot(self.idl)
             self.idl.set_lock(self.idl.event_lock_name)
             idlutils.wait_for_change(self.idl, self.timeout)
             self.idl.post_initialize(driver)
-            self.poller = poller.Poller()
-            self.thread = threading.Thread(target=self.run)
-            self.thread.setDaemon(True)
-            self.thread.start()
+            self._start_thread()
 
 
 class OvnWorker(worker.NeutronWorker):
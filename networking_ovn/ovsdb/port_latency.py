@@ -0,0 +1,124 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import bisect
+import collections
+import time
+
+from oslo_log import log
+
+from networking_ovn._i18n import _LI, _LW
+
+LOG = log.getLogger(__name__)
+
+# The stages of a port going up, in order:
+#  - nb_commit: the driver committed the Logical_Switch_Port row to the
+#    OVN_Northbound database
+#  - up_received: the notify loop handles the update setting 'up' to True,
+#    after ovn-northd and ovn-controller handled the port
+#  - provisioning_complete: the port is active in neutron, its provisioning
+#    blocks being all removed
+# The stages are timestamped by the process which creates the port in OVN,
+# so only the ports created by the OvnWorker, which handles the up events,
+# are tracked. This is the case of the ports applied from the journal.
+NB_COMMIT = 'nb_commit'
+UP_RECEIVED = 'up_received'
+PROVISIONING_COMPLETE = 'provisioning_complete'
+STAGES = (NB_COMMIT, UP_RECEIVED, PROVISIONING_COMPLETE)
+TOTAL = 'total'
+
+# Upper bounds in seconds of the histogram buckets, the last bucket has no
+# upper bound.
+BUCKETS = (0.1, 0.5, 1, 2, 5, 10, 30, 60, 300)
+
+# Maximum number of ports tracked at once, the oldest ports are evicted
+# first. Ports which never go up would otherwise leak.
+MAX_TRACKED_PORTS = 10000
+
+# Interval in seconds between two logs of the latency histograms.
+REPORT_INTERVAL = 300
+
+
+class PortUpLatencyTracker(object):
+    """Track how long the ports take to go up, stage by stage
+
+    The latency between each stage and the previous one, and the total
+    latency since the NB commit, are recorded in histograms. The ports
+    whose total latency exceeds slow_threshold seconds are logged with the
+    latency of each stage.
+    """
+
+    def __init__(self, slow_threshold):
+        self.slow_threshold = slow_threshold
+        self._ports = collections.OrderedDict()
+        self.histograms = {stage: [0] * (len(BUCKETS) + 1)
+                           for stage in STAGES[1:] + (TOTAL,)}
+        self._reported_at = time.time()
+
+    def is_tracked(self, port_id):
+        return port_id in self._ports
+
+    def record(self, port_id, stage):
+        """Timestamp a stage of a port"""
+        if stage == NB_COMMIT:
+            self._ports.pop(port_id, None)
+            self._ports[port_id] = {NB_COMMIT: time.time()}
+            if len(self._ports) > MAX_TRACKED_PORTS:
+                self._ports.popitem(last=False)
+            return
+        timestamps = self._ports.get(port_id)
+        if timestamps is None:
+            # The port was created before the tracking started, or it went
+            # up already.
+            return
+        timestamps[stage] = time.time()
+        if stage == PROVISIONING_COMPLETE:
+            del self._ports[port_id]
+            self._observe(port_id, timestamps)
+
+    def _observe(self, port_id, timestamps):
+        latencies = {}
+        previous = timestamps[NB_COMMIT]
+        for stage in STAGES[1:]:
+            if stage in timestamps:
+                latencies[stage] = timestamps[stage] - previous
+                previous = timestamps[stage]
+        latencies[TOTAL] = previous - timestamps[NB_COMMIT]
+        for stage, latency in latencies.items():
+            self.histograms[stage][bisect.bisect_left(BUCKETS, latency)] += 1
+
+        if self.slow_threshold and latencies[TOTAL] > self.slow_threshold:
+            LOG.warning(_LW('Port %(port)s took %(total).3f seconds to go up: '
+                            '%(stages)s'),
+                        {'port': port_id, 'total': latencies[TOTAL],
+                         'stages': self._format_latencies(latencies)})
+        now = time.time()
+        if now - self._reported_at >= REPORT_INTERVAL:
+            self._reported_at = now
+            self.report()
+
+    @staticmethod
+    def _format_latencies(latencies):
+        return ', '.join('%s %.3fs' % (stage, latencies[stage])
+                         for stage in STAGES[1:] if stage in latencies)
+
+    def report(self):
+        """Log the latency histograms"""
+        labels = ['<=%ss' % bound for bound in BUCKETS] + [
+            '>%ss' % BUCKETS[-1]]
+        for stage in STAGES[1:] + (TOTAL,):
+            LOG.info(_LI('Port up latency histogram of %(stage)s: '
+                         '%(histogram)s'),
+                     {'stage': stage,
+                      'histogram': ', '.join(
+                          '%s: %d' % (label, count) for label, count in
+                          zip(labels, self.histograms[stage]))})
@@ -29,6 +29,10 @@ class RowEvent(object):
     ROW_UPDATE = idl.ROW_UPDATE
     ROW_DELETE = idl.ROW_DELETE
     ONETIME = False
+    # Events of the same coalesce group are idempotent for a row: when the
+    # notify events are coalesced, a pending event of the group is replaced
+    # by the newer one, and only the latest runs.
+    COALESCE_GROUP = None
 
     def __init__(self, events, table, conditions, old_conditions=None):
         self.table = table
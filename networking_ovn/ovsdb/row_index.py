@@ -0,0 +1,328 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from ovs.db import idl
+import six
+
+from neutron.agent.ovsdb.native import idlutils
+from neutron.common import utils as n_utils
+
+from networking_ovn.common import acl as ovn_acl
+
+_NO_DEFAULT = object()
+
+
+class NameIndex(object):
+    """Secondary name -> row index for the tables replicated by an IDL.
+
+    Every registered table with a 'name' column is indexed. The index is
+    kept up to date from the row notifications delivered by the IDL, so
+    lookups don't have to scan the whole table. Names are not guaranteed
+    to be unique in the OVN schemas, so each name maps to the set of rows
+    using it.
+    """
+
+    def __init__(self, tables):
+        self._tables = tables
+        self._index = {}
+        for table_name, table in six.iteritems(tables):
+            if 'name' in table.columns:
+                self._index[table_name] = {}
+
+    def is_indexed(self, table):
+        return table in self._index
+
+    def notify(self, event, row, old=None):
+        index = self._index.get(row._table.name)
+        if index is None:
+            return
+        if event == idl.ROW_DELETE:
+            self._remove(index, row.name, row.uuid)
+        elif event == idl.ROW_CREATE:
+            self._add(index, row.name, row)
+        else:
+            # On update, the old row only contains the changed columns.
+            try:
+                old_name = old.name
+            except (KeyError, AttributeError):
+                return
+            self._remove(index, old_name, row.uuid)
+            self._add(index, row.name, row)
+
+    def _add(self, index, name, row):
+        index.setdefault(name, {})[row.uuid] = row
+
+    def _remove(self, index, name, row_uuid):
+        rows = index.get(name)
+        if rows is None:
+            return
+        rows.pop(row_uuid, None)
+        if not rows:
+            del index[name]
+
+    def get(self, table, name, txn_rows=None):
+        """Return a row of the table named name, or None
+
+        :param txn_rows: the rows changed by the pending transaction, by
+                         uuid, which may have been renamed, inserted or
+                         deleted without notification
+        """
+        txn_rows = txn_rows or {}
+        rows = self._index[table].get(name)
+        if rows:
+            table_rows = self._tables[table].rows
+            for row_uuid, row in list(rows.items()):
+                if table_rows.get(row_uuid) is not row:
+                    # The IDL drops its rows without notifications when it
+                    # reconnects. The rows deleted by the pending transaction
+                    # are restored if it aborts.
+                    if row_uuid not in txn_rows:
+                        self._remove(self._index[table], name, row_uuid)
+                # The row may be renamed by the pending transaction.
+                elif row.name == name:
+                    return row
+        # The rows inserted or renamed by the pending transaction.
+        for row in six.itervalues(txn_rows):
+            if (row._table.name == table and row._changes and
+                    'name' in row._changes and row.name == name):
+                return row
+        return None
+
+
+class DhcpOptionsIndex(object):
+    """Index of the DHCP_Options rows created by the OVN ML2 driver.
+
+    Subnet rows are indexed by subnet_id, and the port-specific rows by
+    subnet_id and port_id, from the external_ids of the rows.
+    """
+
+    TABLE = 'DHCP_Options'
+
+    def __init__(self, tables):
+        self._tables = tables
+        self._subnets = {}
+        self._ports = {}
+
+    def notify(self, event, row, old=None):
+        if row._table.name != self.TABLE:
+            return
+        if event == idl.ROW_DELETE:
+            self._remove(row.uuid, row.external_ids)
+        elif event == idl.ROW_CREATE:
+            self._add(row)
+        else:
+            try:
+                old_external_ids = old.external_ids
+            except (KeyError, AttributeError):
+                return
+            self._remove(row.uuid, old_external_ids)
+            self._add(row)
+
+    def _add(self, row):
+        subnet_id = row.external_ids.get('subnet_id')
+        if not subnet_id:
+            # This row is not created by OVN ML2 driver. Ignore it.
+            return
+        port_id = row.external_ids.get('port_id')
+        if port_id:
+            self._ports.setdefault(subnet_id, {})[port_id] = row
+        else:
+            self._subnets[subnet_id] = row
+
+    def _remove(self, row_uuid, external_ids):
+        subnet_id = external_ids.get('subnet_id')
+        if not subnet_id:
+            return
+        port_id = external_ids.get('port_id')
+        if port_id:
+            port_rows = self._ports.get(subnet_id, {})
+            row = port_rows.get(port_id)
+            if row is not None and row.uuid == row_uuid:
+                del port_rows[port_id]
+                if not port_rows:
+                    del self._ports[subnet_id]
+        else:
+            row = self._subnets.get(subnet_id)
+            if row is not None and row.uuid == row_uuid:
+                del self._subnets[subnet_id]
+
+    def _is_current(self, row):
+        # The IDL drops its rows without notifications when it reconnects.
+        return self._tables[self.TABLE].rows.get(row.uuid) is row
+
+    def get_subnet_row(self, subnet_id):
+        row = self._subnets.get(subnet_id)
+        if row is not None and self._is_current(row):
+            return row
+        return None
+
+    def get_port_row(self, subnet_id, port_id):
+        row = self._ports.get(subnet_id, {}).get(port_id)
+        if row is not None and self._is_current(row):
+            return row
+        return None
+
+    def get_port_rows(self, subnet_id):
+        """Return a dictionary of the subnet's port rows keyed by port_id"""
+        return {port_id: row for port_id, row in
+                six.iteritems(self._ports.get(subnet_id, {}))
+                if self._is_current(row)}
+
+
+class AclIndex(object):
+    """Index of the ACL rows by the neutron:lport of their external_ids.
+
+    ACLs created by the driver belong to a single port, and a port to a
+    single logical switch, so the port id is enough to locate them. The
+    canonical form of each ACL (see acl.acl_key) is kept with its row.
+    """
+
+    TABLE = 'ACL'
+
+    def __init__(self, tables):
+        self._tables = tables
+        self._ports = {}
+
+    def notify(self, event, row, old=None):
+        if row._table.name != self.TABLE:
+            return
+        if event == idl.ROW_DELETE:
+            self._remove(row.uuid, row.external_ids)
+        elif event == idl.ROW_CREATE:
+            self._add(row)
+        else:
+            # Any column change alters the canonical form of the ACL, so
+            # always re-add the row.
+            try:
+                old_external_ids = old.external_ids
+            except (KeyError, AttributeError):
+                old_external_ids = row.external_ids
+            self._remove(row.uuid, old_external_ids)
+            self._add(row)
+
+    def _add(self, row):
+        port_id = row.external_ids.get('neutron:lport')
+        if not port_id:
+            return
+        acl = {column: getattr(row, column)
+               for column in ovn_acl.ACL_KEY_COLUMNS}
+        acl['external_ids'] = row.external_ids
+        self._ports.setdefault(port_id, {})[row.uuid] = (
+            ovn_acl.acl_key(acl), row)
+
+    def _remove(self, row_uuid, external_ids):
+        port_id = external_ids.get('neutron:lport')
+        port_acls = self._ports.get(port_id)
+        if port_acls is None:
+            return
+        port_acls.pop(row_uuid, None)
+        if not port_acls:
+            del self._ports[port_id]
+
+    def get_port_acls(self, port_id):
+        """Return a dictionary of the port's ACL rows by canonical form
+
+        Each canonical form maps to the list of rows having it, since the
+        NB database may hold duplicate ACLs.
+        """
+        table_rows = self._tables[self.TABLE].rows
+        port_acls = {}
+        for row_uuid, (key, row) in six.iteritems(
+                self._ports.get(port_id, {})):
+            # The IDL drops its rows without notifications when it
+            # reconnects, so skip the rows which are no longer current.
+            if table_rows.get(row_uuid) is row:
+                port_acls.setdefault(key, []).append(row)
+        return port_acls
+
+
+class ChassisPhysnetIndex(object):
+    """Index of the Chassis hostnames by the physnets of their bridges
+
+    The physnets of a chassis are parsed once from the ovn-bridge-mappings
+    of its external_ids when the row is created or updated.
+    """
+
+    TABLE = 'Chassis'
+
+    def __init__(self, tables):
+        self._tables = tables
+        self._chassis = {}
+        self._physnets = {}
+
+    @staticmethod
+    def _parse_physnets(row):
+        bridge_mappings = row.external_ids.get('ovn-bridge-mappings', '')
+        try:
+            return set(n_utils.parse_mappings(bridge_mappings.split(',')))
+        except ValueError:
+            return set()
+
+    def notify(self, event, row, old=None):
+        if row._table.name != self.TABLE:
+            return
+        self._remove(row.uuid)
+        if event != idl.ROW_DELETE:
+            self._add(row)
+
+    def _add(self, row):
+        physnets = self._parse_physnets(row)
+        self._chassis[row.uuid] = (row, physnets)
+        for physnet in physnets:
+            self._physnets.setdefault(physnet, set()).add(row.uuid)
+
+    def _remove(self, row_uuid):
+        row, physnets = self._chassis.pop(row_uuid, (None, ()))
+        for physnet in physnets:
+            chassis = self._physnets[physnet]
+            chassis.discard(row_uuid)
+            if not chassis:
+                del self._physnets[physnet]
+
+    def get_hostnames(self, physnet):
+        """Return the set of hostnames of the chassis bridging physnet"""
+        table_rows = self._tables[self.TABLE].rows
+        hostnames = set()
+        for row_uuid in self._physnets.get(physnet, ()):
+            row = self._chassis[row_uuid][0]
+            # The IDL drops its rows without notifications when it
+            # reconnects, so skip the rows which are no longer current.
+            if table_rows.get(row_uuid) is row:
+                hostnames.add(row.hostname)
+        return hostnames
+
+
+def _get_txn_rows(idl_):
+    txn = getattr(idl_, 'txn', None)
+    return getattr(txn, '_txn_rows', None) or {}
+
+
+def row_by_name(idl_, table, name, default=_NO_DEFAULT):
+    """Look up an IDL row by the value of its 'name' column
+
+    Uses the name index of the IDL when it maintains one. The index is only
+    updated from the IDL notifications, so the rows inserted or renamed by
+    the pending transaction are looked up in the rows of the transaction,
+    without scanning the table. The tables without index, and the IDLs
+    without index, fall back to idlutils.row_by_value.
+    """
+    name_index = getattr(idl_, 'name_index', None)
+    if isinstance(name_index, NameIndex) and name_index.is_indexed(table):
+        row = name_index.get(table, name, _get_txn_rows(idl_))
+        if row is not None:
+            return row
+        if default is _NO_DEFAULT:
+            raise idlutils.RowNotFound(table=table, col='name', match=name)
+        return default
+    if default is _NO_DEFAULT:
+        return idlutils.row_by_value(idl_, table, 'name', name)
+    return idlutils.row_by_value(idl_, table, 'name', name, default)
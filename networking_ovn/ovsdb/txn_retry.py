@@ -0,0 +1,201 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import random
+import time
+
+from oslo_log import log
+from oslo_utils import excutils
+from ovs.db import idl
+
+from neutron.agent.ovsdb import impl_idl
+from neutron.agent.ovsdb.native import idlutils
+
+from networking_ovn._i18n import _, _LI
+from networking_ovn.common import config as cfg
+from networking_ovn.ovsdb import commands as cmd
+
+LOG = log.getLogger(__name__)
+
+# The backoff doubles with each retry up to 2 ** MAX_BACKOFF_EXPONENT times
+# its base.
+MAX_BACKOFF_EXPONENT = 5
+
+# Interval in seconds between two logs of the retry statistics.
+REPORT_INTERVAL = 300
+
+# Result of a transaction to retry after a backoff, see RetryTransaction.
+TRY_AGAIN = object()
+
+
+def get_verified_columns(txn):
+    """Return the (table, row uuid, column) verified by an IDL transaction
+
+    Without mutate support, the commands verify the columns they rewrite
+    (see commands._updatevalues_in_list), so these are the columns whose
+    concurrent changes make the transaction fail with TRY_AGAIN. Must be
+    called before the commit, which clears the rows of the transaction.
+    """
+    verified = set()
+    for row in getattr(txn, '_txn_rows', {}).values():
+        for column in getattr(row, '_prereqs', None) or {}:
+            verified.add((row._table.name, row.uuid, column))
+    return verified
+
+
+class RetryStats(object):
+    """Count the transactions retried and the columns they conflicted on"""
+
+    def __init__(self):
+        self.transactions = 0
+        self.retried_transactions = 0
+        self.retries = 0
+        self.conflicts = collections.Counter()
+        self._reported_at = time.time()
+
+    def record(self, attempts, conflicts):
+        self.transactions += 1
+        if attempts > 1:
+            self.retried_transactions += 1
+            self.retries += attempts - 1
+            self.conflicts.update(conflicts)
+        now = time.time()
+        if now - self._reported_at >= REPORT_INTERVAL:
+            self._reported_at = now
+            self.report()
+
+    def report(self):
+        """Log the retry statistics"""
+        LOG.info(_LI('%(retried)d of %(total)d OVN_Northbound transactions '
+                     'were retried %(retries)d times, conflicting on: '
+                     '%(columns)s'),
+                 {'retried': self.retried_transactions,
+                  'total': self.transactions, 'retries': self.retries,
+                  'columns': ', '.join(
+                      '%s.%s: %d' % (table, column, count) for
+                      (table, column), count in self.conflicts.most_common())
+                  or 'none'})
+
+
+class RetryTransaction(impl_idl.Transaction):
+    """Transaction accounting and spacing out its TRY_AGAIN retries
+
+    A transaction fails with TRY_AGAIN when a column it verified was changed
+    by another client, typically another neutron-server worker updating the
+    same Address_Set or Logical_Switch. The conflicting columns are counted
+    in the retry statistics.
+
+    The transactions are committed by the OVSDB connection thread, which
+    must not sleep since it serves all the transactions and the IDL updates
+    of the process. If a backoff is configured, do_commit() returns
+    TRY_AGAIN instead of retrying, and commit() waits for a random time
+    growing with the attempts in the thread of the caller before queueing
+    the transaction again.
+    """
+
+    stats = RetryStats()
+
+    def __init__(self, *args, **kwargs):
+        super(RetryTransaction, self).__init__(*args, **kwargs)
+        self.backoff = cfg.get_ovn_nb_txn_retry_backoff() / 1000.0
+        self.start_time = None
+        self.attempts = 0
+        self.conflicts = collections.Counter()
+        self._seqno = None
+
+    def commit(self):
+        # Merge the commands updating the same rows once, rather than at
+        # each attempt.
+        self.commands, merged = cmd.merge_commands(self.commands)
+        if merged:
+            LOG.debug("Merged %(merged)d commands of the transaction, "
+                      "%(left)d commands left",
+                      {'merged': merged, 'left': len(self.commands)})
+        self.start_time = time.time()
+        retries = 0
+        while True:
+            result = super(RetryTransaction, self).commit()
+            if result is not TRY_AGAIN:
+                return result
+            retries += 1
+            if self.timeout_exceeded():
+                self.stats.record(self.attempts, self.conflicts)
+                raise RuntimeError(_("OVS transaction timed out"))
+            time.sleep(self.get_backoff(retries))
+
+    def get_backoff(self, attempts):
+        backoff = self.backoff * 2 ** min(attempts - 1, MAX_BACKOFF_EXPONENT)
+        return min(random.uniform(0, backoff),
+                   max(self.time_remaining(), 0))
+
+    def do_commit(self):
+        if self.start_time is None:
+            self.start_time = time.time()
+        while True:
+            if self.attempts > 0 and self.timeout_exceeded():
+                self.stats.record(self.attempts, self.conflicts)
+                raise RuntimeError(_("OVS transaction timed out"))
+            if self._seqno is not None:
+                # Wait for the IDL to get the change which made the last
+                # attempt fail before verifying the rows again.
+                idlutils.wait_for_change(self.api.idl, self.time_remaining(),
+                                         self._seqno)
+                self._seqno = None
+            self.attempts += 1
+            txn = idl.Transaction(self.api.idl)
+            for i, command in enumerate(self.commands):
+                LOG.debug("Running txn command(idx=%(idx)s): %(cmd)s",
+                          {'idx': i, 'cmd': command})
+                try:
+                    command.run_idl(txn)
+                except Exception:
+                    with excutils.save_and_reraise_exception() as ctx:
+                        txn.abort()
+                        if not self.check_error:
+                            ctx.reraise = False
+            self.pre_commit(txn)
+            # The IDL transaction forgets its rows once committed.
+            verified = get_verified_columns(txn)
+            seqno = self.api.idl.change_seqno
+            status = txn.commit_block()
+            if status == txn.TRY_AGAIN:
+                self.conflicts.update((table, column)
+                                      for table, _row_uuid, column in verified)
+                LOG.debug("OVSDB transaction returned TRY_AGAIN on attempt "
+                          "%(attempts)d, verified columns: %(columns)s",
+                          {'attempts': self.attempts,
+                           'columns': ', '.join(sorted(
+                               '%s.%s' % (table, column)
+                               for table, _row_uuid, column in verified))})
+                self._seqno = seqno
+                if self.backoff:
+                    # The caller backs off before queueing it again.
+                    return TRY_AGAIN
+                continue
+            self.stats.record(self.attempts, self.conflicts)
+            if status == txn.ERROR:
+                msg = _("OVSDB Error: %s") % txn.get_error()
+                if self.log_errors:
+                    LOG.error(msg)
+                if self.check_error:
+                    raise RuntimeError(msg)
+                return
+            elif status == txn.ABORTED:
+                LOG.debug("Transaction aborted")
+                return
+            elif status == txn.UNCHANGED:
+                LOG.debug("Transaction caused no change")
+            elif status == txn.SUCCESS:
+                self.post_commit(txn)
+
+            return [command.result for command in self.commands]
@@ -18,6 +18,7 @@ import mock
 from neutron_lib import constants as const
 
 from networking_ovn.common import acl as ovn_acl
+from networking_ovn.common import config as ovn_config
 from networking_ovn.common import constants as ovn_const
 from networking_ovn.common import utils as ovn_utils
 from networking_ovn.ovsdb import commands as cmd
@@ -194,12 +195,12 @@ class TestACLs(base.TestCase):
         port2_acls_old = [aclport2_old1, aclport2_old2, aclport2_old3]
         acls_old_dict = {'%s' % (port1['id']): port1_acls_old,
                          '%s' % (port2['id']): port2_acls_old}
-        acl_obj_dict = {str(aclport1_old1): 'row1',
-                        str(aclport1_old2): 'row2',
-                        str(aclport1_old3): 'row3',
-                        str(aclport2_old1): 'row4',
-                        str(aclport2_old2): 'row5',
-                        str(aclport2_old3): 'row6'}
+        acl_obj_dict = {ovn_acl.acl_key(aclport1_old1): ['row1'],
+                        ovn_acl.acl_key(aclport1_old2): ['row2'],
+                        ovn_acl.acl_key(aclport1_old3): ['row3'],
+                        ovn_acl.acl_key(aclport2_old1): ['row4'],
+                        ovn_acl.acl_key(aclport2_old2): ['row5'],
+                        ovn_acl.acl_key(aclport2_old3): ['row6']}
         # NEW ACLs, allow IPv6 communication
         aclport1_new1 = {'priority': 1002, 'direction': 'from-lport',
                          'lport': port1['id'], 'lswitch': lswitch_name,
@@ -271,6 +272,31 @@ class TestACLs(base.TestCase):
         self.assertEqual(acl_dels, new_acl_dels)
         self.assertEqual(acl_adds, new_acl_adds)
 
+    def test__update_acls_compute_difference_duplicates(self):
+        lswitch_name = 'lswitch-1'
+        port = {'id': 'port-id1', 'network_id': lswitch_name}
+        acl_old = {'priority': 1002, 'direction': 'to-lport',
+                   'action': 'allow-related', 'log': False,
+                   'lport': port['id'], 'lswitch': lswitch_name,
+                   'match': 'outport == "port-id1" && ip4',
+                   'external_ids': {'neutron:lport': port['id']}}
+        acl_new = dict(acl_old, match='outport == "port-id1" && ip6')
+        # The NB database holds the old acl twice
+        acls_old_dict = {port['id']: [acl_old, copy.deepcopy(acl_old)]}
+        acls_new_dict = {port['id']: [acl_new, copy.deepcopy(acl_new)]}
+        acl_obj_dict = {ovn_acl.acl_key(acl_old): ['row1', 'row2']}
+        update_cmd = cmd.UpdateACLsCommand(self.driver._nb_ovn,
+                                           [lswitch_name],
+                                           iter([port]),
+                                           acls_new_dict)
+        acl_dels, acl_adds = update_cmd._compute_acl_differences(
+            iter([port]), acls_old_dict, acls_new_dict, acl_obj_dict)
+        self.assertEqual({lswitch_name: ['row1', 'row2']}, acl_dels)
+        expected_acl = dict(acl_new)
+        del expected_acl['lport']
+        del expected_acl['lswitch']
+        self.assertEqual({lswitch_name: [expected_acl]}, acl_adds)
+
     def test__get_update_data_without_compare(self):
         lswitch_name = 'lswitch-1'
         port1 = {'id': 'port-id1',
@@ -327,6 +353,24 @@ class TestACLs(base.TestCase):
             self.assertEqual(expected_acls, acl_del_dict)
             self.assertEqual({}, acl_add_dict)
 
+    def test_acl_key(self):
+        acl = {'lswitch': 'neutron-network_id1', 'lport': 'port-id1',
+               'priority': 1002, 'action': 'allow-related', 'log': False,
+               'direction': 'to-lport', 'match': 'outport == "port-id1"',
+               'external_ids': {'neutron:lport': 'port-id1', 'foo': 'bar'}}
+        acl_row_values = {'priority': 1002, 'action': 'allow-related',
+                          'log': False, 'direction': 'to-lport',
+                          'match': 'outport == "port-id1"',
+                          'external_ids': {'foo': 'bar',
+                                           'neutron:lport': 'port-id1'}}
+        self.assertEqual(ovn_acl.acl_key(acl),
+                         ovn_acl.acl_key(acl_row_values))
+        acl_row_values['priority'] = 1001
+        self.assertNotEqual(ovn_acl.acl_key(acl),
+                            ovn_acl.acl_key(acl_row_values))
+        self.assertEqual(1, len({ovn_acl.acl_key(acl),
+                                 ovn_acl.acl_key(dict(acl))}))
+
     def test_acl_protocol_and_ports_for_tcp_and_udp_number(self):
         sg_rule = {'port_range_min': None,
                    'port_range_max': None}
@@ -463,6 +507,39 @@ class TestACLs(base.TestCase):
         match = ovn_acl.acl_remote_group_id(sg_rule, ip_version)
         self.assertEqual(' && ip4.dst == $' + addrset_name, match)
 
+    def test__add_sg_rule_acl_for_port_cached_match(self):
+        sg_rule = fakes.FakeSecurityGroupRule.create_one_security_group_rule(
+            {'direction': 'egress'}).info()
+        port1 = {'id': 'port-id1', 'network_id': 'network-id'}
+        port2 = {'id': 'port-id2', 'network_id': 'network-id'}
+        self.addCleanup(ovn_acl.invalidate_sg_rule_match, sg_rule['id'])
+        with mock.patch.object(ovn_acl, 'acl_ethertype',
+                               wraps=ovn_acl.acl_ethertype) as ethertype:
+            acl1 = ovn_acl._add_sg_rule_acl_for_port(port1, sg_rule)
+            acl2 = ovn_acl._add_sg_rule_acl_for_port(port2, sg_rule)
+            # The match of the rule is only built once
+            self.assertEqual(1, ethertype.call_count)
+        self.assertEqual('inport == "port-id1" && ip4 && ip4.dst == '
+                         '0.0.0.0/0 && tcp && tcp.dst == 22', acl1['match'])
+        self.assertEqual('inport == "port-id2" && ip4 && ip4.dst == '
+                         '0.0.0.0/0 && tcp && tcp.dst == 22', acl2['match'])
+
+        # A change of the rule invalidates its match
+        sg_rule['port_range_max'] = 23
+        acl1 = ovn_acl._add_sg_rule_acl_for_port(port1, sg_rule)
+        self.assertEqual('inport == "port-id1" && ip4 && ip4.dst == '
+                         '0.0.0.0/0 && tcp && tcp.dst >= 22 && '
+                         'tcp.dst <= 23', acl1['match'])
+
+    def test_invalidate_sg_rule_match(self):
+        sg_rule = fakes.FakeSecurityGroupRule.create_one_security_group_rule(
+            ).info()
+        port = {'id': 'port-id', 'network_id': 'network-id'}
+        ovn_acl._add_sg_rule_acl_for_port(port, sg_rule)
+        self.assertIn(sg_rule['id'], ovn_acl._sg_rule_matches)
+        ovn_acl.invalidate_sg_rule_match(sg_rule['id'])
+        self.assertNotIn(sg_rule['id'], ovn_acl._sg_rule_matches)
+
     def test_update_acls_for_security_group(self):
         sg = fakes.FakeSecurityGroup.create_one_security_group().info()
         remote_sg = fakes.FakeSecurityGroup.create_one_security_group().info()
@@ -497,6 +574,246 @@ class TestACLs(base.TestCase):
             is_add_acl=True
         )
 
+    def _test_update_acls_for_security_group_chunks(self, update_acls):
+        sg_rule = fakes.FakeSecurityGroupRule.create_one_security_group_rule(
+            ).info()
+        ports = [fakes.FakePort.create_one_port().info() for i in range(3)]
+        ports_by_id = dict((port['id'], port) for port in ports)
+        self.plugin.get_ports.side_effect = (
+            lambda context, filters: [ports_by_id[port_id]
+                                      for port_id in filters['id']])
+        self.driver._nb_ovn.update_acls.side_effect = update_acls
+        sg_ports_cache = {'sg-id': [{'port_id': port['id']}
+                                    for port in ports]}
+        with mock.patch.object(ovn_acl, 'SG_RULE_FANOUT_CHUNK_SIZE', 2):
+            ovn_acl.update_acls_for_security_group(
+                self.plugin, self.admin_context, self.driver._nb_ovn,
+                'sg-id', sg_rule, sg_ports_cache=sg_ports_cache)
+        return [call[1]['filters']['id']
+                for call in self.plugin.get_ports.call_args_list]
+
+    def test_update_acls_for_security_group_chunks(self):
+        chunks = self._test_update_acls_for_security_group_chunks(None)
+        # The ports are fetched and updated two at a time
+        self.assertEqual([2, 1], [len(chunk) for chunk in chunks])
+        self.assertEqual(2, self.driver._nb_ovn.update_acls.call_count)
+
+    def test_update_acls_for_security_group_retry_chunk(self):
+        results = [mock.Mock(), RuntimeError('OVSDB Error'), mock.Mock()]
+
+        def update_acls(*args, **kwargs):
+            result = results.pop(0)
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        with mock.patch.object(ovn_acl, 'add_acls',
+                               return_value=[]) as add_acls:
+            chunks = self._test_update_acls_for_security_group_chunks(
+                update_acls)
+        # Only the failed chunk is retried
+        self.assertEqual([chunks[1]], chunks[2:])
+        self.assertEqual(3, self.driver._nb_ovn.update_acls.call_count)
+        # The failed transaction may have been committed, so the retried
+        # ports have their ACLs compared rather than added again.
+        self.assertEqual(len(chunks[1]), add_acls.call_count)
+        update_acls_calls = self.driver._nb_ovn.update_acls.call_args_list
+        self.assertFalse(update_acls_calls[1][1]['need_compare'])
+        self.assertTrue(update_acls_calls[2][1]['need_compare'])
+
+    def test_update_acls_for_security_group_chunk_failed(self):
+        self.assertRaises(
+            RuntimeError, self._test_update_acls_for_security_group_chunks,
+            RuntimeError('OVSDB Error'))
+        self.assertEqual(2 * (ovn_acl.SG_RULE_FANOUT_RETRIES + 1),
+                         self.driver._nb_ovn.update_acls.call_count)
+
+    def _enable_port_groups(self):
+        ovn_config.cfg.CONF.set_override('ovn_port_groups', True,
+                                         group='ovn')
+        self.addCleanup(ovn_config.cfg.CONF.clear_override,
+                        'ovn_port_groups', group='ovn')
+
+    def test_sg_rule_acl_for_port_group(self):
+        sg_rule = fakes.FakeSecurityGroupRule.create_one_security_group_rule({
+            'security_group_id': 'sg-id',
+            'direction': 'ingress',
+            'ethertype': 'IPv4',
+            'remote_group_id': None,
+            'remote_ip_prefix': '1.1.1.0/24',
+            'protocol': 'tcp',
+            'port_range_min': 22,
+            'port_range_max': 22,
+        }).info()
+        acl = ovn_acl.sg_rule_acl_for_port_group(sg_rule)
+        self.assertEqual(
+            {'priority': ovn_const.ACL_PRIORITY_ALLOW,
+             'action': ovn_const.ACL_ACTION_ALLOW_RELATED,
+             'log': False,
+             'direction': 'to-lport',
+             'match': ('outport == @pg_sg_id && ip4 && '
+                       'ip4.src == 1.1.1.0/24 && tcp && tcp.dst == 22'),
+             'external_ids': {ovn_const.OVN_SG_RULE_EXT_ID_KEY:
+                              sg_rule['id']}},
+            acl)
+
+    def test_acl_port_groups(self):
+        port = fakes.FakePort.create_one_port({
+            'security_groups': ['sg-id1', 'sg-id2']
+        }).info()
+        self.assertEqual([ovn_const.OVN_DROP_PORT_GROUP_NAME,
+                          'pg_sg_id1', 'pg_sg_id2'],
+                         ovn_acl.acl_port_groups(port))
+        port['security_groups'] = []
+        self.assertEqual([], ovn_acl.acl_port_groups(port))
+
+    def test_add_acls_port_groups(self):
+        self._enable_port_groups()
+        port = fakes.FakePort.create_one_port({
+            'security_groups': ['sg-id']
+        }).info()
+        # The drop and rule ACLs belong to the port groups of the port
+        self.assertEqual([], ovn_acl.add_acls(self.plugin,
+                                              self.admin_context,
+                                              port, {}, {}))
+
+    def test_update_acls_for_security_group_port_groups(self):
+        self._enable_port_groups()
+        sg_rule = fakes.FakeSecurityGroupRule.create_one_security_group_rule({
+            'security_group_id': 'sg-id'
+        }).info()
+        expected_acl = ovn_acl.sg_rule_acl_for_port_group(sg_rule)
+
+        ovn_acl.update_acls_for_security_group(self.plugin,
+                                               self.admin_context,
+                                               self.driver._nb_ovn,
+                                               'sg-id',
+                                               sg_rule)
+        self.driver._nb_ovn.add_port_group_acls.assert_called_once_with(
+            'pg_sg_id', [expected_acl])
+        ovn_acl.update_acls_for_security_group(self.plugin,
+                                               self.admin_context,
+                                               self.driver._nb_ovn,
+                                               'sg-id',
+                                               sg_rule,
+                                               is_add_acl=False)
+        self.driver._nb_ovn.delete_port_group_acls.assert_called_once_with(
+            'pg_sg_id', [expected_acl])
+        # The ports of the security group are not fetched
+        self.assertFalse(self.plugin.get_ports.called)
+        self.driver._nb_ovn.update_acls.assert_not_called()
+
+    def _enable_acl_aggregation(self):
+        ovn_config.cfg.CONF.set_override('ovn_acl_aggregation', True,
+                                         group='ovn')
+        self.addCleanup(ovn_config.cfg.CONF.clear_override,
+                        'ovn_acl_aggregation', group='ovn')
+
+    def _sg_rule(self, rule_id, **kwargs):
+        sg_rule = {'id': rule_id,
+                   'security_group_id': 'sg-id',
+                   'direction': 'ingress',
+                   'ethertype': 'IPv4',
+                   'remote_group_id': None,
+                   'remote_ip_prefix': None,
+                   'protocol': 'tcp',
+                   'port_range_min': None,
+                   'port_range_max': None}
+        sg_rule.update(kwargs)
+        return sg_rule
+
+    def test_aggregate_sg_rules(self):
+        rules = [
+            self._sg_rule('r1', remote_ip_prefix='10.0.0.0/24',
+                          port_range_min=22, port_range_max=22),
+            self._sg_rule('r2', remote_ip_prefix='10.0.1.0/24',
+                          port_range_min=22, port_range_max=22),
+            self._sg_rule('r3', remote_ip_prefix='10.0.0.0/23',
+                          port_range_min=80, port_range_max=80),
+            self._sg_rule('r4', remote_ip_prefix='10.0.0.0/23',
+                          port_range_min=1000, port_range_max=2000),
+            self._sg_rule('r5', direction='egress', protocol='udp',
+                          port_range_min=53, port_range_max=53),
+            self._sg_rule('r6', remote_ip_prefix='192.168.0.0/24',
+                          protocol='icmp', port_range_min=8),
+            self._sg_rule('r7', remote_ip_prefix='192.168.2.0/24',
+                          protocol='icmp', port_range_min=8)]
+
+        aggregated_rules = ovn_acl.aggregate_sg_rules(rules)
+
+        self.assertEqual(
+            [{'id': None, 'security_group_id': 'sg-id',
+              'direction': 'ingress', 'rule_ids': ['r1', 'r2', 'r3', 'r4'],
+              'match': (' && ip4 && ip4.src == 10.0.0.0/23 && tcp && '
+                        '((tcp.dst == {22, 80}) || '
+                        '(tcp.dst >= 1000 && tcp.dst <= 2000))')},
+             # The rules which are not merged are left as is
+             rules[4],
+             {'id': None, 'security_group_id': 'sg-id',
+              'direction': 'ingress', 'rule_ids': ['r6', 'r7'],
+              'match': (' && ip4 && '
+                        'ip4.src == {192.168.0.0/24, 192.168.2.0/24} && '
+                        'icmp4 && icmp4.type == 8')}],
+            aggregated_rules)
+
+    def test_acl_port_ranges(self):
+        self.assertEqual(' && tcp.dst >= 20 && tcp.dst <= 25',
+                         ovn_acl.acl_port_ranges(
+                             'tcp', [(20, 22), (23, 23), (21, 25)]))
+        # A rule without port range matches all the ports
+        self.assertEqual('', ovn_acl.acl_port_ranges('tcp', [(22, 22), None]))
+
+    def test_add_acls_aggregation(self):
+        self._enable_acl_aggregation()
+        port = fakes.FakePort.create_one_port({
+            'security_groups': ['sg-id']
+        }).info()
+        sg = {'id': 'sg-id', 'security_group_rules': [
+            self._sg_rule('r1', remote_ip_prefix='10.0.0.0/24',
+                          port_range_min=22, port_range_max=22),
+            self._sg_rule('r2', remote_ip_prefix='10.0.1.0/24',
+                          port_range_min=22, port_range_max=22)]}
+
+        acls = ovn_acl.add_acls(self.plugin, self.admin_context, port,
+                                {'sg-id': sg}, {})
+
+        # The drop ACLs and a single ACL for the two rules
+        self.assertEqual(3, len(acls))
+        self.assertEqual('outport == "%s" && ip4 && ip4.src == 10.0.0.0/23 '
+                         '&& tcp && tcp.dst == 22' % port['id'],
+                         acls[2]['match'])
+        self.assertEqual({'neutron:lport': port['id'],
+                          ovn_const.OVN_SG_RULE_IDS_EXT_ID_KEY: 'r1,r2'},
+                         acls[2]['external_ids'])
+
+    def test_update_acls_for_security_group_port_groups_aggregation(self):
+        self._enable_port_groups()
+        self._enable_acl_aggregation()
+        sg_rule1 = self._sg_rule('r1', remote_ip_prefix='10.0.0.0/24')
+        sg_rule2 = self._sg_rule('r2', remote_ip_prefix='10.0.1.0/24')
+        self.plugin.get_security_group = mock.Mock(return_value={
+            'id': 'sg-id', 'security_group_rules': [sg_rule1, sg_rule2]})
+
+        ovn_acl.update_acls_for_security_group(self.plugin,
+                                               self.admin_context,
+                                               self.driver._nb_ovn,
+                                               'sg-id',
+                                               sg_rule2)
+
+        # The ACL of the first rule is replaced by the merged ACL
+        self.driver._nb_ovn.delete_port_group_acls.assert_called_once_with(
+            'pg_sg_id', [ovn_acl.sg_rule_acl_for_port_group(sg_rule1)])
+        self.driver._nb_ovn.add_port_group_acls.assert_called_once_with(
+            'pg_sg_id',
+            [{'priority': ovn_const.ACL_PRIORITY_ALLOW,
+              'action': ovn_const.ACL_ACTION_ALLOW_RELATED,
+              'log': False,
+              'direction': 'to-lport',
+              'match': ('outport == @pg_sg_id && ip4 && '
+                        'ip4.src == 10.0.0.0/23 && tcp'),
+              'external_ids': {
+                  ovn_const.OVN_SG_RULE_IDS_EXT_ID_KEY: 'r1,r2'}}])
+
     def test_acl_port_ips(self):
         port4 = fakes.FakePort.create_one_port({
             'fixed_ips': [{'subnet_id': 'subnet-ipv4',
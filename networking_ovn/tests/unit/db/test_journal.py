@@ -0,0 +1,167 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+
+from networking_ovn.common import config as ovn_config
+from networking_ovn.common import constants as ovn_const
+from networking_ovn.db import journal
+from networking_ovn.tests import base
+
+
+class TestOvnJournal(base.TestCase):
+
+    def setUp(self):
+        super(TestOvnJournal, self).setUp()
+        self.driver = mock.Mock()
+        self.driver._nb_ovn.idl.is_lock_contended = False
+        self.journal = journal.OvnJournal(self.driver)
+        self.context = mock.MagicMock()
+        mock.patch.object(journal.n_context, 'get_admin_context',
+                          return_value=self.context).start()
+        self.get_pending_entries = mock.patch.object(
+            journal, 'get_pending_entries').start()
+        self.delete_entry = mock.patch.object(journal, 'delete_entry').start()
+        self.addCleanup(mock.patch.stopall)
+
+    def _entry(self, seqnum, object_uuid):
+        return mock.Mock(seqnum=seqnum, object_type=ovn_const.JOURNAL_PORT,
+                         object_uuid=object_uuid,
+                         operation=ovn_const.JOURNAL_UPDATE,
+                         data={'current': {'id': object_uuid,
+                                           'network_id': 'net1'}},
+                         state=ovn_const.JOURNAL_PENDING, retry_count=0)
+
+    def test_sync_pending(self):
+        entries = [self._entry(1, 'port1'), self._entry(2, 'port2')]
+        self.get_pending_entries.side_effect = [entries, []]
+        self.journal.sync_pending()
+        self.assertEqual(
+            [mock.call(ovn_const.JOURNAL_PORT, ovn_const.JOURNAL_UPDATE,
+                       entry.data) for entry in entries],
+            self.driver.apply_journal_entry.call_args_list)
+        self.assertEqual([mock.call(self.context, entry)
+                          for entry in entries],
+                         self.delete_entry.call_args_list)
+
+    def test_sync_pending_no_lock(self):
+        self.driver._nb_ovn.idl.is_lock_contended = True
+        self.driver._nb_ovn.idl.has_lock = False
+        self.journal.sync_pending()
+        self.assertFalse(self.get_pending_entries.called)
+
+    def test_sync_pending_retry(self):
+        entry1 = self._entry(1, 'port1')
+        entry2 = self._entry(2, 'port2')
+        entry3 = self._entry(3, 'port1')
+        self.get_pending_entries.return_value = [entry1, entry2, entry3]
+        self.driver.apply_journal_entry.side_effect = [
+            RuntimeError('OVSDB Error'), None]
+        self.journal.sync_pending()
+        # The following entry of port1 waits for the retry of the first one
+        self.assertEqual(2, self.driver.apply_journal_entry.call_count)
+        self.assertEqual([mock.call(self.context, entry2)],
+                         self.delete_entry.call_args_list)
+        self.assertEqual(1, entry1.retry_count)
+        self.assertEqual(ovn_const.JOURNAL_PENDING, entry1.state)
+        self.assertEqual(1, self.get_pending_entries.call_count)
+
+    def test_sync_pending_failed(self):
+        entry1 = self._entry(1, 'port1')
+        entry1.retry_count = journal.JOURNAL_MAX_RETRIES - 1
+        entry2 = self._entry(2, 'port1')
+        self.get_pending_entries.side_effect = [[entry1, entry2], []]
+        self.driver.apply_journal_entry.side_effect = [
+            RuntimeError('OVSDB Error'), None]
+        self.journal.sync_pending()
+        # The entry is given up, the following entries are applied
+        self.assertEqual(ovn_const.JOURNAL_FAILED, entry1.state)
+        self.assertEqual([mock.call(self.context, entry2)],
+                         self.delete_entry.call_args_list)
+
+    def test_sync_pending_port_creations(self):
+        entry1 = self._entry(1, 'port1')
+        entry2 = self._entry(2, 'port2')
+        entry3 = self._entry(3, 'port1')
+        entry1.operation = entry2.operation = ovn_const.JOURNAL_CREATE
+        self.get_pending_entries.side_effect = [[entry1, entry2, entry3]]
+        self.driver.create_ports_in_ovn.return_value = {'port1'}
+        self.journal.sync_pending()
+        self.driver.create_ports_in_ovn.assert_called_once_with(
+            [entry1.data['current'], entry2.data['current']])
+        self.assertFalse(self.driver.apply_journal_entry.called)
+        # The update of port1 waits for the retry of its creation
+        self.assertEqual([mock.call(self.context, entry2)],
+                         self.delete_entry.call_args_list)
+        self.assertEqual(1, entry1.retry_count)
+
+    def test_sync_pending_network_failed(self):
+        entry1 = self._entry(1, 'net1')
+        entry1.object_type = ovn_const.JOURNAL_NETWORK
+        entry2 = self._entry(2, 'port1')
+        entry3 = self._entry(3, 'port2')
+        entry1.operation = entry2.operation = entry3.operation = (
+            ovn_const.JOURNAL_CREATE)
+        self.get_pending_entries.return_value = [entry1, entry2, entry3]
+        self.driver.apply_journal_entry.side_effect = RuntimeError(
+            'OVSDB Error')
+        self.journal.sync_pending()
+        # The port creations wait for the retry of the network creation
+        self.assertEqual(1, self.driver.apply_journal_entry.call_count)
+        self.assertFalse(self.driver.create_ports_in_ovn.called)
+        self.assertFalse(self.delete_entry.called)
+
+    def test_sync_pending_port_failed(self):
+        entry1 = self._entry(1, 'port1')
+        entry2 = self._entry(2, 'port2')
+        entry3 = self._entry(3, 'net1')
+        entry3.object_type = ovn_const.JOURNAL_NETWORK
+        entry3.operation = ovn_const.JOURNAL_DELETE
+        self.get_pending_entries.return_value = [entry1, entry2, entry3]
+        self.driver.apply_journal_entry.side_effect = [
+            RuntimeError('OVSDB Error'), None]
+        self.journal.sync_pending()
+        # The other ports of the network are applied, the network deletion
+        # waits for the retry of the port.
+        self.assertEqual(2, self.driver.apply_journal_entry.call_count)
+        self.assertEqual([mock.call(self.context, entry2)],
+                         self.delete_entry.call_args_list)
+
+    def _test_wait_for_entries(self, counts):
+        ovn_config.cfg.CONF.set_override('ovn_journal_mode', True,
+                                         group='ovn')
+        self.addCleanup(ovn_config.cfg.CONF.clear_override,
+                        'ovn_journal_mode', group='ovn')
+        query = mock.Mock()
+        query.order_by.return_value.first.return_value = mock.Mock(seqnum=3)
+        query.filter.return_value.count.side_effect = counts
+        with mock.patch.object(journal, '_get_pending_query',
+                               return_value=query) as get_query, \
+                mock.patch.object(journal.greenthread, 'sleep'), \
+                mock.patch.object(journal.config, 'get_ovn_ovsdb_timeout',
+                                  return_value=0):
+            result = journal.wait_for_entries(['port1'])
+        get_query.assert_called_with(self.context, ['port1'])
+        self.assertEqual(len(counts),
+                         query.filter.return_value.count.call_count)
+        return result
+
+    def test_wait_for_entries(self):
+        self.assertTrue(self._test_wait_for_entries([0]))
+
+    def test_wait_for_entries_timeout(self):
+        self.assertFalse(self._test_wait_for_entries([1]))
+
+    def test_wait_for_entries_no_journal_mode(self):
+        with mock.patch.object(journal, '_get_pending_query') as get_query:
+            self.assertTrue(journal.wait_for_entries(['port1']))
+        self.assertFalse(get_query.called)
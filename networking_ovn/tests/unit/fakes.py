@@ -80,6 +80,13 @@ class FakeOvsdbNbOvnIdl(object):
         self.get_port_dhcp_options.return_value = {}
         self.get_all_dhcp_options = mock.Mock()
         self.compose_dhcp_options_commands = mock.MagicMock()
+        self.is_port_groups_supported = mock.Mock(return_value=True)
+        self.create_port_group = mock.Mock()
+        self.delete_port_group = mock.Mock()
+        self.update_port_group_ports = mock.Mock()
+        self.add_port_group_acls = mock.Mock()
+        self.delete_port_group_acls = mock.Mock()
+        self.get_port_groups = mock.Mock(return_value={})
 
 
 class FakeOvsdbSbOvnIdl(object):
@@ -87,6 +94,8 @@ class FakeOvsdbSbOvnIdl(object):
     def __init__(self, **kwargs):
         self.get_chassis_hostname_and_physnets = mock.Mock()
         self.get_chassis_hostname_and_physnets.return_value = {}
+        self.get_chassis_hostnames_for_physnet = mock.Mock()
+        self.get_chassis_hostnames_for_physnet.return_value = set()
         self.get_all_chassis = mock.Mock()
 
 
@@ -15,6 +15,7 @@
 import mock
 from webob import exc
 
+from neutron_lib import constants as const
 from neutron_lib import exceptions as n_exc
 from oslo_db import exception as os_db_exc
 
@@ -22,6 +23,7 @@ from neutron.callbacks import events
 from neutron.callbacks import registry
 from neutron.callbacks import resources
 from neutron.common import utils as n_utils
+from neutron import context
 from neutron.db import provisioning_blocks
 from neutron.extensions import portbindings
 from neutron import manager
@@ -34,6 +36,8 @@ from neutron.tests.unit.plugins.ml2 import test_plugin
 from networking_ovn.common import acl as ovn_acl
 from networking_ovn.common import constants as ovn_const
 from networking_ovn.common import utils as ovn_utils
+from networking_ovn.ml2 import mech_driver
+from networking_ovn.ovsdb import port_latency
 from networking_ovn.tests.unit import fakes
 
 
@@ -111,6 +115,21 @@ class TestOVNMechanismDriver(test_plugin.Ml2PluginV2TestCase):
         self.nb_ovn.delete_address_set.assert_has_calls(
             delete_address_set_calls, any_order=True)
 
+    def test__process_sg_notification_port_groups(self):
+        self.mech_driver.port_groups = True
+        pg_name = ovn_utils.ovn_port_group_name(self.fake_sg['id'])
+        self.mech_driver._process_sg_notification(
+            resources.SECURITY_GROUP, events.AFTER_CREATE, {},
+            security_group=self.fake_sg)
+        self.nb_ovn.create_port_group.assert_called_once_with(
+            pg_name,
+            acls=[ovn_acl.sg_rule_acl_for_port_group(self.fake_sg_rule)],
+            external_ids={ovn_const.OVN_SG_EXT_ID_KEY: self.fake_sg['id']})
+        self.mech_driver._process_sg_notification(
+            resources.SECURITY_GROUP, events.BEFORE_DELETE, {},
+            security_group=self.fake_sg)
+        self.nb_ovn.delete_port_group.assert_called_once_with(pg_name)
+
     def test__process_sg_rule_notifications_sgr_create(self):
         with mock.patch(
             'networking_ovn.common.acl.update_acls_for_security_group'
@@ -124,10 +143,12 @@ class TestOVNMechanismDriver(test_plugin.Ml2PluginV2TestCase):
                 'sg_id', rule, is_add_acl=True)
 
     def test_process_sg_rule_notifications_sgr_delete(self):
-        rule = {'security_group_id': 'sg_id'}
+        rule = {'id': 'sgr_id', 'security_group_id': 'sg_id'}
         with mock.patch(
             'networking_ovn.common.acl.update_acls_for_security_group'
-        ) as ovn_acl_up:
+        ) as ovn_acl_up, mock.patch(
+            'networking_ovn.common.acl.invalidate_sg_rule_match'
+        ) as invalidate:
             with mock.patch(
                 'neutron.db.securitygroups_db.'
                 'SecurityGroupDbMixin.get_security_group_rule',
@@ -139,6 +160,8 @@ class TestOVNMechanismDriver(test_plugin.Ml2PluginV2TestCase):
                 ovn_acl_up.assert_called_once_with(
                     mock.ANY, mock.ANY, mock.ANY,
                     'sg_id', rule, is_add_acl=False)
+                # The cached match of the deleted rule is dropped
+                invalidate.assert_called_once_with('sgr_id')
 
     def test_add_acls_no_sec_group(self):
         acls = ovn_acl.add_acls(self.mech_driver._plugin,
@@ -568,6 +591,29 @@ class TestOVNMechanismDriver(test_plugin.Ml2PluginV2TestCase):
                     provisioning_blocks.L2_AGENT_ENTITY
                 )
 
+    def test_set_port_status_up_port_latency(self):
+        tracker = port_latency.PortUpLatencyTracker(0)
+        self.mech_driver.port_latency_tracker = tracker
+        with self.network(set_context=True, tenant_id='test') as net1, \
+            self.subnet(network=net1) as subnet1, \
+            self.port(subnet=subnet1, set_context=True,
+                      tenant_id='test') as port1, \
+            mock.patch('neutron.db.provisioning_blocks.'
+                       'provisioning_complete'):
+                port_id = port1['port']['id']
+                # The NB commit of the port was recorded on its creation
+                self.assertTrue(tracker.is_tracked(port_id))
+                # The port is still down, its provisioning isn't complete
+                self.mech_driver.set_port_status_up(port_id)
+                self.assertTrue(tracker.is_tracked(port_id))
+                self.mech_driver._plugin.update_port_status(
+                    context.get_admin_context(), port_id,
+                    const.PORT_STATUS_ACTIVE)
+                self.mech_driver.set_port_status_up(port_id)
+                self.assertFalse(tracker.is_tracked(port_id))
+                self.assertEqual(1, sum(tracker.histograms[
+                    port_latency.PROVISIONING_COMPLETE]))
+
     def test_set_port_status_down(self):
         with self.network(set_context=True, tenant_id='test') as net1, \
             self.subnet(network=net1) as subnet1, \
@@ -606,6 +652,158 @@ class TestOVNMechanismDriver(test_plugin.Ml2PluginV2TestCase):
                     provisioning_blocks.L2_AGENT_ENTITY
                 )
 
+    def test_set_port_statuses(self):
+        with self.network(set_context=True, tenant_id='test') as net1, \
+            self.subnet(network=net1) as subnet1, \
+            self.port(subnet=subnet1, set_context=True,
+                      tenant_id='test') as port1, \
+            self.port(subnet=subnet1, set_context=True,
+                      tenant_id='test') as port2, \
+            mock.patch('neutron.db.provisioning_blocks.'
+                       'provisioning_complete') as pc, \
+            mock.patch('neutron.db.provisioning_blocks.'
+                       'add_provisioning_component') as apc:
+                # Both ports are down, only port1 needs to be set up.
+                self.mech_driver.set_port_statuses(
+                    {port1['port']['id']: True,
+                     port2['port']['id']: False,
+                     'foo': True})
+                apc.assert_not_called()
+                pc.assert_called_once_with(
+                    mock.ANY,
+                    port1['port']['id'],
+                    resources.PORT,
+                    provisioning_blocks.L2_AGENT_ENTITY
+                )
+
+    def test_set_port_statuses_down(self):
+        with self.network(set_context=True, tenant_id='test') as net1, \
+            self.subnet(network=net1) as subnet1, \
+            self.port(subnet=subnet1, set_context=True,
+                      tenant_id='test') as port1, \
+            mock.patch('neutron.db.provisioning_blocks.'
+                       'add_provisioning_component') as apc:
+                port_id = port1['port']['id']
+                self.mech_driver._plugin.update_port_status(
+                    context.get_admin_context(), port_id,
+                    const.PORT_STATUS_ACTIVE)
+                self.mech_driver.set_port_statuses({port_id: False})
+                apc.assert_called_once_with(
+                    mock.ANY,
+                    port_id,
+                    resources.PORT,
+                    provisioning_blocks.L2_AGENT_ENTITY
+                )
+                port = self.mech_driver._plugin.get_port(
+                    context.get_admin_context(), port_id)
+                self.assertEqual(const.PORT_STATUS_DOWN, port['status'])
+
+    def test_journal_mode(self):
+        self.mech_driver.journal_mode = True
+        with mock.patch.object(mech_driver.journal, 'record') as record, \
+                mock.patch.object(self.mech_driver,
+                                  'create_port_in_ovn') as create_port:
+            with self.network(set_context=True, tenant_id='test') as net1, \
+                self.subnet(network=net1) as subnet1, \
+                self.port(subnet=subnet1, set_context=True,
+                          tenant_id='test') as port1:
+                    port_id = port1['port']['id']
+                    # The port is recorded in the journal by the precommit,
+                    # the postcommit doesn't create it in OVN.
+                    record.assert_any_call(mock.ANY, ovn_const.JOURNAL_PORT,
+                                           port_id, ovn_const.JOURNAL_CREATE,
+                                           {'current': mock.ANY})
+                    create_port.assert_not_called()
+
+    def test_create_port_bulk_not_journal_mode(self):
+        # ML2 calls create_port_postcommit for each port of a bulk create,
+        # so without the journal the ports are created in OVN one by one.
+        with mock.patch.object(self.mech_driver,
+                               'create_port_in_ovn') as create_port, \
+                mock.patch.object(self.mech_driver,
+                                  'create_ports_in_ovn') as create_ports:
+            with self.network(set_context=True, tenant_id='test') as net1, \
+                    self.subnet(network=net1):
+                res = self._create_port_bulk(self.fmt, 2,
+                                             net1['network']['id'],
+                                             'test', True)
+                self.assertEqual(201, res.status_int)
+                self.assertEqual(2, create_port.call_count)
+                create_ports.assert_not_called()
+
+    def test_apply_journal_entry(self):
+        port = {'id': 'port-id'}
+        original_port = {'id': 'port-id', 'name': 'old'}
+        with mock.patch.object(self.mech_driver,
+                               '_create_port') as create_port, \
+                mock.patch.object(self.mech_driver,
+                                  'update_port') as update_port, \
+                mock.patch.object(self.mech_driver,
+                                  '_delete_network') as delete_network:
+            self.mech_driver.apply_journal_entry(
+                ovn_const.JOURNAL_PORT, ovn_const.JOURNAL_CREATE,
+                {'current': port})
+            create_port.assert_called_once_with(port)
+            self.mech_driver.apply_journal_entry(
+                ovn_const.JOURNAL_PORT, ovn_const.JOURNAL_UPDATE,
+                {'current': port, 'original': original_port})
+            update_port.assert_called_once_with(port, original_port)
+            self.mech_driver.apply_journal_entry(
+                ovn_const.JOURNAL_NETWORK, ovn_const.JOURNAL_DELETE,
+                {'current': {'id': 'net-id'}})
+            delete_network.assert_called_once_with({'id': 'net-id'})
+
+    def _bulk_port(self, port_id, ip_address):
+        return {'id': port_id, 'name': port_id, 'network_id': 'net-id',
+                'admin_state_up': True, 'security_groups': ['sg-id'],
+                'fixed_ips': [{'ip_address': ip_address}]}
+
+    def test_create_ports_in_ovn(self):
+        ports = [self._bulk_port('port1', '10.0.0.1'),
+                 self._bulk_port('port2', '10.0.0.2')]
+        with mock.patch.object(self.mech_driver, 'get_ovn_port_options'), \
+                mock.patch.object(ovn_acl, 'add_acls',
+                                  return_value=[]):
+            self.assertEqual(set(),
+                             self.mech_driver.create_ports_in_ovn(ports))
+        self.assertEqual(2, self.nb_ovn.create_lswitch_port.call_count)
+        # The addresses of both ports are added to the address set at once
+        self.nb_ovn.update_address_set.assert_called_once_with(
+            name=ovn_utils.ovn_addrset_name('sg-id', 'ip4'),
+            addrs_add=['10.0.0.1', '10.0.0.2'], addrs_remove=None,
+            if_exists=False)
+
+    def test_create_ports_in_ovn_port_groups(self):
+        self.mech_driver.port_groups = True
+        ports = [self._bulk_port('port1', '10.0.0.1'),
+                 self._bulk_port('port2', '10.0.0.2')]
+        with mock.patch.object(self.mech_driver, 'get_ovn_port_options'), \
+                mock.patch.object(ovn_acl, 'add_acls', return_value=[]):
+            self.mech_driver.create_ports_in_ovn(ports)
+        # Each port group gets both ports at once
+        self.nb_ovn.update_port_group_ports.assert_has_calls([
+            mock.call(ovn_const.OVN_DROP_PORT_GROUP_NAME,
+                      ['port1', 'port2'], None, if_exists=False),
+            mock.call('pg_sg_id', ['port1', 'port2'], None,
+                      if_exists=False)])
+        self.assertEqual(2, self.nb_ovn.update_port_group_ports.call_count)
+
+    def test_create_ports_in_ovn_batch_failure(self):
+        ports = [self._bulk_port('port1', '10.0.0.1'),
+                 self._bulk_port('port2', '10.0.0.2')]
+
+        def _create_ports_in_ovn(ports, *args):
+            if len(ports) > 1 or ports[0][0]['id'] == 'port2':
+                raise RuntimeError('OVSDB Error')
+
+        with mock.patch.object(self.mech_driver, 'get_ovn_port_options'), \
+                mock.patch.object(self.mech_driver, '_create_ports_in_ovn',
+                                  side_effect=_create_ports_in_ovn) as create:
+            # The ports of the failed batch are created one by one
+            self.assertEqual({'port2'},
+                             self.mech_driver.create_ports_in_ovn(ports))
+            self.assertEqual(3, create.call_count)
+
 
 class OVNMechanismDriverTestCase(test_plugin.Ml2PluginV2TestCase):
     _mechanism_drivers = ['logger', 'ovn']
@@ -729,6 +927,19 @@ class TestOVNMechansimDriverSegment(test_segment.HostSegmentMappingTestCase):
         segments_host_db = self._get_segments_for_host(host)
         self.assertEqual({segment2['id']}, set(segments_host_db))
 
+    def test_update_segment_host_mapping_new_segment(self):
+        _, host = self._test_segment_host_mapping()
+        # A segment created since the last update, possibly by another
+        # worker, is mapped to the host.
+        with self.network() as network:
+            network = network['network']
+        segment2 = self._test_create_segment(
+            network_id=network['id'], physical_network='phys_net1',
+            segmentation_id=201, network_type='vlan')['segment']
+        self.mech_driver.update_segment_host_mapping(host, ['phys_net1'])
+        self.assertIn(segment2['id'],
+                      set(self._get_segments_for_host(host)))
+
     def test_clear_segment_host_mapping(self):
         _, host = self._test_segment_host_mapping()
 
@@ -738,11 +949,10 @@ class TestOVNMechansimDriverSegment(test_segment.HostSegmentMappingTestCase):
         self.assertEqual({}, segments_host_db)
 
     def test_update_segment_host_mapping_with_new_segment(self):
-        hostname_with_physnets = {'hostname1': ['phys_net1', 'phys_net2'],
-                                  'hostname2': ['phys_net1']}
         ovn_sb_api = self.mech_driver._sb_ovn
-        ovn_sb_api.get_chassis_hostname_and_physnets.return_value = (
-            hostname_with_physnets)
+        ovn_sb_api.get_chassis_hostnames_for_physnet.side_effect = (
+            lambda physnet: {'phys_net1': {'hostname1', 'hostname2'},
+                             'phys_net2': {'hostname1'}}.get(physnet, set()))
         self.mech_driver.subscribe()
         with self.network() as network:
             network_id = network['network']['id']
@@ -672,3 +672,148 @@ class TestDelDHCPOptionsCommand(TestBaseCommand):
             self.ovn_api, fake_dhcp_options.uuid, if_exists=True)
         cmd.run_idl(self.transaction)
         fake_dhcp_options.delete.assert_called_once_with()
+
+
+class TestUpdatePortGroupPortsCommand(TestBaseCommand):
+
+    def _test_pg_update_no_exist(self, if_exists=True):
+        with mock.patch.object(idlutils, 'row_by_value',
+                               side_effect=idlutils.RowNotFound):
+            cmd = commands.UpdatePortGroupPortsCommand(
+                self.ovn_api, 'pg_fake', lports_add=[], lports_remove=[],
+                if_exists=if_exists)
+            if if_exists:
+                cmd.run_idl(self.transaction)
+            else:
+                self.assertRaises(RuntimeError, cmd.run_idl, self.transaction)
+
+    def test_pg_no_exist_ignore(self):
+        self._test_pg_update_no_exist(if_exists=True)
+
+    def test_pg_no_exist_fail(self):
+        self._test_pg_update_no_exist(if_exists=False)
+
+    def test_pg_update_ports(self):
+        port1 = fakes.FakeOvsdbRow.create_one_ovsdb_row(attrs={'name': 'p1'})
+        port2 = fakes.FakeOvsdbRow.create_one_ovsdb_row(attrs={'name': 'p2'})
+        fake_pg = fakes.FakeOvsdbRow.create_one_ovsdb_row()
+        fake_pg.ports = [port1]
+        rows = {'pg_fake': fake_pg, 'p1': port1, 'p2': port2}
+        with mock.patch.object(
+                idlutils, 'row_by_value',
+                side_effect=lambda idl, table, col, name, *args: rows[name]):
+            cmd = commands.UpdatePortGroupPortsCommand(
+                self.ovn_api, 'pg_fake', lports_add=['p2'],
+                lports_remove=['p1'], if_exists=True)
+            cmd.run_idl(self.transaction)
+        fake_pg.verify.assert_called_once_with('ports')
+        self.assertEqual([port2], fake_pg.ports)
+
+
+class TestDelPortGroupACLsCommand(TestBaseCommand):
+
+    def test_pg_acls_del(self):
+        acl = {'priority': 1002, 'direction': 'to-lport',
+               'match': 'outport == @pg_sg1 && ip4', 'log': False,
+               'action': 'allow-related',
+               'external_ids': {'neutron:security_group_rule_id': 'r1'}}
+        other_acl = dict(acl, external_ids={
+            'neutron:security_group_rule_id': 'r2'})
+        acl_row = fakes.FakeOvsdbRow.create_one_ovsdb_row(attrs=acl)
+        other_acl_row = fakes.FakeOvsdbRow.create_one_ovsdb_row(
+            attrs=other_acl)
+        fake_pg = fakes.FakeOvsdbRow.create_one_ovsdb_row()
+        fake_pg.acls = [acl_row, other_acl_row]
+        with mock.patch.object(idlutils, 'row_by_value',
+                               return_value=fake_pg):
+            cmd = commands.DelPortGroupACLsCommand(
+                self.ovn_api, 'pg_sg1', [dict(acl)], if_exists=True)
+            cmd.run_idl(self.transaction)
+        self.assertEqual([other_acl_row], fake_pg.acls)
+        acl_row.delete.assert_called_once_with()
+        self.assertFalse(other_acl_row.delete.called)
+
+
+class TestMergeCommands(TestBaseCommand):
+
+    def _update_addrset(self, name, addrs_add=None, addrs_remove=None,
+                        if_exists=True):
+        return commands.UpdateAddrSetCommand(
+            self.ovn_api, name, addrs_add=addrs_add,
+            addrs_remove=addrs_remove, if_exists=if_exists)
+
+    def test_merge_addrset_updates(self):
+        cmd1 = self._update_addrset('as1', addrs_add=['10.0.0.1', '10.0.0.2'],
+                                    addrs_remove=['10.0.0.3'])
+        cmd2 = self._update_addrset('as2', addrs_add=['10.0.0.1'])
+        cmd3 = self._update_addrset('as1', addrs_add=['10.0.0.3'],
+                                    addrs_remove=['10.0.0.2', '10.0.0.4'],
+                                    if_exists=False)
+        merged, count = commands.merge_commands([cmd1, cmd2, cmd3])
+        # The merged command takes the position of the later one
+        self.assertEqual([cmd2, cmd1], merged)
+        self.assertEqual(1, count)
+        self.assertEqual(['10.0.0.1', '10.0.0.3'], cmd1.addrs_add)
+        self.assertEqual(['10.0.0.2', '10.0.0.4'], cmd1.addrs_remove)
+        self.assertFalse(cmd1.if_exists)
+
+    def test_merge_addrset_updates_cancelled(self):
+        cmd1 = self._update_addrset('as1', addrs_add=['10.0.0.1'])
+        cmd2 = self._update_addrset('as1', addrs_remove=['10.0.0.1'])
+        merged, count = commands.merge_commands([cmd1, cmd2])
+        self.assertEqual([cmd1], merged)
+        self.assertIsNone(cmd1.addrs_add)
+        self.assertEqual(['10.0.0.1'], cmd1.addrs_remove)
+
+    def test_merge_addrset_updates_barrier(self):
+        cmd1 = self._update_addrset('as1', addrs_add=['10.0.0.1'])
+        cmd2 = commands.DelAddrSetCommand(self.ovn_api, 'as1', True)
+        cmd3 = commands.AddAddrSetCommand(self.ovn_api, 'as1', True)
+        cmd4 = self._update_addrset('as1', addrs_add=['10.0.0.2'])
+        cmd5 = self._update_addrset('as1', addrs_add=['10.0.0.3'])
+        merged, count = commands.merge_commands([cmd1, cmd2, cmd3, cmd4,
+                                                 cmd5])
+        self.assertEqual([cmd1, cmd2, cmd3, cmd4], merged)
+        self.assertEqual(['10.0.0.1'], cmd1.addrs_add)
+        self.assertEqual(['10.0.0.2', '10.0.0.3'], cmd4.addrs_add)
+
+    def test_merge_lswitch_port_sets(self):
+        cmd1 = commands.SetLSwitchPortCommand(
+            self.ovn_api, 'port1', True, addresses=['mac1'], enabled=True)
+        cmd2 = commands.AddACLCommand(self.ovn_api, 'lswitch1', 'port1')
+        cmd3 = commands.SetLSwitchPortCommand(
+            self.ovn_api, 'port1', True, enabled=False)
+        cmd4 = commands.DelLSwitchCommand(self.ovn_api, 'lswitch1', True)
+        cmd5 = commands.SetLSwitchPortCommand(
+            self.ovn_api, 'port1', True, addresses=['mac2'])
+        merged, count = commands.merge_commands([cmd1, cmd2, cmd3, cmd4,
+                                                 cmd5])
+        self.assertEqual([cmd2, cmd1, cmd4, cmd5], merged)
+        self.assertEqual({'addresses': ['mac1'], 'enabled': False},
+                         cmd1.columns)
+
+    def _update_pg_ports(self, name, lports_add=None, lports_remove=None):
+        return commands.UpdatePortGroupPortsCommand(
+            self.ovn_api, name, lports_add=lports_add,
+            lports_remove=lports_remove, if_exists=True)
+
+    def test_merge_port_group_updates_after_port_creation(self):
+        cmd1 = self._update_pg_ports('pg1', lports_add=['port1'])
+        cmd2 = commands.AddLSwitchPortCommand(self.ovn_api, 'port2',
+                                              'lswitch1', True)
+        cmd3 = self._update_pg_ports('pg1', lports_add=['port2'])
+        merged, count = commands.merge_commands([cmd1, cmd2, cmd3])
+        # The merged update runs once port2 is created
+        self.assertEqual([cmd2, cmd1], merged)
+        self.assertEqual(1, count)
+        self.assertEqual(['port1', 'port2'], cmd1.lports_add)
+
+    def test_merge_port_group_updates_port_deleted(self):
+        cmd1 = self._update_pg_ports('pg1', lports_add=['port1'])
+        cmd2 = commands.DelLSwitchPortCommand(self.ovn_api, 'port1',
+                                              'lswitch1', True)
+        cmd3 = self._update_pg_ports('pg1', lports_add=['port2'])
+        merged, count = commands.merge_commands([cmd1, cmd2, cmd3])
+        # The update adding port1 can't be moved after its deletion
+        self.assertEqual([cmd1, cmd2, cmd3], merged)
+        self.assertEqual(0, count)
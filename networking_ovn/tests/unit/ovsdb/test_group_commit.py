@@ -0,0 +1,126 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+from ovs.db import idl as ovs_idl
+
+from neutron.agent.ovsdb.native import idlutils
+
+from networking_ovn.ovsdb import commands
+from networking_ovn.ovsdb import group_commit
+from networking_ovn.ovsdb import ovsdb_monitor
+from networking_ovn.ovsdb import row_index
+from networking_ovn.ovsdb import txn_retry
+from networking_ovn.tests import base
+from networking_ovn.tests.unit.ovsdb import test_row_index
+
+
+class TestTransactionGroup(base.TestCase):
+
+    def setUp(self):
+        super(TestTransactionGroup, self).setUp()
+        self.ovsdb_connection = mock.Mock()
+        self.group = group_commit.TransactionGroup(self.ovsdb_connection,
+                                                   0.01)
+
+    def _transaction(self, *commands):
+        txn = txn_retry.RetryTransaction(mock.Mock(), self.group, 10,
+                                         check_error=True)
+        for command in commands:
+            txn.add(command)
+        return txn
+
+    def test_queue_txn(self):
+        txn1 = self._transaction(mock.Mock())
+        txn2 = self._transaction(mock.Mock())
+
+        def queue_second_txn(window):
+            # Another transaction is committed during the window
+            self.group.queue_txn(txn2)
+
+        with mock.patch.object(group_commit.time, 'sleep',
+                               side_effect=queue_second_txn) as sleep:
+            self.group.queue_txn(txn1)
+            sleep.assert_called_once_with(0.01)
+        grouped = self.ovsdb_connection.queue_txn.call_args[0][0]
+        self.assertEqual([txn1, txn2], grouped.transactions)
+        self.assertEqual(txn1.commands + txn2.commands, grouped.commands)
+
+    def test_do_commit(self):
+        txn1 = self._transaction(mock.Mock(), mock.Mock())
+        txn2 = self._transaction(mock.Mock())
+        grouped = group_commit.GroupedTransaction([txn1, txn2])
+        with mock.patch.object(txn_retry.RetryTransaction, 'do_commit',
+                               return_value=['r1', 'r2', 'r3']):
+            grouped.do_commit()
+        self.assertEqual(['r1', 'r2'], txn1.results.get_nowait())
+        self.assertEqual(['r3'], txn2.results.get_nowait())
+
+    def test_do_commit_try_again(self):
+        txn1 = self._transaction(mock.Mock())
+        txn2 = self._transaction(mock.Mock())
+        grouped = group_commit.GroupedTransaction([txn1, txn2])
+        with mock.patch.object(txn_retry.RetryTransaction, 'do_commit',
+                               return_value=txn_retry.TRY_AGAIN) as commit:
+            grouped.do_commit()
+        # Each caller backs off and queues its transaction again
+        commit.assert_called_once_with()
+        self.assertIs(txn_retry.TRY_AGAIN, txn1.results.get_nowait())
+        self.assertIs(txn_retry.TRY_AGAIN, txn2.results.get_nowait())
+
+    def test_do_commit_error(self):
+        txn1 = self._transaction(mock.Mock())
+        txn2 = self._transaction(mock.Mock())
+        grouped = group_commit.GroupedTransaction([txn1, txn2])
+        error = RuntimeError('OVSDB Error')
+
+        def do_commit(txn):
+            # Only the transaction of txn2 fails on its own
+            if txn is grouped or txn is txn2:
+                raise error
+            return ['r1']
+
+        with mock.patch.object(txn_retry.RetryTransaction, 'do_commit',
+                               autospec=True, side_effect=do_commit):
+            grouped.do_commit()
+        self.assertEqual(['r1'], txn1.results.get_nowait())
+        result = txn2.results.get_nowait()
+        self.assertIsInstance(result, idlutils.ExceptionResult)
+        self.assertEqual(error, result.ex)
+
+    def test_do_commit_dependent_transactions(self):
+        helper = ovs_idl.SchemaHelper(
+            schema_json=test_row_index.OVN_NB_LSWITCH_PORTS_SCHEMA)
+        helper.register_all()
+        nb_idl = ovsdb_monitor.BaseOvnIdl("remote", helper)
+        api = mock.Mock(idl=nb_idl, _tables=nb_idl.tables)
+        txn1 = txn_retry.RetryTransaction(api, self.group, 10,
+                                          check_error=True)
+        txn1.add(commands.AddLSwitchCommand(api, 'ls1', may_exist=True))
+        txn2 = txn_retry.RetryTransaction(api, self.group, 10,
+                                          check_error=True)
+        txn2.add(commands.AddLSwitchPortCommand(api, 'lsp1', 'ls1',
+                                                may_exist=True))
+        grouped = group_commit.GroupedTransaction([txn1, txn2])
+        with mock.patch.object(
+                txn_retry.idl.Transaction, 'commit_block', autospec=True,
+                return_value=ovs_idl.Transaction.SUCCESS) as commit_block:
+            grouped.do_commit()
+            # The port finds the Logical_Switch inserted earlier in the
+            # grouped transaction, which is committed at once.
+            self.assertEqual(1, commit_block.call_count)
+            idl_txn = commit_block.call_args[0][0]
+            self.assertEqual(2, len(idl_txn._txn_rows))
+            self.assertIsNotNone(row_index.row_by_name(
+                nb_idl, 'Logical_Switch_Port', 'lsp1'))
+        self.assertEqual([None], txn1.results.get_nowait())
+        self.assertEqual([None], txn2.results.get_nowait())
@@ -0,0 +1,135 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import copy
+import uuid
+
+import fixtures
+import mock
+from ovs.db import idl as ovs_idl
+
+from networking_ovn.ovsdb import idl_snapshot
+from networking_ovn.ovsdb import ovsdb_monitor
+from networking_ovn.ovsdb import row_index
+from networking_ovn.tests import base
+from networking_ovn.tests.unit.ovsdb import test_ovsdb_monitor
+
+
+class TestIdlSnapshot(base.TestCase):
+
+    def setUp(self):
+        super(TestIdlSnapshot, self).setUp()
+        self.snapshot_dir = self.useFixture(fixtures.TempDir()).path
+        self.snapshot = idl_snapshot.IdlSnapshot(
+            self.snapshot_dir, 'OVN_Northbound', 300)
+
+    def _create_idl(self, schema=test_ovsdb_monitor.OVN_NB_SCHEMA):
+        helper = ovs_idl.SchemaHelper(schema_json=copy.deepcopy(schema))
+        helper.register_all()
+        idl = ovsdb_monitor.BaseOvnIdl("remote", helper)
+        idl.last_id = str(uuid.UUID(int=0))
+        return idl
+
+    def _create_row(self, idl, table_name, row_json):
+        table = idl.tables[table_name]
+        row_uuid = uuid.uuid4()
+        row = ovs_idl.Row.from_json(idl, table, row_uuid, row_json)
+        table.rows[row_uuid] = row
+        return row
+
+    def test_save_and_load(self):
+        idl = self._create_idl()
+        lsp = self._create_row(idl, 'Logical_Switch_Port',
+                               {'name': 'lsp1', 'up': True,
+                                'addresses': ['set', ['00:00:00:00:00:01']]})
+        self._create_row(idl, 'Logical_Switch', {'name': 'ls1'})
+        idl.last_id = 'fake-txn-id'
+        self.snapshot.save(idl)
+
+        new_idl = self._create_idl()
+        new_idl.load_snapshot(self.snapshot)
+        self.assertEqual('fake-txn-id', new_idl.last_id)
+        new_lsp = new_idl.tables['Logical_Switch_Port'].rows[lsp.uuid]
+        self.assertEqual('lsp1', new_lsp.name)
+        self.assertEqual([True], new_lsp.up)
+        self.assertEqual(['00:00:00:00:00:01'], new_lsp.addresses)
+        self.assertEqual(new_lsp, row_index.row_by_name(
+            new_idl, 'Logical_Switch_Port', 'lsp1'))
+        self.assertEqual(1, len(new_idl.tables['Logical_Switch'].rows))
+
+    def test_load_no_snapshot(self):
+        idl = self._create_idl()
+        self.assertEqual([], self.snapshot.load(idl))
+        self.assertEqual(str(uuid.UUID(int=0)), idl.last_id)
+
+    def test_load_other_columns(self):
+        idl = self._create_idl()
+        self._create_row(idl, 'Logical_Switch', {'name': 'ls1'})
+        self.snapshot.save(idl)
+
+        schema = copy.deepcopy(test_ovsdb_monitor.OVN_NB_SCHEMA)
+        del schema['tables']['Logical_Switch_Port']['columns']['up']
+        self.assertEqual([], self.snapshot.load(self._create_idl(schema)))
+
+    def test_load_not_supported(self):
+        idl = mock.Mock(spec=['tables'])
+        self.assertEqual([], self.snapshot.load(idl))
+
+    def test_maybe_save(self):
+        idl = self._create_idl()
+        idl.state = idl.IDL_S_MONITORING = 'monitoring'
+        with mock.patch.object(self.snapshot, 'save_async') as save:
+            self.snapshot.maybe_save(idl)
+            # Nothing changed since the last save
+            self.snapshot.maybe_save(idl)
+            idl.change_seqno += 1
+            # The interval has not elapsed
+            self.snapshot.maybe_save(idl)
+            save.assert_called_once_with(idl)
+
+    def test_maybe_save_still_writing(self):
+        idl = self._create_idl()
+        idl.state = idl.IDL_S_MONITORING = 'monitoring'
+        self.snapshot._save_thread = mock.Mock()
+        self.snapshot._save_thread.is_alive.return_value = True
+        with mock.patch.object(self.snapshot, 'save_async') as save:
+            self.snapshot.maybe_save(idl)
+            self.assertFalse(save.called)
+            self.snapshot._save_thread.is_alive.return_value = False
+            self.snapshot.maybe_save(idl)
+            save.assert_called_once_with(idl)
+
+    def test_save_async_copies_rows(self):
+        idl = self._create_idl()
+        lsp = self._create_row(idl, 'Logical_Switch_Port', {'name': 'lsp1'})
+        with mock.patch('threading.Thread') as thread:
+            self.snapshot.save_async(idl)
+        args = thread.call_args[1]['args']
+        # Rows changed after the copy don't end up in the snapshot.
+        self._create_row(idl, 'Logical_Switch', {'name': 'ls1'})
+        del lsp._data['name']
+        thread.return_value.start.assert_called_once_with()
+        self.snapshot._write(*args)
+
+        new_idl = self._create_idl()
+        new_idl.load_snapshot(self.snapshot)
+        new_lsp = new_idl.tables['Logical_Switch_Port'].rows[lsp.uuid]
+        self.assertEqual('lsp1', new_lsp.name)
+        self.assertEqual(0, len(new_idl.tables['Logical_Switch'].rows))
+
+    def test_maybe_save_initial_dump(self):
+        idl = self._create_idl()
+        idl.state = 'requested'
+        idl.IDL_S_MONITORING = 'monitoring'
+        with mock.patch.object(self.snapshot, 'save_async') as save:
+            self.snapshot.maybe_save(idl)
+            self.assertFalse(save.called)
@@ -14,6 +14,7 @@
 
 import copy
 import mock
+from six.moves import queue
 import time
 import uuid
 
@@ -21,6 +22,8 @@ from ovs.db import idl as ovs_idl
 
 from networking_ovn.common import config as ovn_config
 from networking_ovn.ovsdb import ovsdb_monitor
+from networking_ovn.ovsdb import port_latency
+from networking_ovn.tests import base
 from networking_ovn.tests.unit.ml2 import test_mech_driver
 from neutron import manager
 from neutron.plugins.common import constants as service_constants
@@ -99,35 +102,53 @@ class TestOvnIdlNotifyHandler(test_mech_driver.OVNMechanismDriverTestCase):
         # handles the notify event
         time.sleep(1)
 
-    def test_lsp_up_create_event(self):
-        row_data = {"up": True, "name": "foo-name"}
-        self._test_lsp_helper('create', row_data)
-        self.driver.set_port_status_up.assert_called_once_with("foo-name")
-        self.assertFalse(self.driver.set_port_status_down.called)
-
-    def test_lsp_down_create_event(self):
-        row_data = {"up": False, "name": "foo-name"}
-        self._test_lsp_helper('create', row_data)
-        self.driver.set_port_status_down.assert_called_once_with("foo-name")
-        self.assertFalse(self.driver.set_port_status_up.called)
-
-    def test_lsp_up_not_set_event(self):
-        row_data = {"up": ['set', []], "name": "foo-name"}
-        self._test_lsp_helper('create', row_data)
-        self.assertFalse(self.driver.set_port_status_up.called)
-        self.assertFalse(self.driver.set_port_status_down.called)
-
-    def test_unwatch_logical_switch_port_create_events(self):
-        self.idl.unwatch_logical_switch_port_create_events()
+    def test_lsp_create_event(self):
+        # The create events of the dump are reconciled in post_initialize
         row_data = {"up": True, "name": "foo-name"}
         self._test_lsp_helper('create', row_data)
         self.assertFalse(self.driver.set_port_status_up.called)
         self.assertFalse(self.driver.set_port_status_down.called)
 
-        row_data["up"] = False
-        self._test_lsp_helper('create', row_data)
-        self.assertFalse(self.driver.set_port_status_up.called)
-        self.assertFalse(self.driver.set_port_status_down.called)
+    def _create_lsp_row(self, row_json):
+        row_uuid = uuid.uuid4()
+        row = ovs_idl.Row.from_json(self.idl, self.lp_table,
+                                    row_uuid, row_json)
+        self.lp_table.rows[row_uuid] = row
+
+    def test_post_initialize(self):
+        self.driver.set_port_statuses = mock.Mock()
+        self._create_lsp_row({"up": True, "name": "foo-name"})
+        self._create_lsp_row({"up": False, "name": "bar-name"})
+        self._create_lsp_row({"up": ['set', []], "name": "baz-name"})
+        self.idl.post_initialize(self.driver)
+        # sleep for a second so that the notify handler green thread
+        # handles the queued event
+        time.sleep(1)
+        self.driver.set_port_statuses.assert_called_once_with(
+            {"foo-name": True, "bar-name": False})
+
+    def test_post_initialize_queued_once(self):
+        self.idl.notify_handler.queue_event = mock.Mock()
+        for i in range(10):
+            self._create_lsp_row({"up": True, "name": "port-%d" % i})
+        self.idl.post_initialize(self.driver)
+        self.assertEqual(1, self.idl.notify_handler.queue_event.call_count)
+        # The 'up' states are read when the event runs
+        dump_event = self.idl.notify_handler.queue_event.call_args[0][0]
+        self._create_lsp_row({"up": False, "name": "foo-name"})
+        self.driver.set_port_statuses = mock.Mock()
+        dump_event.run(None, None, None)
+        port_states = self.driver.set_port_statuses.call_args[0][0]
+        self.assertEqual(11, len(port_states))
+        self.assertFalse(port_states["foo-name"])
+
+    def test_post_initialize_no_ovsdb_lock(self):
+        self.idl.has_lock = False
+        self.idl.is_lock_contended = True
+        self.idl.notify_handler.queue_event = mock.Mock()
+        self._create_lsp_row({"up": True, "name": "foo-name"})
+        self.idl.post_initialize(self.driver)
+        self.assertFalse(self.idl.notify_handler.queue_event.called)
 
     def test_lsp_up_update_event(self):
         new_row_json = {"up": True, "name": "foo-name"}
@@ -145,6 +166,16 @@ class TestOvnIdlNotifyHandler(test_mech_driver.OVNMechanismDriverTestCase):
         self.driver.set_port_status_down.assert_called_once_with("foo-name")
         self.assertFalse(self.driver.set_port_status_up.called)
 
+    def test_lsp_up_update_event_port_latency(self):
+        tracker = mock.Mock()
+        self.idl._lsp_update_up_event.port_latency_tracker = tracker
+        self._test_lsp_helper('update', {"up": True, "name": "foo-name"},
+                              old_row_json={"up": False})
+        # The up event is recorded when the notify loop handles it
+        tracker.record.assert_called_once_with('foo-name',
+                                               port_latency.UP_RECEIVED)
+        self.driver.set_port_status_up.assert_called_once_with("foo-name")
+
     def test_lsp_up_update_event_no_old_data(self):
         new_row_json = {"up": True, "name": "foo-name"}
         self._test_lsp_helper('update', new_row_json,
@@ -190,6 +221,162 @@ class TestOvnIdlNotifyHandler(test_mech_driver.OVNMechanismDriverTestCase):
         self.assertTrue(self.idl.notify_handler.notify.called)
 
 
+class TestOvnDbNotifyHandler(base.TestCase):
+
+    def setUp(self):
+        super(TestOvnDbNotifyHandler, self).setUp()
+        self.handler = ovsdb_monitor.OvnDbNotifyHandler(mock.Mock())
+        self.watched_events = {}
+        for table, events in (('Logical_Switch_Port', ('update',)),
+                              ('Logical_Switch_Port', 'create'),
+                              ('Chassis', ('create', 'update'))):
+            watched = mock.Mock(table=table, events=events)
+            watched.matches.return_value = True
+            self.watched_events[(table, events)] = watched
+        self.handler.watch_events(self.watched_events.values())
+
+    def _row(self, table):
+        row = mock.Mock()
+        row._table.name = table
+        return row
+
+    def test_matching_events(self):
+        row = self._row('Logical_Switch_Port')
+        lsp_update = self.watched_events[('Logical_Switch_Port',
+                                          ('update',))]
+        self.assertEqual((lsp_update,),
+                         self.handler.matching_events('update', row, None))
+        lsp_update.matches.assert_called_once_with('update', row, None)
+        for watched in self.watched_events.values():
+            if watched is not lsp_update:
+                self.assertFalse(watched.matches.called)
+
+    def test_matching_events_string_events(self):
+        lsp_create = self.watched_events[('Logical_Switch_Port', 'create')]
+        self.assertEqual((lsp_create,), self.handler.matching_events(
+            'create', self._row('Logical_Switch_Port'), None))
+
+    def test_matching_events_not_watched_table(self):
+        self.assertEqual((), self.handler.matching_events(
+            'update', self._row('Logical_Switch'), None))
+        for watched in self.watched_events.values():
+            self.assertFalse(watched.matches.called)
+
+    def test_unwatch_event(self):
+        chassis_event = self.watched_events[('Chassis',
+                                             ('create', 'update'))]
+        self.handler.unwatch_event(chassis_event)
+        self.assertEqual((), self.handler.matching_events(
+            'update', self._row('Chassis'), None))
+        # Unwatching an event which is not watched is a no-op
+        self.handler.unwatch_event(chassis_event)
+
+    def test_notify_partitions(self):
+        ovn_config.cfg.CONF.set_override('ovn_notify_workers', 4,
+                                         group='ovn')
+        self.addCleanup(ovn_config.cfg.CONF.clear_override,
+                        'ovn_notify_workers', group='ovn')
+        handler = ovsdb_monitor.OvnDbNotifyHandler(mock.Mock())
+        self.assertEqual(4, len(handler.notification_queues))
+        handler.notification_queues = [mock.Mock() for i in range(4)]
+        chassis_event = self.watched_events[('Chassis',
+                                             ('create', 'update'))]
+        handler.watch_event(chassis_event)
+        row = self._row('Chassis')
+        row.uuid = uuid.uuid4()
+        handler.notify('create', row)
+        handler.notify('update', row)
+        partition = handler.get_partition(row.uuid)
+        self.assertEqual(
+            [mock.call((chassis_event, 'create', row, None)),
+             mock.call((chassis_event, 'update', row, None))],
+            handler.notification_queues[partition].put.call_args_list)
+        for i, notifications in enumerate(handler.notification_queues):
+            if i != partition:
+                self.assertFalse(notifications.put.called)
+
+    def test_notify_queue_depth(self):
+        ovn_config.cfg.CONF.set_override('ovn_notify_queue_depth', 1,
+                                         group='ovn')
+        self.addCleanup(ovn_config.cfg.CONF.clear_override,
+                        'ovn_notify_queue_depth', group='ovn')
+        handler = ovsdb_monitor.OvnDbNotifyHandler(mock.Mock())
+        notifications = queue.Queue()
+        handler.notification_queues = [notifications]
+        chassis_event = self.watched_events[('Chassis',
+                                             ('create', 'update'))]
+        handler.watch_event(chassis_event)
+        row = self._row('Chassis')
+        row.uuid = uuid.uuid4()
+        with mock.patch.object(ovsdb_monitor.LOG, 'warning') as warning:
+            for i in range(3):
+                handler.notify('update', row)
+            # The events beyond the depth are queued and counted, the
+            # OVSDB connection thread never blocks.
+            self.assertEqual(3, notifications.qsize())
+            self.assertEqual(2, handler.overflowed_events)
+            self.assertEqual(1, warning.call_count)
+
+    def _test_notify_coalesce(self, coalesce):
+        ovn_config.cfg.CONF.set_override('ovn_notify_coalesce_events',
+                                         coalesce, group='ovn')
+        self.addCleanup(ovn_config.cfg.CONF.clear_override,
+                        'ovn_notify_coalesce_events', group='ovn')
+        handler = ovsdb_monitor.OvnDbNotifyHandler(mock.Mock())
+        notifications = queue.Queue()
+        handler.notification_queues = [notifications]
+        watched = mock.Mock(table='Chassis', events=('update',),
+                            ONETIME=False, COALESCE_GROUP='Chassis')
+        handler.watch_event(watched)
+        row = self._row('Chassis')
+        row.uuid = uuid.uuid4()
+        for i in range(3):
+            handler.notify('update', row)
+        notifications.put(ovsdb_monitor.OvnDbNotifyHandler.STOP_EVENT)
+        handler.notify_loop(notifications)
+        return handler, watched
+
+    def test_notify_coalesce(self):
+        handler, watched = self._test_notify_coalesce(True)
+        watched.run.assert_called_once_with('update', mock.ANY, None)
+        self.assertEqual(2, handler.dropped_events)
+
+    def test_notify_no_coalesce(self):
+        handler, watched = self._test_notify_coalesce(False)
+        self.assertEqual(3, watched.run.call_count)
+        self.assertEqual(0, handler.dropped_events)
+
+    def _chassis_row(self, sb_idl, row_uuid, row_json):
+        return ovs_idl.Row.from_json(sb_idl, sb_idl.tables['Chassis'],
+                                     row_uuid, row_json)
+
+    def test_coalesce_updates(self):
+        helper = ovs_idl.SchemaHelper(schema_json=OVN_SB_SCHEMA)
+        helper.register_all()
+        sb_idl = ovsdb_monitor.BaseOvnIdl("remote", helper)
+        row_uuid = uuid.uuid4()
+        row = self._chassis_row(sb_idl, row_uuid, {'hostname': 'host3'})
+        watched = mock.Mock()
+        pending = (watched, 'update', row, self._chassis_row(
+            sb_idl, row_uuid,
+            {'hostname': 'host1',
+             'external_ids': ['map', [['ovn-bridge-mappings', 'a:b']]]}))
+        newer = (watched, 'update', row, self._chassis_row(
+            sb_idl, row_uuid, {'hostname': 'host2'}))
+        match, event, new_row, old = self.handler._coalesce(pending, newer)
+        self.assertEqual('update', event)
+        self.assertEqual('host1', old.hostname)
+        self.assertEqual({'ovn-bridge-mappings': 'a:b'}, old.external_ids)
+
+    def test_coalesce_create_update(self):
+        row = mock.Mock()
+        watched = mock.Mock()
+        self.assertEqual(
+            (watched, 'create', row, None),
+            self.handler._coalesce((watched, 'create', row, None),
+                                   (watched, 'update', row, mock.Mock())))
+
+
 class TestOvnSbIdlNotifyHandler(test_mech_driver.OVNMechanismDriverTestCase):
 
     l3_plugin = 'networking_ovn.l3.l3_ovn.OVNL3RouterPlugin'
@@ -249,6 +436,20 @@ class TestOvnSbIdlNotifyHandler(test_mech_driver.OVNMechanismDriverTestCase):
                 1,
                 self.l3_plugin.schedule_unhosted_routers.call_count)
 
+    def test_chassis_update_event_other_columns(self):
+        old_row_json = {"name": "old-name"}
+        self._test_chassis_helper('update', self.row_json, old_row_json)
+        self.assertFalse(self.driver.update_segment_host_mapping.called)
+        if ovn_config.is_ovn_l3():
+            self.assertFalse(
+                self.l3_plugin.schedule_unhosted_routers.called)
+
+    def test_chassis_update_event_other_external_ids(self):
+        old_row_json = copy.deepcopy(self.row_json)
+        old_row_json['external_ids'][1].append(["ovn-encap-ip", "1.2.3.4"])
+        self._test_chassis_helper('update', self.row_json, old_row_json)
+        self.assertFalse(self.driver.update_segment_host_mapping.called)
+
     def test_chassis_update_event(self):
         old_row_json = copy.deepcopy(self.row_json)
         old_row_json['external_ids'][1][0][1] = (
@@ -260,3 +461,82 @@ class TestOvnSbIdlNotifyHandler(test_mech_driver.OVNMechanismDriverTestCase):
             self.assertEqual(
                 1,
                 self.l3_plugin.schedule_unhosted_routers.call_count)
+
+
+class TestChassisEvent(base.TestCase):
+
+    def setUp(self):
+        super(TestChassisEvent, self).setUp()
+        ovn_config.cfg.CONF.set_override('ovn_chassis_reschedule_interval',
+                                         5, group='ovn')
+        self.addCleanup(ovn_config.cfg.CONF.clear_override,
+                        'ovn_chassis_reschedule_interval', group='ovn')
+        self.l3_plugin = mock.Mock()
+        patcher = mock.patch.object(
+            manager.NeutronManager, 'get_service_plugins',
+            return_value={service_constants.L3_ROUTER_NAT: self.l3_plugin})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.event = ovsdb_monitor.ChassisEvent(mock.Mock())
+
+    def test_schedule_unhosted_routers_debounced(self):
+        with mock.patch.object(ovsdb_monitor.greenthread,
+                               'spawn_after') as spawn_after:
+            for i in range(3):
+                self.event.schedule_unhosted_routers()
+            spawn_after.assert_called_once_with(
+                5, self.event._schedule_unhosted_routers)
+        self.assertFalse(self.l3_plugin.schedule_unhosted_routers.called)
+        self.assertEqual(2, self.event.suppressed_reschedules)
+
+        self.event._schedule_unhosted_routers()
+        self.l3_plugin.schedule_unhosted_routers.assert_called_once_with()
+        self.assertEqual(1, self.event.reschedule_runs)
+
+        # The next event starts a new interval
+        with mock.patch.object(ovsdb_monitor.greenthread,
+                               'spawn_after') as spawn_after:
+            self.event.schedule_unhosted_routers()
+            self.assertTrue(spawn_after.called)
+
+    def test_schedule_unhosted_routers_no_interval(self):
+        self.event.reschedule_interval = 0
+        with mock.patch.object(ovsdb_monitor.greenthread,
+                               'spawn_after') as spawn_after:
+            self.event.schedule_unhosted_routers()
+            self.event.schedule_unhosted_routers()
+            self.assertFalse(spawn_after.called)
+        self.assertEqual(
+            2, self.l3_plugin.schedule_unhosted_routers.call_count)
+        self.assertEqual(0, self.event.suppressed_reschedules)
+
+
+class TestBaseOvnConnection(base.TestCase):
+
+    def setUp(self):
+        super(TestBaseOvnConnection, self).setUp()
+        self.conn = ovsdb_monitor.BaseOvnConnection(
+            mock.Mock(), mock.Mock(), 'OVN_Northbound')
+        self.helper = ovs_idl.SchemaHelper(
+            schema_json=copy.deepcopy(OVN_NB_SCHEMA))
+
+    def test_register_tables_all(self):
+        self.conn._register_tables(self.helper, None)
+        schema = self.helper.get_idl_schema()
+        self.assertEqual(set(OVN_NB_SCHEMA['tables']), set(schema.tables))
+
+    def test_register_table_columns(self):
+        self.conn._register_tables(
+            self.helper, None,
+            {'Logical_Switch_Port': ['name', 'up', 'dhcpv4_options'],
+             'Logical_Switch': None,
+             'ACL': ['match']})
+        schema = self.helper.get_idl_schema()
+        self.assertEqual(set(['Logical_Switch_Port', 'Logical_Switch']),
+                         set(schema.tables))
+        self.assertEqual(
+            set(['name', 'up']),
+            set(schema.tables['Logical_Switch_Port'].columns))
+        self.assertEqual(
+            set(OVN_NB_SCHEMA['tables']['Logical_Switch']['columns']),
+            set(schema.tables['Logical_Switch'].columns))
@@ -0,0 +1,87 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+
+from networking_ovn.ovsdb import port_latency
+from networking_ovn.tests import base
+
+
+class TestPortUpLatencyTracker(base.TestCase):
+
+    def setUp(self):
+        super(TestPortUpLatencyTracker, self).setUp()
+        self.now = 1000.0
+        patcher = mock.patch.object(port_latency.time, 'time',
+                                    side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.tracker = port_latency.PortUpLatencyTracker(10)
+
+    def _record_stages(self, port_id, latencies):
+        self.tracker.record(port_id, port_latency.NB_COMMIT)
+        for stage, latency in zip(port_latency.STAGES[1:], latencies):
+            self.now += latency
+            self.tracker.record(port_id, stage)
+
+    def _bucket(self, index):
+        histogram = [0] * (len(port_latency.BUCKETS) + 1)
+        histogram[index] = 1
+        return histogram
+
+    def test_record(self):
+        with mock.patch.object(port_latency.LOG, 'warning') as warning:
+            self._record_stages('port1', (2, 0.5))
+            self.assertFalse(warning.called)
+        # <=2s
+        self.assertEqual(self._bucket(3), self.tracker.histograms[
+            port_latency.UP_RECEIVED])
+        # <=0.5s
+        self.assertEqual(self._bucket(1), self.tracker.histograms[
+            port_latency.PROVISIONING_COMPLETE])
+        # <=5s
+        self.assertEqual(self._bucket(4), self.tracker.histograms[
+            port_latency.TOTAL])
+
+    def test_record_slow_port(self):
+        with mock.patch.object(port_latency.LOG, 'warning') as warning:
+            self._record_stages('port1', (30, 1))
+            self.assertEqual(1, warning.call_count)
+            self.assertEqual('port1', warning.call_args[0][1]['port'])
+
+    def test_is_tracked(self):
+        self.assertFalse(self.tracker.is_tracked('port1'))
+        self.tracker.record('port1', port_latency.NB_COMMIT)
+        self.assertTrue(self.tracker.is_tracked('port1'))
+        self.tracker.record('port1', port_latency.PROVISIONING_COMPLETE)
+        self.assertFalse(self.tracker.is_tracked('port1'))
+
+    def test_record_untracked_port(self):
+        # The up event of a port created before the tracking started
+        self.tracker.record('port1', port_latency.UP_RECEIVED)
+        self.tracker.record('port1', port_latency.PROVISIONING_COMPLETE)
+        self.assertEqual(0, sum(self.tracker.histograms[port_latency.TOTAL]))
+
+    def test_record_evicts_oldest_ports(self):
+        with mock.patch.object(port_latency, 'MAX_TRACKED_PORTS', 2):
+            for port_id in ('port1', 'port2', 'port3'):
+                self.tracker.record(port_id, port_latency.NB_COMMIT)
+        self.tracker.record('port1', port_latency.PROVISIONING_COMPLETE)
+        self.tracker.record('port3', port_latency.PROVISIONING_COMPLETE)
+        self.assertEqual(1, sum(self.tracker.histograms[port_latency.TOTAL]))
+
+    def test_report(self):
+        self._record_stages('port1', (1, 1))
+        with mock.patch.object(port_latency.LOG, 'info') as info:
+            self.now += port_latency.REPORT_INTERVAL
+            self._record_stages('port2', (1, 1))
+            self.assertEqual(len(port_latency.STAGES), info.call_count)
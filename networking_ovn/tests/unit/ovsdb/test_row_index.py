@@ -0,0 +1,381 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import copy
+import mock
+import uuid
+
+from ovs.db import idl as ovs_idl
+
+from neutron.agent.ovsdb.native import idlutils
+
+from networking_ovn.common import acl as ovn_acl
+from networking_ovn.ovsdb import commands
+from networking_ovn.ovsdb import ovsdb_monitor
+from networking_ovn.ovsdb import row_index
+from networking_ovn.tests import base
+from networking_ovn.tests.unit.ovsdb import test_ovsdb_monitor
+
+
+OVN_NB_LSWITCH_PORTS_SCHEMA = copy.deepcopy(test_ovsdb_monitor.OVN_NB_SCHEMA)
+OVN_NB_LSWITCH_PORTS_SCHEMA['tables']['Logical_Switch']['columns'][
+    'ports'] = {"type": {"key": {"type": "uuid",
+                                 "refTable": "Logical_Switch_Port",
+                                 "refType": "strong"},
+                         "min": 0, "max": "unlimited"}}
+
+
+class TestNameIndex(base.TestCase):
+
+    def setUp(self):
+        super(TestNameIndex, self).setUp()
+        helper = ovs_idl.SchemaHelper(
+            schema_json=OVN_NB_LSWITCH_PORTS_SCHEMA)
+        helper.register_all()
+        self.idl = ovsdb_monitor.BaseOvnIdl("remote", helper)
+        self.lsp_table = self.idl.tables['Logical_Switch_Port']
+
+    def _create_row(self, row_json, table=None):
+        table = table or self.lsp_table
+        row_uuid = uuid.uuid4()
+        row = ovs_idl.Row.from_json(self.idl, table, row_uuid, row_json)
+        table.rows[row_uuid] = row
+        self.idl.notify(ovs_idl.ROW_CREATE, row)
+        return row
+
+    def _delete_row(self, row):
+        del row._table.rows[row.uuid]
+        self.idl.notify(ovs_idl.ROW_DELETE, row)
+
+    def test_row_by_name(self):
+        row = self._create_row({'name': 'lsp1'})
+        self._create_row({'name': 'lsp2'})
+        self.assertEqual(row, row_index.row_by_name(
+            self.idl, 'Logical_Switch_Port', 'lsp1'))
+
+    def test_row_by_name_not_found(self):
+        self.assertRaises(idlutils.RowNotFound, row_index.row_by_name,
+                          self.idl, 'Logical_Switch_Port', 'lsp1')
+        self.assertIsNone(row_index.row_by_name(
+            self.idl, 'Logical_Switch_Port', 'lsp1', None))
+
+    def test_row_by_name_deleted(self):
+        row = self._create_row({'name': 'lsp1'})
+        self._delete_row(row)
+        self.assertIsNone(row_index.row_by_name(
+            self.idl, 'Logical_Switch_Port', 'lsp1', None))
+
+    def test_row_by_name_renamed(self):
+        old_row = self._create_row({'name': 'lsp1'})
+        row = ovs_idl.Row.from_json(self.idl, self.lsp_table, old_row.uuid,
+                                    {'name': 'lsp2'})
+        self.lsp_table.rows[row.uuid] = row
+        self.idl.notify(ovs_idl.ROW_UPDATE, row, old_row)
+        self.assertIsNone(row_index.row_by_name(
+            self.idl, 'Logical_Switch_Port', 'lsp1', None))
+        self.assertEqual(row, row_index.row_by_name(
+            self.idl, 'Logical_Switch_Port', 'lsp2'))
+
+    def test_row_by_name_other_column_update(self):
+        row = self._create_row({'name': 'lsp1', 'type': ''})
+        old_row = ovs_idl.Row.from_json(self.idl, self.lsp_table, row.uuid,
+                                        {'type': 'router'})
+        self.idl.notify(ovs_idl.ROW_UPDATE, row, old_row)
+        self.assertEqual(row, row_index.row_by_name(
+            self.idl, 'Logical_Switch_Port', 'lsp1'))
+
+    def test_row_by_name_duplicate_names(self):
+        row1 = self._create_row({'name': 'lsp1'})
+        row2 = self._create_row({'name': 'lsp1'})
+        self._delete_row(row1)
+        self.assertEqual(row2, row_index.row_by_name(
+            self.idl, 'Logical_Switch_Port', 'lsp1'))
+
+    def test_row_by_name_stale_after_reconnect(self):
+        self._create_row({'name': 'lsp1'})
+        # The IDL clears its tables without notifications on reconnect.
+        self.lsp_table.rows = {}
+        self.assertIsNone(row_index.row_by_name(
+            self.idl, 'Logical_Switch_Port', 'lsp1', None))
+
+    def test_row_by_name_inserted_in_transaction(self):
+        txn = ovs_idl.Transaction(self.idl)
+        self.addCleanup(txn.abort)
+        row = txn.insert(self.lsp_table)
+        row.name = 'lsp1'
+        # The IDL doesn't notify the rows inserted by a transaction.
+        self.assertEqual(row, row_index.row_by_name(
+            self.idl, 'Logical_Switch_Port', 'lsp1'))
+
+    def test_row_by_name_renamed_in_transaction(self):
+        row = self._create_row({'name': 'lsp1'})
+        txn = ovs_idl.Transaction(self.idl)
+        self.addCleanup(txn.abort)
+        row.name = 'lsp2'
+        self.assertIsNone(row_index.row_by_name(
+            self.idl, 'Logical_Switch_Port', 'lsp1', None))
+        self.assertEqual(row, row_index.row_by_name(
+            self.idl, 'Logical_Switch_Port', 'lsp2'))
+
+    def test_row_by_name_deleted_in_aborted_transaction(self):
+        row = self._create_row({'name': 'lsp1'})
+        txn = ovs_idl.Transaction(self.idl)
+        row.delete()
+        self.assertIsNone(row_index.row_by_name(
+            self.idl, 'Logical_Switch_Port', 'lsp1', None))
+        txn.abort()
+        # The row is restored, so it must still be indexed.
+        self.assertEqual(row, row_index.row_by_name(
+            self.idl, 'Logical_Switch_Port', 'lsp1'))
+
+    def test_row_by_name_no_table_scan(self):
+        self._create_row({'name': 'lsp1'})
+        txn = ovs_idl.Transaction(self.idl)
+        self.addCleanup(txn.abort)
+        txn.insert(self.lsp_table).name = 'lsp2'
+        with mock.patch.object(idlutils, 'row_by_value') as rbv:
+            self.assertIsNone(row_index.row_by_name(
+                self.idl, 'Logical_Switch_Port', 'lsp3', None))
+            self.assertRaises(idlutils.RowNotFound, row_index.row_by_name,
+                              self.idl, 'Logical_Switch_Port', 'lsp3')
+        self.assertFalse(rbv.called)
+
+    def test_add_lswitch_and_lport_in_transaction(self):
+        api = mock.Mock(idl=self.idl, _tables=self.idl.tables)
+        txn = ovs_idl.Transaction(self.idl)
+        self.addCleanup(txn.abort)
+        commands.AddLSwitchCommand(api, 'ls1', may_exist=True).run_idl(txn)
+        commands.AddLSwitchPortCommand(api, 'lsp1', 'ls1',
+                                       may_exist=True).run_idl(txn)
+        # Both rows are inserted by the transaction
+        lswitch = row_index.row_by_name(self.idl, 'Logical_Switch', 'ls1')
+        lport = row_index.row_by_name(self.idl, 'Logical_Switch_Port',
+                                      'lsp1')
+        self.assertIn(lswitch.uuid, txn._txn_rows)
+        self.assertIn(lport.uuid, txn._txn_rows)
+
+    def test_row_by_name_no_index(self):
+        fake_idl = mock.Mock()
+        with mock.patch.object(idlutils, 'row_by_value') as rbv:
+            row_index.row_by_name(fake_idl, 'Logical_Switch', 'ls1', None)
+            rbv.assert_called_once_with(fake_idl, 'Logical_Switch', 'name',
+                                        'ls1', None)
+
+
+OVN_NB_DHCP_SCHEMA = {
+    "name": "OVN_Northbound", "version": "5.3.0",
+    "tables": {
+        "DHCP_Options": {
+            "columns": {
+                "cidr": {"type": "string"},
+                "options": {"type": {"key": "string", "value": "string",
+                                     "min": 0, "max": "unlimited"}},
+                "external_ids": {"type": {"key": "string", "value": "string",
+                                          "min": 0, "max": "unlimited"}}},
+            "isRoot": True,
+        }
+    }
+}
+
+
+class TestDhcpOptionsIndex(base.TestCase):
+
+    def setUp(self):
+        super(TestDhcpOptionsIndex, self).setUp()
+        helper = ovs_idl.SchemaHelper(schema_json=OVN_NB_DHCP_SCHEMA)
+        helper.register_all()
+        self.idl = ovsdb_monitor.BaseOvnIdl("remote", helper)
+        self.table = self.idl.tables['DHCP_Options']
+        self.index = self.idl.dhcp_options_index
+
+    def _create_row(self, subnet_id, port_id=None):
+        external_ids = [['subnet_id', subnet_id]]
+        if port_id:
+            external_ids.append(['port_id', port_id])
+        row_uuid = uuid.uuid4()
+        row = ovs_idl.Row.from_json(
+            self.idl, self.table, row_uuid,
+            {'cidr': '10.0.0.0/24', 'external_ids': ['map', external_ids]})
+        self.table.rows[row_uuid] = row
+        self.idl.notify(ovs_idl.ROW_CREATE, row)
+        return row
+
+    def test_get_subnet_row(self):
+        subnet_row = self._create_row('subnet1')
+        self._create_row('subnet1', port_id='port1')
+        self.assertEqual(subnet_row, self.index.get_subnet_row('subnet1'))
+        self.assertIsNone(self.index.get_subnet_row('subnet2'))
+
+    def test_get_port_row(self):
+        self._create_row('subnet1')
+        port_row = self._create_row('subnet1', port_id='port1')
+        self.assertEqual(port_row,
+                         self.index.get_port_row('subnet1', 'port1'))
+        self.assertIsNone(self.index.get_port_row('subnet1', 'port2'))
+
+    def test_get_port_rows(self):
+        self._create_row('subnet1')
+        port_row1 = self._create_row('subnet1', port_id='port1')
+        port_row2 = self._create_row('subnet1', port_id='port2')
+        self._create_row('subnet2', port_id='port3')
+        self.assertEqual({'port1': port_row1, 'port2': port_row2},
+                         self.index.get_port_rows('subnet1'))
+
+    def test_delete_row(self):
+        subnet_row = self._create_row('subnet1')
+        del self.table.rows[subnet_row.uuid]
+        self.idl.notify(ovs_idl.ROW_DELETE, subnet_row)
+        self.assertIsNone(self.index.get_subnet_row('subnet1'))
+
+    def test_update_external_ids(self):
+        old_row = self._create_row('subnet1')
+        row = ovs_idl.Row.from_json(
+            self.idl, self.table, old_row.uuid,
+            {'external_ids': ['map', [['subnet_id', 'subnet1'],
+                                      ['port_id', 'port1']]]})
+        self.table.rows[row.uuid] = row
+        self.idl.notify(ovs_idl.ROW_UPDATE, row, old_row)
+        self.assertIsNone(self.index.get_subnet_row('subnet1'))
+        self.assertEqual(row, self.index.get_port_row('subnet1', 'port1'))
+
+
+OVN_NB_ACL_SCHEMA = {
+    "name": "OVN_Northbound", "version": "5.3.0",
+    "tables": {
+        "ACL": {
+            "columns": {
+                "priority": {"type": {"key": {"type": "integer"}}},
+                "direction": {"type": "string"},
+                "match": {"type": "string"},
+                "action": {"type": "string"},
+                "log": {"type": "boolean"},
+                "external_ids": {"type": {"key": "string", "value": "string",
+                                          "min": 0, "max": "unlimited"}}},
+            "isRoot": False,
+        }
+    }
+}
+
+
+class TestAclIndex(base.TestCase):
+
+    def setUp(self):
+        super(TestAclIndex, self).setUp()
+        helper = ovs_idl.SchemaHelper(schema_json=OVN_NB_ACL_SCHEMA)
+        helper.register_all()
+        self.idl = ovsdb_monitor.BaseOvnIdl("remote", helper)
+        self.table = self.idl.tables['ACL']
+        self.index = self.idl.acl_index
+
+    def _acl_json(self, port_id, match):
+        return {'priority': 1002, 'direction': 'to-lport', 'match': match,
+                'action': 'allow-related', 'log': False,
+                'external_ids': ['map', [['neutron:lport', port_id]]]}
+
+    def _create_row(self, port_id, match):
+        row_uuid = uuid.uuid4()
+        row = ovs_idl.Row.from_json(self.idl, self.table, row_uuid,
+                                    self._acl_json(port_id, match))
+        self.table.rows[row_uuid] = row
+        self.idl.notify(ovs_idl.ROW_CREATE, row)
+        return row
+
+    def test_get_port_acls(self):
+        row1 = self._create_row('port1', 'outport == "port1" && ip4')
+        row2 = self._create_row('port1', 'outport == "port1" && ip4')
+        row3 = self._create_row('port1', 'outport == "port1" && ip6')
+        self._create_row('port2', 'outport == "port2" && ip4')
+        acl = {'priority': 1002, 'direction': 'to-lport',
+               'match': 'outport == "port1" && ip4',
+               'action': 'allow-related', 'log': False,
+               'external_ids': {'neutron:lport': 'port1'}}
+        port_acls = self.index.get_port_acls('port1')
+        self.assertEqual(2, len(port_acls))
+        self.assertItemsEqual([row1, row2], port_acls[ovn_acl.acl_key(acl)])
+        acl['match'] = 'outport == "port1" && ip6'
+        self.assertEqual([row3], port_acls[ovn_acl.acl_key(acl)])
+
+    def test_delete_row(self):
+        row = self._create_row('port1', 'outport == "port1" && ip4')
+        del self.table.rows[row.uuid]
+        self.idl.notify(ovs_idl.ROW_DELETE, row)
+        self.assertEqual({}, self.index.get_port_acls('port1'))
+
+    def test_update_row(self):
+        old_row = self._create_row('port1', 'outport == "port1" && ip4')
+        row = ovs_idl.Row.from_json(
+            self.idl, self.table, old_row.uuid,
+            self._acl_json('port1', 'outport == "port1" && ip6'))
+        self.table.rows[row.uuid] = row
+        self.idl.notify(ovs_idl.ROW_UPDATE, row, ovs_idl.Row.from_json(
+            self.idl, self.table, old_row.uuid,
+            {'match': 'outport == "port1" && ip4'}))
+        port_acls = self.index.get_port_acls('port1')
+        self.assertEqual([[row]], list(port_acls.values()))
+        self.assertEqual('outport == "port1" && ip6',
+                         list(port_acls.keys())[0][3])
+
+
+class TestChassisPhysnetIndex(base.TestCase):
+
+    def setUp(self):
+        super(TestChassisPhysnetIndex, self).setUp()
+        helper = ovs_idl.SchemaHelper(
+            schema_json=test_ovsdb_monitor.OVN_SB_SCHEMA)
+        helper.register_all()
+        self.idl = ovsdb_monitor.BaseOvnIdl("remote", helper)
+        self.table = self.idl.tables['Chassis']
+        self.index = self.idl.chassis_physnet_index
+
+    def _chassis_json(self, hostname, bridge_mappings):
+        return {'name': hostname, 'hostname': hostname,
+                'external_ids': ['map', [['ovn-bridge-mappings',
+                                          bridge_mappings]]]}
+
+    def _create_row(self, hostname, bridge_mappings):
+        row_uuid = uuid.uuid4()
+        row = ovs_idl.Row.from_json(
+            self.idl, self.table, row_uuid,
+            self._chassis_json(hostname, bridge_mappings))
+        self.table.rows[row_uuid] = row
+        self.idl.notify(ovs_idl.ROW_CREATE, row)
+        return row
+
+    def test_get_hostnames(self):
+        self._create_row('host1', 'physnet1:br-eth1,physnet2:br-eth2')
+        self._create_row('host2', 'physnet1:br-eth1')
+        self.assertEqual(set(['host1', 'host2']),
+                         self.index.get_hostnames('physnet1'))
+        self.assertEqual(set(['host1']),
+                         self.index.get_hostnames('physnet2'))
+        self.assertEqual(set(), self.index.get_hostnames('physnet3'))
+
+    def test_update_row(self):
+        old_row = self._create_row('host1', 'physnet1:br-eth1')
+        row = ovs_idl.Row.from_json(
+            self.idl, self.table, old_row.uuid,
+            self._chassis_json('host1', 'physnet2:br-eth1'))
+        self.table.rows[row.uuid] = row
+        self.idl.notify(ovs_idl.ROW_UPDATE, row, old_row)
+        self.assertEqual(set(), self.index.get_hostnames('physnet1'))
+        self.assertEqual(set(['host1']),
+                         self.index.get_hostnames('physnet2'))
+
+    def test_delete_row(self):
+        row = self._create_row('host1', 'physnet1:br-eth1')
+        del self.table.rows[row.uuid]
+        self.idl.notify(ovs_idl.ROW_DELETE, row)
+        self.assertEqual(set(), self.index.get_hostnames('physnet1'))
+
+    def test_invalid_bridge_mappings(self):
+        self._create_row('host1', 'physnet1')
+        self.assertEqual(set(), self.index.get_hostnames('physnet1'))
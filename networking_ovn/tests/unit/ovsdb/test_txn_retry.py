@@ -0,0 +1,164 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+
+from networking_ovn.common import config as ovn_config
+from networking_ovn.ovsdb import txn_retry
+from networking_ovn.tests import base
+
+
+class TestRetryTransaction(base.TestCase):
+
+    def setUp(self):
+        super(TestRetryTransaction, self).setUp()
+        self.idl_txn = mock.Mock(TRY_AGAIN='try again', SUCCESS='success',
+                                 ERROR='error', ABORTED='aborted',
+                                 UNCHANGED='unchanged')
+        self.addrset = mock.Mock(uuid='addrset-uuid',
+                                 _prereqs={'addresses': None})
+        self.addrset._table.name = 'Address_Set'
+        self.idl_txn._txn_rows = {}
+        mock.patch.object(txn_retry.idl, 'Transaction',
+                          return_value=self.idl_txn).start()
+        self.wait_for_change = mock.patch.object(
+            txn_retry.idlutils, 'wait_for_change').start()
+        self.sleep = mock.patch.object(txn_retry.time, 'sleep').start()
+        self.addCleanup(mock.patch.stopall)
+        self.stats = txn_retry.RetryStats()
+        mock.patch.object(txn_retry.RetryTransaction, 'stats',
+                          self.stats).start()
+
+    def _commit(self, *statuses, **kwargs):
+        statuses = list(statuses)
+
+        def run_idl(txn):
+            # The command verifies the addresses of the address set
+            txn._txn_rows[self.addrset.uuid] = self.addrset
+
+        def commit_block():
+            # The IDL transaction forgets its rows once committed
+            self.idl_txn._txn_rows = {}
+            return statuses.pop(0)
+
+        self.idl_txn.commit_block.side_effect = commit_block
+        command = mock.Mock(result='result')
+        command.run_idl.side_effect = run_idl
+        txn = txn_retry.RetryTransaction(mock.Mock(), mock.Mock(), 10,
+                                         check_error=True)
+        txn.add(command)
+        attempts = len(statuses)
+        for i in range(kwargs.get('queued', 1)):
+            result = txn.do_commit()
+        self.assertEqual(attempts, command.run_idl.call_count)
+        return result
+
+    def test_get_verified_columns(self):
+        self.idl_txn._txn_rows = {self.addrset.uuid: self.addrset}
+        self.assertEqual({('Address_Set', 'addrset-uuid', 'addresses')},
+                         txn_retry.get_verified_columns(self.idl_txn))
+
+    def test_do_commit(self):
+        self.assertEqual(['result'], self._commit('success'))
+        self.assertEqual(1, self.stats.transactions)
+        self.assertEqual(0, self.stats.retried_transactions)
+
+    def test_do_commit_try_again(self):
+        self.assertEqual(['result'],
+                         self._commit('try again', 'try again', 'success'))
+        self.assertEqual(2, self.wait_for_change.call_count)
+        self.assertEqual(1, self.stats.retried_transactions)
+        self.assertEqual(2, self.stats.retries)
+        self.assertEqual({('Address_Set', 'addresses'): 2},
+                         self.stats.conflicts)
+        # No backoff configured
+        self.assertFalse(self.sleep.called)
+
+    def _set_backoff(self):
+        ovn_config.cfg.CONF.set_override('ovn_nb_txn_retry_backoff', 100,
+                                         group='ovn')
+        self.addCleanup(ovn_config.cfg.CONF.clear_override,
+                        'ovn_nb_txn_retry_backoff', group='ovn')
+
+    def test_do_commit_try_again_backoff(self):
+        self._set_backoff()
+        self.assertIs(txn_retry.TRY_AGAIN, self._commit('try again'))
+        # The connection thread doesn't sleep nor wait for the change, the
+        # caller backs off.
+        self.assertFalse(self.sleep.called)
+        self.assertFalse(self.wait_for_change.called)
+        self.assertEqual(0, self.stats.transactions)
+
+    def test_do_commit_try_again_backoff_queued_again(self):
+        self._set_backoff()
+        self.assertEqual(['result'], self._commit('try again', 'success',
+                                                  queued=2))
+        # The retry waits for the change which made the attempt fail
+        self.assertEqual(1, self.wait_for_change.call_count)
+        self.assertFalse(self.sleep.called)
+        self.assertEqual(1, self.stats.retried_transactions)
+        self.assertEqual({('Address_Set', 'addresses'): 1},
+                         self.stats.conflicts)
+
+    def test_commit_try_again_backoff(self):
+        self._set_backoff()
+        txn = txn_retry.RetryTransaction(mock.Mock(), mock.Mock(), 10)
+        with mock.patch.object(txn_retry.impl_idl.Transaction, 'commit',
+                               side_effect=[txn_retry.TRY_AGAIN,
+                                            ['result']]) as commit:
+            self.assertEqual(['result'], txn.commit())
+        # The caller backs off before queueing the transaction again
+        self.assertEqual(2, commit.call_count)
+        self.assertEqual(1, self.sleep.call_count)
+        self.assertTrue(0 <= self.sleep.call_args[0][0] <= 0.1)
+
+    def test_commit_try_again_timeout(self):
+        self._set_backoff()
+        txn = txn_retry.RetryTransaction(mock.Mock(), mock.Mock(), 10)
+        with mock.patch.object(txn_retry.impl_idl.Transaction, 'commit',
+                               return_value=txn_retry.TRY_AGAIN), \
+                mock.patch.object(txn, 'timeout_exceeded',
+                                  return_value=True):
+            self.assertRaises(RuntimeError, txn.commit)
+        self.assertFalse(self.sleep.called)
+
+    def test_commit_merges_commands(self):
+        txn = txn_retry.RetryTransaction(mock.Mock(), mock.Mock(), 10)
+        txn.add(mock.sentinel.cmd1)
+        txn.add(mock.sentinel.cmd2)
+        with mock.patch.object(txn_retry.cmd, 'merge_commands',
+                               return_value=([mock.sentinel.cmd1], 1)), \
+                mock.patch.object(txn_retry.impl_idl.Transaction,
+                                  'commit') as commit:
+            txn.commit()
+            commit.assert_called_once_with()
+        self.assertEqual([mock.sentinel.cmd1], txn.commands)
+
+    def test_get_backoff(self):
+        ovn_config.cfg.CONF.set_override('ovn_nb_txn_retry_backoff', 100,
+                                         group='ovn')
+        self.addCleanup(ovn_config.cfg.CONF.clear_override,
+                        'ovn_nb_txn_retry_backoff', group='ovn')
+        txn = txn_retry.RetryTransaction(mock.Mock(), mock.Mock(), 10)
+        with mock.patch.object(txn, 'time_remaining', return_value=10), \
+                mock.patch.object(txn_retry.random, 'uniform',
+                                  side_effect=lambda low, high: high):
+            self.assertEqual(0.1, txn.get_backoff(1))
+            self.assertEqual(0.4, txn.get_backoff(3))
+            self.assertEqual(3.2, txn.get_backoff(10))
+
+    def test_report(self):
+        self.stats.record(3, {('Address_Set', 'addresses'): 2})
+        with mock.patch.object(txn_retry.LOG, 'info') as info:
+            self.stats.report()
+            self.assertEqual('Address_Set.addresses: 2',
+                             info.call_args[0][1]['columns'])
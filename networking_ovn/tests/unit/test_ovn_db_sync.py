@@ -14,6 +14,8 @@
 
 import mock
 
+from networking_ovn.common import acl as ovn_acl
+from networking_ovn.common import config as ovn_config
 from networking_ovn.common import constants as ovn_const
 from networking_ovn import ovn_db_sync
 from networking_ovn.tests.unit.ml2 import test_mech_driver
@@ -298,7 +300,7 @@ class TestOvnNbSyncML2(test_mech_driver.OVNMechanismDriverTestCase):
         ovn_api.transaction = mock.MagicMock()
 
         ovn_driver.create_network_in_ovn = mock.Mock()
-        ovn_driver.create_port_in_ovn = mock.Mock()
+        ovn_driver.create_ports_in_ovn = mock.Mock(return_value=set())
         ovn_driver.validate_and_get_data_from_binding_profile = mock.Mock()
         ovn_driver.get_ovn_port_options = mock.Mock()
         ovn_driver.get_ovn_port_options.return_value = mock.ANY
@@ -399,12 +401,13 @@ class TestOvnNbSyncML2(test_mech_driver.OVNMechanismDriverTestCase):
         ovn_driver.create_network_in_ovn.assert_has_calls(
             create_network_calls, any_order=True)
 
-        self.assertEqual(len(create_port_list),
-                         ovn_driver.create_port_in_ovn.call_count)
-        create_port_calls = [mock.call(port, mock.ANY)
-                             for port in create_port_list]
-        ovn_driver.create_port_in_ovn.assert_has_calls(create_port_calls,
-                                                       any_order=True)
+        if create_port_list:
+            # The missing ports are created at once
+            ports = ovn_driver.create_ports_in_ovn.call_args[0][0]
+            self.assertEqual(sorted(port['id'] for port in create_port_list),
+                             sorted(port['id'] for port in ports))
+        else:
+            self.assertFalse(ovn_driver.create_ports_in_ovn.called)
 
         self.assertEqual(len(del_network_list),
                          ovn_api.delete_lswitch.call_count)
@@ -616,6 +619,110 @@ class TestOvnNbSyncML2(test_mech_driver.OVNMechanismDriverTestCase):
                                       add_subnet_dhcp_options_list,
                                       delete_dhcp_options_list)
 
+    def test_sync_port_groups(self):
+        ovn_config.cfg.CONF.set_override('ovn_port_groups', True,
+                                         group='ovn')
+        self.addCleanup(ovn_config.cfg.CONF.clear_override,
+                        'ovn_port_groups', group='ovn')
+        rule1 = {'id': 'rule1', 'security_group_id': 'sg1',
+                 'direction': 'ingress', 'ethertype': 'IPv4',
+                 'remote_group_id': None, 'remote_ip_prefix': None,
+                 'protocol': None, 'port_range_min': None,
+                 'port_range_max': None}
+        rule2 = dict(rule1, id='rule2', direction='egress')
+        core_plugin = mock.Mock()
+        core_plugin.get_security_groups.return_value = [
+            {'id': 'sg1', 'security_group_rules': [rule1, rule2]},
+            {'id': 'sg2', 'security_group_rules': []}]
+        core_plugin.get_ports.return_value = [
+            {'id': 'p1', 'security_groups': ['sg1']},
+            {'id': 'p2', 'security_groups': ['sg1']},
+            {'id': 'p3', 'security_groups': ['sg1']}]
+        ovn_api = self.mech_driver._nb_ovn
+        # p3 is not created in the NB DB yet
+        ovn_api.get_all_logical_switch_ports_ids.return_value = {
+            'p1': {}, 'p2': {}, 'p4': {}}
+        stale_acl = dict(ovn_acl.sg_rule_acl_for_port_group(rule1),
+                         match='outport == @pg_sg1')
+        ovn_api.get_port_groups.return_value = {
+            ovn_const.OVN_DROP_PORT_GROUP_NAME: {
+                'name': ovn_const.OVN_DROP_PORT_GROUP_NAME,
+                'acls': ovn_acl.drop_all_ip_traffic_for_port_group(),
+                'ports': ['p1', 'p2'], 'external_ids': {}},
+            'pg_sg1': {
+                'name': 'pg_sg1',
+                'acls': [ovn_acl.sg_rule_acl_for_port_group(rule2),
+                         stale_acl],
+                'ports': ['p1', 'p4'],
+                'external_ids': {ovn_const.OVN_SG_EXT_ID_KEY: 'sg1'}},
+            'pg_sg3': {
+                'name': 'pg_sg3', 'acls': [], 'ports': [],
+                'external_ids': {ovn_const.OVN_SG_EXT_ID_KEY: 'sg3'}}}
+        ovn_nb_synchronizer = ovn_db_sync.OvnNbSynchronizer(
+            core_plugin, ovn_api, 'repair', self.mech_driver)
+
+        ovn_nb_synchronizer.sync_port_groups(mock.MagicMock())
+
+        ovn_api.create_port_group.assert_called_once_with(
+            'pg_sg2', acls=[], lports=[],
+            external_ids={ovn_const.OVN_SG_EXT_ID_KEY: 'sg2'})
+        ovn_api.delete_port_group.assert_called_once_with('pg_sg3')
+        ovn_api.delete_port_group_acls.assert_called_once_with(
+            'pg_sg1', [stale_acl])
+        ovn_api.add_port_group_acls.assert_called_once_with(
+            'pg_sg1', [ovn_acl.sg_rule_acl_for_port_group(rule1)])
+        ovn_api.update_port_group_ports.assert_called_once_with(
+            'pg_sg1', ['p2'], ['p4'])
+
+    def test_remove_common_acls(self):
+        acl1 = {'lswitch': 'neutron-n1', 'lport': 'p1', 'priority': 1002,
+                'direction': 'to-lport', 'action': 'allow-related',
+                'log': False, 'match': 'outport == "p1" && ip4',
+                'external_ids': {'neutron:lport': 'p1'}}
+        acl2 = dict(acl1, match='outport == "p1" && ip6')
+        acl3 = dict(acl1, match='outport == "p1" && tcp')
+        acl4 = dict(acl1, lport='p2', match='outport == "p2" && ip4',
+                    external_ids={'neutron:lport': 'p2'})
+        # The NB acls hold the columns read back from the database
+        nb_acl1 = dict(acl1, name=[])
+        neutron_acls = {'p1': [acl1, acl2, acl3], 'p2': [acl4]}
+        nb_acls = {'p1': [nb_acl1, dict(acl2), dict(acl2)],
+                   'p3': [dict(acl1, lport='p3')]}
+        ovn_nb_synchronizer = ovn_db_sync.OvnNbSynchronizer(
+            mock.Mock(), self.mech_driver._nb_ovn, 'repair',
+            self.mech_driver)
+
+        counts = ovn_nb_synchronizer.remove_common_acls(neutron_acls,
+                                                        nb_acls)
+
+        self.assertEqual({'add': 2, 'remove': 1, 'duplicate': 1}, counts)
+        # All the copies of a duplicated acl are removed and it is added
+        # back once.
+        self.assertEqual({'p1': [acl2, acl3], 'p2': [acl4]}, neutron_acls)
+        self.assertEqual({'p1': [acl2, acl2],
+                          'p3': [dict(acl1, lport='p3')]}, nb_acls)
+
+    def test_sync_acls_duplicated_nb_acls(self):
+        acl = {'lswitch': 'neutron-n1', 'lport': 'p1', 'priority': 1002,
+               'direction': 'to-lport', 'action': 'allow-related',
+               'log': False, 'match': 'outport == "p1" && ip4',
+               'external_ids': {'neutron:lport': 'p1'}}
+        core_plugin = mock.Mock()
+        core_plugin.get_ports.return_value = []
+        ovn_api = self.mech_driver._nb_ovn
+        ovn_nb_synchronizer = ovn_db_sync.OvnNbSynchronizer(
+            core_plugin, ovn_api, 'repair', self.mech_driver)
+        ovn_nb_synchronizer.get_acls = mock.Mock(
+            return_value={'p1': [dict(acl), dict(acl), dict(acl)]})
+
+        ovn_nb_synchronizer.sync_acls(mock.ANY)
+
+        # The removal by match drops all the copies at once, so it is only
+        # done once.
+        ovn_api.update_acls.assert_called_once_with(
+            ['n1'], ['p1'], {'p1': mock.ANY}, need_compare=False,
+            is_add_acl=False)
+
 
 class TestOvnSbSyncML2(test_mech_driver.OVNMechanismDriverTestCase):
 
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Microbenchmark of the ACLs built for (port, security group rule) pairs
+
+Builds the ACL of every pair of PORTS ports and RULES rules, as add_acls and
+sync_acls do, with the cached rule matches and with rules whose match is
+rebuilt for every port.
+
+Usage: python tools/acl_match_benchmark.py [PORTS [RULES]]
+"""
+
+import sys
+import time
+import uuid
+
+from networking_ovn.common import acl as ovn_acl
+
+
+def _make_rules(count):
+    rules = []
+    for i in range(count):
+        rule = {'id': str(uuid.uuid4()),
+                'security_group_id': 'sg-id',
+                'direction': 'ingress' if i % 2 else 'egress',
+                'ethertype': 'IPv4' if i % 3 else 'IPv6',
+                'remote_ip_prefix': None,
+                'remote_group_id': None,
+                'protocol': 'tcp',
+                'port_range_min': 1000 + i,
+                'port_range_max': 2000 + i}
+        if i % 3:
+            rule['remote_ip_prefix'] = '10.%d.0.0/16' % (i % 256)
+        else:
+            rule['remote_group_id'] = 'remote-sg-id'
+        rules.append(rule)
+    return rules
+
+
+def _build_acls(ports, rules):
+    start = time.time()
+    for port in ports:
+        for rule in rules:
+            ovn_acl._add_sg_rule_acl_for_port(port, rule)
+    return time.time() - start
+
+
+def main(argv):
+    port_count = int(argv[1]) if len(argv) > 1 else 1000
+    rule_count = int(argv[2]) if len(argv) > 2 else 100
+    ports = [{'id': str(uuid.uuid4()), 'network_id': 'network-id'}
+             for i in range(port_count)]
+    rules = _make_rules(rule_count)
+    # Rules without an id are not cached, their match is rebuilt each time.
+    uncached_rules = [dict(rule, id=None) for rule in rules]
+
+    pairs = port_count * rule_count
+    uncached = _build_acls(ports, uncached_rules)
+    cached = _build_acls(ports, rules)
+    print('%d (port, rule) pairs' % pairs)
+    print('uncached: %.3fs, %.2fus per pair' % (uncached,
+                                                uncached * 1e6 / pairs))
+    print('cached:   %.3fs, %.2fus per pair' % (cached, cached * 1e6 / pairs))
+    print('speedup:  %.2fx' % (uncached / cached))
+
+
+if __name__ == '__main__':
+    main(sys.argv)